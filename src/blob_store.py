@@ -0,0 +1,62 @@
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+"""Content-addressed on-disk store for large relation payloads.
+
+Deferred events and stored state hold only the sha256 digest of a payload,
+so a multi-megabyte slurm.conf is written once rather than re-serialized
+into the ops state DB on every dispatch.
+"""
+
+import logging
+import os
+from hashlib import sha256
+from pathlib import Path
+from typing import Iterable, Set
+
+logger = logging.getLogger()
+
+
+def digest(data: str) -> str:
+    """Return the digest `data` is stored under."""
+    return sha256(data.encode()).hexdigest()
+
+
+class BlobStore:
+    """Store strings in files named after their sha256 digest."""
+
+    def __init__(self, root: Path):
+        self._root = Path(root)
+
+    def put(self, data: str) -> str:
+        """Store `data` unless already present and return its digest."""
+        key = digest(data)
+        path = self._root / key
+        if not path.exists():
+            self._root.mkdir(mode=0o700, parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(data)
+            os.replace(tmp, path)
+        return key
+
+    def get(self, key: str) -> str:
+        """Return the payload stored under `key`.
+
+        Raises:
+            FileNotFoundError: if no payload is stored under `key`.
+        """
+        return (self._root / key).read_text()
+
+    def digests(self) -> Set[str]:
+        """Return the digests of all stored payloads."""
+        if not self._root.is_dir():
+            return set()
+        return {p.name for p in self._root.iterdir() if not p.suffix}
+
+    def gc(self, referenced: Iterable[str]) -> int:
+        """Remove payloads not in `referenced` and return how many were removed."""
+        unreferenced = self.digests() - set(referenced)
+        for key in unreferenced:
+            (self._root / key).unlink(missing_ok=True)
+        if unreferenced:
+            logger.debug(f"Removed {len(unreferenced)} unreferenced blob(s) from {self._root}")
+        return len(unreferenced)
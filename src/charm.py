@@ -5,19 +5,53 @@
 """SlurmrestdCharm."""
 
 import logging
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple
 
-from interface_slurmctld import Slurmctld, SlurmctldAvailableEvent, SlurmctldUnavailableEvent
+from constants import (
+    INSTALL_RETRY_DELAY,
+    INSTALL_RETRY_MAX_DELAY,
+    PACKAGE_CACHE_PORT,
+    PACKAGE_CACHE_TARBALL,
+    PACKAGE_CACHE_WAIT,
+    RESERVED_PORTS,
+    RESOURCE_CONTROL_OPTIONS,
+    SLURM_DEBS_RESOURCE,
+    SLURMRESTD_READY_TIMEOUT,
+    TUNING_PROFILES,
+)
+from hook_profiler import HookProfiler, traced
+from interface_prometheus_scrape import MetricsEndpoint
+from interface_slurmrestd_peer import PackageCache, RestartGrantedEvent, RestartLock
+from interface_slurmctld import (
+    ConfServerChangedEvent,
+    MungeKeyChangedEvent,
+    SlurmConfChangedEvent,
+    SlurmConfIncludeChangedEvent,
+    Slurmctld,
+    SlurmctldAvailableEvent,
+    SlurmctldUnavailableEvent,
+    blob_store,
+)
 from ops import (
+    ActionEvent,
     ActiveStatus,
     BlockedStatus,
     CharmBase,
+    ConfigChangedEvent,
+    EventBase,
     InstallEvent,
+    ModelError,
     StoredState,
     UpdateStatusEvent,
     WaitingStatus,
     main,
 )
-from slurmrestd_ops import SlurmrestdManager
+from slurmrestd_ops import SlurmrestdManager, SlurmrestdManagerError, slurm_conf_model
+
+if TYPE_CHECKING:
+    from slurm_conf import Action
 
 logger = logging.getLogger()
 
@@ -31,67 +65,695 @@ class SlurmrestdCharm(CharmBase):
         """Initialize charm and configure states and events to observe."""
         super().__init__(*args)
 
-        self._stored.set_default(slurm_installed=False)
+        self._stored.set_default(
+            slurm_installed=False,
+            install_steps=[],
+            install_failures=0,
+            install_retry_at=0.0,
+            install_offline=False,
+            package_cache_wait_until=0.0,
+            applied_munge_key="",
+            applied_slurm_conf="",
+            applied_includes={},
+            applied_conf_server="",
+            configless=False,
+            config_error="",
+            awaiting_ready=False,
+            service_error="",
+            numa_preference="",
+            numa_placement={},
+            pending_restarts=[],
+            pending_munge_key="",
+            pending_slurm_conf="",
+            pending_includes={},
+            pending_conf_server="",
+        )
 
-        self._slurmctld = Slurmctld(self, "slurmctld")
+        self._slurmctld = Slurmctld(
+            self,
+            "slurmctld",
+            retain=self._pending_config,
+            configless=bool(self.config.get("configless")),
+        )
         self._slurmrestd_manager = SlurmrestdManager()
+        self._package_cache = PackageCache(self, "slurmrestd-peers")
+        self._restart_lock = RestartLock(
+            self, "slurmrestd-peers", batch_size=int(self.config["restart-batch-size"])
+        )
+        self._hook_profiler = HookProfiler(
+            self, trace_file=str(self.config.get("hook-trace-file", "")) or None
+        )
+        self._metrics_endpoint = MetricsEndpoint(
+            self, "metrics-endpoint", port=int(self.config["metrics-port"])
+        )
 
         event_handler_bindings = {
             self.on.install: self._on_install,
+            self.on.config_changed: self._on_config_changed,
             self.on.update_status: self._on_update_status,
+            self.on.leader_elected: self._on_share_package_cache,
+            self.on["slurmrestd-peers"].relation_created: self._on_share_package_cache,
+            self._slurmctld.on.munge_key_changed: self._on_munge_key_changed,
+            self._slurmctld.on.slurm_conf_changed: self._on_slurm_conf_changed,
+            self._slurmctld.on.slurm_conf_include_changed: self._on_slurm_conf_include_changed,
+            self._slurmctld.on.conf_server_changed: self._on_conf_server_changed,
             self._slurmctld.on.slurmctld_available: self._on_slurmctld_available,
             self._slurmctld.on.slurmctld_unavailable: self._on_slurmctld_unavailable,
+            self._restart_lock.on.restart_granted: self._on_restart_granted,
+            self.on.benchmark_action: self._on_benchmark_action,
+            self.on.upgrade_action: self._on_upgrade_action,
+            self.on.hook_stats_action: self._on_hook_stats_action,
         }
         for event, handler in event_handler_bindings.items():
             self.framework.observe(event, handler)
 
+    @traced
     def _on_install(self, event: InstallEvent) -> None:
         """Perform installation operations for slurmrestd."""
+        if time.time() < self._stored.install_retry_at:
+            logger.debug("Backing off before retrying install.")
+            event.defer()
+            return
+
+        debs = None if "local-packages" in self._stored.install_steps else self._slurm_debs()
+        if debs is None and self._await_package_cache():
+            # Installing again once the leader publishes its cache, or at the next hook.
+            logger.debug("Waiting for the leader to share its packages before installing.")
+            self.unit.status = WaitingStatus("Waiting for the leader's package cache")
+            event.defer()
+            return
+
         self.unit.status = WaitingStatus("Installing slurmrestd")
 
-        if self._slurmrestd_manager.install():
+        installed = self._slurmrestd_manager.install(
+            completed=self._stored.install_steps,
+            on_step=self._stored.install_steps.append,
+            debs=debs,
+            offline=self._stored.install_offline,
+        )
+        # A retry must not set up the PPA for packages already installed from .debs.
+        self._stored.install_offline = self._slurmrestd_manager.offline
+        if installed:
             self.unit.set_workload_version(self._slurmrestd_manager.version())
             self._stored.slurm_installed = True
+            self._stored.install_failures = 0
+            self._stored.install_retry_at = 0.0
+            self._share_package_cache()
+            self._configure_exporter()
+            self._configure_service()
+            self._reconcile_config()
         else:
+            # Resume from the failed step, waiting longer after each failure.
+            self._stored.install_failures += 1
+            delay = min(
+                INSTALL_RETRY_DELAY * 2 ** (self._stored.install_failures - 1),
+                INSTALL_RETRY_MAX_DELAY,
+            )
+            self._stored.install_retry_at = time.time() + delay
+            logger.warning(f"Install failed, retrying in {delay}s or later.")
             event.defer()
 
         self._check_status()
 
+    def _slurm_debs(self) -> Optional[Path]:
+        """Return the attached .deb tarball, else the leader's package cache.
+
+        None means installing from the PPA.
+        """
+        try:
+            path = self.model.resources.fetch(SLURM_DEBS_RESOURCE)
+        except ModelError:
+            path = None
+        # An empty file stands in for the resource when none was attached.
+        if path is not None and path.stat().st_size > 0:
+            return path
+
+        if self.unit.is_leader() or (source := self._package_cache.source()) is None:
+            return None
+        return self._slurmrestd_manager.fetch_package_cache(*source)
+
+    def _await_package_cache(self) -> bool:
+        """Return True if this unit should wait for the leader's package cache to install.
+
+        Units other than the leader wait up to `PACKAGE_CACHE_WAIT` seconds
+        from their first install attempt, unless the packages are installed
+        already. The peer relation usually only exists after the install hook.
+        """
+        if self.unit.is_leader() or "slurmrestd-package" in self._stored.install_steps:
+            return False
+        if not self._stored.package_cache_wait_until:
+            wait = 0 if self._slurmrestd_manager.is_installed() else PACKAGE_CACHE_WAIT
+            self._stored.package_cache_wait_until = time.time() + wait
+        return time.time() < self._stored.package_cache_wait_until
+
+    @traced
+    def _on_share_package_cache(self, event: EventBase) -> None:
+        """Share the packages installed here with peers once this unit leads."""
+        if self._stored.slurm_installed is True:
+            self._share_package_cache()
+
+    def _share_package_cache(self) -> None:
+        """Serve the downloaded packages to peers and publish where, if leader."""
+        if not self.unit.is_leader() or (address := self._package_cache.address()) is None:
+            return
+        if (checksum := self._slurmrestd_manager.build_package_cache()) is None:
+            return
+        self._slurmrestd_manager.serve_package_cache(address, PACKAGE_CACHE_PORT)
+        self._package_cache.publish(PACKAGE_CACHE_PORT, PACKAGE_CACHE_TARBALL, checksum)
+
+    @traced
+    def _on_config_changed(self, event: ConfigChangedEvent) -> None:
+        """Apply charm configuration to the exporter and scrape jobs."""
+        if self._stored.slurm_installed is True:
+            self._configure_exporter()
+            self._configure_service()
+
+        configless = bool(self.config.get("configless"))
+        if configless != self._stored.configless:
+            # Pick up the config for the new mode from the current relation data.
+            self._stored.configless = configless
+            self._slurmctld.configless = configless
+            self._slurmctld.refresh()
+
+    @traced
     def _on_update_status(self, event: UpdateStatusEvent) -> None:
         """Handle update status."""
+        if self._stored.awaiting_ready:
+            self._release_restart_lock(wait=False)
         self._check_status()
 
+    # Latest wins: a newer munge key or slurm.conf replaces one still waiting
+    # for install, so only the newest is ever applied.
+    @traced
+    def _on_munge_key_changed(self, event: MungeKeyChangedEvent) -> None:
+        """Queue the new munge key from slurmctld."""
+        if event.munge_key is not None:
+            self._stored.pending_munge_key = blob_store(self.framework).put(event.munge_key)
+
+    @traced
+    def _on_slurm_conf_changed(self, event: SlurmConfChangedEvent) -> None:
+        """Queue the new slurm.conf from slurmctld."""
+        if event.slurm_conf is not None:
+            self._stored.pending_slurm_conf = blob_store(self.framework).put(event.slurm_conf)
+
+    @traced
+    def _on_slurm_conf_include_changed(self, event: SlurmConfIncludeChangedEvent) -> None:
+        """Queue the new slurm.conf include from slurmctld."""
+        if event.name and event.content is not None:
+            digest = blob_store(self.framework).put(event.content)
+            self._stored.pending_includes[event.name] = digest
+
+    @traced
+    def _on_conf_server_changed(self, event: ConfServerChangedEvent) -> None:
+        """Queue the new slurmctld address to fetch config from in configless mode."""
+        if event.conf_server:
+            self._stored.pending_conf_server = event.conf_server
+
+    @traced
     def _on_slurmctld_available(self, event: SlurmctldAvailableEvent) -> None:
-        """Render config and restart the service when we have what we want from slurmctld."""
+        """Apply the queued config once slurmctld has published all of it."""
+        self._reconcile_config()
+        self._check_status()
+
+    def _pending_config(self) -> Set[str]:
+        """Return the blob digests of the config waiting to be applied."""
+        return {
+            digest
+            for digest in (
+                self._stored.pending_munge_key,
+                self._stored.pending_slurm_conf,
+                *self._stored.pending_includes.values(),
+            )
+            if digest
+        }
+
+    @traced
+    def _reconcile_config(self) -> None:
+        """Render the pending config and restart what it affects once slurmrestd is installed.
+
+        munge is only restarted for a new munge key. Otherwise a slurm.conf change
+        restarts, reloads or leaves slurmrestd alone depending on what changed,
+        see `slurm_conf.classify`, and changes confined to includes reload it.
+        Restarts wait for this unit's turn on the peer restart lock.
+        """
         if self._stored.slurm_installed is not True:
-            event.defer()
             return
+        if not (self._pending_config() or self._stored.pending_conf_server):
+            return
+
+        munge_key_digest, slurm_conf_digest, conf_server, include_digests = self._take_pending()
+        if not (munge_key_digest or slurm_conf_digest or conf_server or include_digests):
+            logger.debug("slurmctld config unchanged, not restarting slurmrestd.")
+            return
+
+        store = blob_store(self.framework)
+        try:
+            munge_key = store.get(munge_key_digest) if munge_key_digest else None
+            slurm_conf = store.get(slurm_conf_digest) if slurm_conf_digest else None
+            includes = {name: store.get(digest) for name, digest in include_digests.items()}
+        except FileNotFoundError as e:
+            logger.error(f"Pending slurmctld config is gone, waiting for the next update: {e}")
+            return
+
+        try:
+            conf = self._slurmrestd_manager.validate_config(
+                munge_key, slurm_conf, includes, dry_run=bool(self.config.get("config-dry-run"))
+            )
+        except SlurmrestdManagerError as e:
+            # Keep serving the applied config rather than crash-looping on this one.
+            logger.error(f"Rejecting slurmctld config: {e.message}")
+            self._stored.config_error = e.message
+            # Keep it queued too, so a fix to one part is applied with the others.
+            self._requeue(munge_key_digest, slurm_conf_digest, conf_server, include_digests)
+            return
+        self._stored.config_error = ""
+
+        restart = munge_key is not None or bool(conf_server)
+        action = None
+        if conf is not None and not restart:
+            action = self._slurmrestd_manager.slurm_conf_action(conf)
+            restart = action is slurm_conf_model.Action.RESTART
+        if restart and not self._restart_lock.acquire():
+            # Keep the config queued until the leader lets this unit restart.
+            logger.info("Waiting for peers to restart before applying slurmctld config.")
+            self._requeue(munge_key_digest, slurm_conf_digest, conf_server, include_digests)
+            return
+
+        if munge_key is None and not conf_server:
+            # The munge key is unchanged, so slurmrestd may get by with a reload.
+            self._reload_config(slurm_conf, slurm_conf_digest, action, includes, include_digests)
+        else:
+            self._restart_with_config(
+                munge_key, munge_key_digest, slurm_conf, slurm_conf_digest, conf_server
+            )
+            self._write_includes(includes, include_digests)
+            self._slurmrestd_manager.start_slurmrestd()
+        if restart:
+            self._release_restart_lock()
 
-        if (event.munge_key is not None) and (event.slurm_conf is not None):
-            self._slurmrestd_manager.stop_slurmrestd()
+    def _restart_with_config(
+        self,
+        munge_key: Optional[str],
+        munge_key_digest: str,
+        slurm_conf: Optional[str],
+        slurm_conf_digest: str,
+        conf_server: str,
+    ) -> None:
+        """Stop slurmrestd and write a new munge key, conf server or slurm.conf."""
+        self._slurmrestd_manager.stop_slurmrestd()
+        if munge_key is not None:
             self._slurmrestd_manager.stop_munge()
-            self._slurmrestd_manager.write_munge_key(event.munge_key)
-            self._slurmrestd_manager.write_slurm_conf(event.slurm_conf)
+            self._slurmrestd_manager.write_munge_key(munge_key)
             self._slurmrestd_manager.start_munge()
-            self._slurmrestd_manager.start_slurmrestd()
+            self._stored.applied_munge_key = munge_key_digest
+        if conf_server:
+            self._slurmrestd_manager.set_conf_server(conf_server)
+            self._stored.applied_conf_server = conf_server
+            self._stored.applied_slurm_conf = ""
+            self._stored.applied_includes = {}
+        if slurm_conf is not None:
+            self._write_slurm_conf(slurm_conf, slurm_conf_digest)
+
+    def _release_restart_lock(self, wait: bool = True) -> None:
+        """Hand the restart lock on once slurmrestd answers requests again.
+
+        Without `wait`, slurmrestd is probed once instead of waited for.
+        """
+        if not self._restart_lock.held:
+            return
+        if wait:
+            ready = self._slurmrestd_manager.wait_slurmrestd_ready(SLURMRESTD_READY_TIMEOUT)
+        else:
+            ready = self._slurmrestd_manager.slurmrestd_responds()
+        if not ready:
+            # Hold on to the lock so peers keep serving while this unit is down.
+            logger.warning("slurmrestd not ready after restart, holding the restart lock.")
+            self._stored.awaiting_ready = True
+            return
+        self._stored.awaiting_ready = False
+        self._restart_lock.release()
+
+    @traced
+    def _on_restart_granted(self, event: RestartGrantedEvent) -> None:
+        """Apply the config held back until it was this unit's turn to restart."""
+        self._reconcile_config()
+        self._restart_for_service()
+        if self._restart_lock.held and not self._stored.awaiting_ready:
+            # What was queued no longer needed a restart.
+            self._restart_lock.release()
         self._check_status()
 
+    def _reload_config(
+        self,
+        slurm_conf: Optional[str],
+        slurm_conf_digest: str,
+        action: Optional["Action"],
+        includes: Dict[str, str],
+        include_digests: Dict[str, str],
+    ) -> None:
+        """Apply slurm.conf and include changes with as little disruption as they allow.
+
+        `action` is what the new `slurm_conf` requires, see `slurm_conf_action`.
+        """
+        self._write_includes(includes, include_digests)
+        reloaded = False
+        if slurm_conf is not None:
+            reloaded = self._write_slurm_conf(slurm_conf, slurm_conf_digest, action)
+        if includes and not reloaded:
+            self._slurmrestd_manager.reload_slurmrestd()
+
+    def _take_pending(self) -> Tuple[str, str, str, Dict[str, str]]:
+        """Empty the pending slot, returning what differs from the applied config.
+
+        slurm.conf and includes are dropped in configless mode, the conf server
+        outside of it.
+        """
+        configless = bool(self.config.get("configless"))
+        munge_key_digest = self._stored.pending_munge_key
+        slurm_conf_digest = "" if configless else self._stored.pending_slurm_conf
+        conf_server = self._stored.pending_conf_server if configless else ""
+        include_digests = {
+            name: digest
+            for name, digest in self._stored.pending_includes.items()
+            if not configless and digest != self._stored.applied_includes.get(name)
+        }
+        self._stored.pending_munge_key = ""
+        self._stored.pending_slurm_conf = ""
+        self._stored.pending_includes = {}
+        self._stored.pending_conf_server = ""
+        return (
+            "" if munge_key_digest == self._stored.applied_munge_key else munge_key_digest,
+            "" if slurm_conf_digest == self._stored.applied_slurm_conf else slurm_conf_digest,
+            "" if conf_server == self._stored.applied_conf_server else conf_server,
+            include_digests,
+        )
+
+    def _requeue(
+        self,
+        munge_key_digest: str,
+        slurm_conf_digest: str,
+        conf_server: str,
+        include_digests: Dict[str, str],
+    ) -> None:
+        """Put config taken by `_take_pending` back, under anything queued since."""
+        self._stored.pending_munge_key = self._stored.pending_munge_key or munge_key_digest
+        self._stored.pending_slurm_conf = self._stored.pending_slurm_conf or slurm_conf_digest
+        self._stored.pending_conf_server = self._stored.pending_conf_server or conf_server
+        self._stored.pending_includes = {**include_digests, **self._stored.pending_includes}
+
+    def _write_slurm_conf(
+        self, slurm_conf: str, digest: str, action: Optional["Action"] = None
+    ) -> bool:
+        """Write slurm.conf, leaving configless mode if needed.
+
+        With an `action`, slurmrestd is restarted or reloaded as it requires.
+        Return True if it was.
+        """
+        reloaded = False
+        if self._stored.applied_conf_server:
+            self._slurmrestd_manager.set_conf_server(None)
+            self._stored.applied_conf_server = ""
+        if action is not None:
+            reloaded = self._slurmrestd_manager.update_slurm_conf(slurm_conf, action)
+        else:
+            self._slurmrestd_manager.write_slurm_conf(slurm_conf)
+        self._stored.applied_slurm_conf = digest
+        return reloaded
+
+    def _write_includes(self, includes: Dict[str, str], digests: Dict[str, str]) -> None:
+        """Write slurm.conf includes and record their digests as applied.
+
+        Removed includes are emptied and no longer tracked as applied.
+        """
+        for name, content in includes.items():
+            self._slurmrestd_manager.write_slurm_conf_include(name, content)
+            if content:
+                self._stored.applied_includes[name] = digests[name]
+            else:
+                self._stored.applied_includes.pop(name, None)
+
+    @traced
     def _on_slurmctld_unavailable(self, event: SlurmctldUnavailableEvent) -> None:
         """Stop the slurmrestd daemon if slurmctld is unavailable."""
+        self._stored.applied_munge_key = ""
+        self._stored.applied_slurm_conf = ""
+        self._stored.applied_includes = {}
+        self._stored.applied_conf_server = ""
+        self._stored.config_error = ""
+        self._stored.awaiting_ready = False
+        self._stored.pending_restarts = []
+        self._stored.pending_munge_key = ""
+        self._stored.pending_slurm_conf = ""
+        self._stored.pending_includes = {}
+        self._stored.pending_conf_server = ""
+        self._restart_lock.release()
         self._slurmrestd_manager.stop_slurmrestd()
         self._slurmrestd_manager.stop_munge()
         self._check_status()
 
+    @traced
+    def _on_benchmark_action(self, event: ActionEvent) -> None:
+        """Load test slurmrestd at fixed concurrency or over a ramp of steps."""
+        # Action-only modules are imported by their handler, off the dispatch path.
+        from slurmrestd_benchmark import parse_ramp
+        from slurmrestd_benchmark import run as run_benchmark
+
+        params = event.params
+        try:
+            ramp = parse_ramp(params.get("ramp") or str(params["concurrency"]))
+        except ValueError as e:
+            event.fail(str(e))
+            return
+
+        headers = {}
+        if user := params.get("user"):
+            headers["X-SLURM-USER-NAME"] = user
+        if token := params.get("token"):
+            headers["X-SLURM-USER-TOKEN"] = token
+
+        event.log(f"Benchmarking {params['url']}{params['path']} at concurrency {ramp}")
+        result = run_benchmark(params["url"], params["path"], ramp, params["duration"], headers)
+        event.set_results(
+            {
+                "steps": {
+                    f"concurrency-{step['concurrency']}": {
+                        "rps": f"{step['rps']:.1f}",
+                        "p50-ms": f"{step['p50_ms']:.2f}",
+                        "p95-ms": f"{step['p95_ms']:.2f}",
+                        "p99-ms": f"{step['p99_ms']:.2f}",
+                        "error-rate": f"{step['error_rate']:.4f}",
+                    }
+                    for step in result["steps"]
+                },
+                "knee": str(result["knee"] or "not reached"),
+            }
+        )
+
+    @traced
+    def _on_upgrade_action(self, event: ActionEvent) -> None:
+        """Upgrade slurmrestd packages, switching over to the new slurmrestd without downtime."""
+        from slurmrestd_upgrade import UpgradeError, blue_green_upgrade
+
+        if self._stored.slurm_installed is not True:
+            event.fail("slurmrestd is not installed")
+            return
+
+        try:
+            result = blue_green_upgrade(
+                self._slurmrestd_manager, float(event.params["ready-timeout"]), event.log
+            )
+        except UpgradeError as e:
+            event.fail(str(e))
+            return
+        except SlurmrestdManagerError as e:
+            event.fail(f"Upgrade failed: {e.message}")
+            return
+        finally:
+            self.unit.set_workload_version(self._slurmrestd_manager.version())
+
+        event.set_results(
+            {
+                "old-version": result["old_version"],
+                "new-version": result["new_version"],
+                "cutover-gap-ms": f"{result['cutover_gap_ms']:.1f}",
+                "probe-failures": str(result["probe_failures"]),
+                "alt-ready-s": f"{result['alt_ready_s']:.2f}",
+                "main-ready-s": f"{result['main_ready_s']:.2f}",
+            }
+        )
+
+    def _on_hook_stats_action(self, event: ActionEvent) -> None:
+        """Report timing, fork and write statistics for recently run hooks."""
+        stats = self._hook_profiler.stats()
+        if event.params.get("reset"):
+            self._hook_profiler.reset()
+
+        def key(name: str) -> str:
+            return "".join(c if c.isalnum() else "-" for c in name.lower()).strip("-")
+
+        event.set_results(
+            {
+                key(kind): {
+                    **{key(k): f"{v:.2f}" for k, v in hook.items() if k != "operations_ms"},
+                    "operations-ms": {
+                        key(op): f"{ms:.2f}" for op, ms in hook["operations_ms"].items()
+                    },
+                }
+                for kind, hook in stats.items()
+            }
+        )
+
+    def _configure_exporter(self) -> None:
+        """Render the metrics exporter unit, restarting the exporter if it changed.
+
+        Restarting resets the exporter's histograms, so an unchanged unit is left running.
+        """
+        port = int(self.config["metrics-port"])
+        exporter = Path(self.charm_dir) / "src" / "slurmrestd_exporter.py"
+        if self._slurmrestd_manager.write_exporter_service(exporter, port):
+            self._slurmrestd_manager.restart_exporter()
+        self._metrics_endpoint.update_scrape_job(port)
+
+    def _configure_service(self) -> None:
+        """Apply the resource controls, NUMA placement and tuning in charm config.
+
+        munged and slurmrestd are bound to the same NUMA node. An explicit
+        `cpu-affinity` narrows down where slurmrestd runs within it, and
+        explicit resource controls override those of the tuning profile.
+        """
+        settings = {
+            setting: str(self.config[option])
+            for option, setting in RESOURCE_CONTROL_OPTIONS.items()
+            if self.config.get(option) not in (None, "", 0)
+        }
+        try:
+            tuning = self._tuning_profile()
+            placement = self._numa_placement()
+            if placement and "CPUAffinity" in settings:
+                settings["CPUAffinity"] = self._slurmrestd_manager.cpus_within(
+                    placement, settings["CPUAffinity"]
+                )
+            restarts = [
+                service
+                for service, service_settings in (
+                    ("slurmrestd", {**placement, **tuning.get("service", {}), **settings}),
+                    ("munge", placement),
+                )
+                if self._slurmrestd_manager.write_service_dropin(service, service_settings)
+            ]
+        except SlurmrestdManagerError as e:
+            logger.error(f"Not applying unit settings: {e.message}")
+            self._stored.service_error = e.message
+            return
+        self._stored.service_error = ""
+        self._slurmrestd_manager.write_sysctl(self._sysctl(tuning))
+
+        # The daemons only run once there is a munge key, and pick the settings up then.
+        if self._stored.applied_munge_key:
+            for service in restarts:
+                if service not in self._stored.pending_restarts:
+                    self._stored.pending_restarts.append(service)
+        self._restart_for_service()
+
+    def _numa_placement(self) -> Dict[str, str]:
+        """Return the NUMA placement for the `numa-node` config, empty if unset.
+
+        The node is only chosen again when `numa-node` changes, so "auto" does
+        not move the daemons as free memory shifts between nodes.
+
+        Raises:
+            SlurmrestdManagerError: if `numa-node` names no usable node.
+        """
+        preference = str(self.config.get("numa-node", ""))
+        if preference != self._stored.numa_preference:
+            placement = self._slurmrestd_manager.numa_placement(preference) if preference else {}
+            self._stored.numa_placement = placement
+            self._stored.numa_preference = preference
+        return dict(self._stored.numa_placement)
+
+    def _tuning_profile(self) -> Dict[str, Dict[str, str]]:
+        """Return the tuning profile selected in charm config, empty if none.
+
+        Raises:
+            SlurmrestdManagerError: if there is no such profile.
+        """
+        if not (profile := str(self.config.get("tuning-profile", ""))):
+            return {}
+        if profile not in TUNING_PROFILES:
+            raise SlurmrestdManagerError(f"unknown tuning profile '{profile}'")
+        return TUNING_PROFILES[profile]
+
+    def _sysctl(self, tuning: Dict[str, Dict[str, str]]) -> Dict[str, str]:
+        """Return the kernel parameters of `tuning`.
+
+        If it sets the ephemeral port range, the ports the charm listens on are
+        reserved from it, written as the kernel reports them back.
+        """
+        sysctl = dict(tuning.get("sysctl", {}))
+        if "net.ipv4.ip_local_port_range" in sysctl:
+            ranges = []
+            for port in sorted({*RESERVED_PORTS, int(self.config["metrics-port"])}):
+                if ranges and port == ranges[-1][1] + 1:
+                    ranges[-1][1] = port
+                else:
+                    ranges.append([port, port])
+            sysctl["net.ipv4.ip_local_reserved_ports"] = ",".join(
+                str(a) if a == b else f"{a}-{b}" for a, b in ranges
+            )
+        return sysctl
+
+    def _restart_for_service(self) -> None:
+        """Restart daemons for new unit settings once it is this unit's turn."""
+        if not self._stored.pending_restarts or not self._restart_lock.acquire():
+            return
+        if "munge" in self._stored.pending_restarts:
+            self._slurmrestd_manager.restart_munge()
+        if "slurmrestd" in self._stored.pending_restarts:
+            self._slurmrestd_manager.restart_slurmrestd()
+        self._stored.pending_restarts = []
+        self._release_restart_lock()
+
     def _check_status(self) -> bool:
         """Check the status of our integrated applications."""
         if self._stored.slurm_installed is not True:
-            self.unit.status = BlockedStatus("Error installing slurmrestd")
+            if time.time() < self._stored.package_cache_wait_until:
+                self.unit.status = WaitingStatus("Waiting for the leader's package cache")
+            else:
+                self.unit.status = BlockedStatus("Error installing slurmrestd")
             return False
 
         if not self._slurmctld.is_joined:
             self.unit.status = BlockedStatus("Need relations: slurmctld")
             return False
 
+        if self._stored.config_error:
+            self.unit.status = BlockedStatus(
+                f"Invalid slurmctld config: {self._stored.config_error}"
+            )
+            return False
+
+        if self._stored.service_error:
+            self.unit.status = BlockedStatus(
+                f"Invalid unit settings: {self._stored.service_error}"
+            )
+            return False
+
+        if self._stored.awaiting_ready:
+            self.unit.status = WaitingStatus("Waiting for slurmrestd to answer after restart")
+            return False
+
+        if self._restart_lock.requested and not self._restart_lock.held:
+            self.unit.status = WaitingStatus("Waiting for peers to restart slurmrestd")
+            return False
+
+        profile = TUNING_PROFILES.get(str(self.config.get("tuning-profile", "")), {})
+        if drift := self._slurmrestd_manager.sysctl_drift(self._sysctl(profile)):
+            # slurmrestd serves, but the host is not tuned as configured.
+            self.unit.status = ActiveStatus(
+                "sysctl drift: " + ", ".join(f"{k}={v}" for k, v in sorted(drift.items()))
+            )
+            return True
+
         self.unit.status = ActiveStatus()
         return True
 
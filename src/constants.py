@@ -1,25 +1,115 @@
 # Copyright 2024 Omnivector, LLC.
 # See LICENSE file for licensing details.
 """constants for slurmrestd-operator."""
+
 from pathlib import Path
 
 SLURMRESTD_GROUP_GID = 64031
 SLURMRESTD_USER_UID = 64031
 SLURMRESTD_USER_NAME = "slurmrestd"
 SLURMRESTD_GROUP_NAME = "slurmrestd"
+PASSWD_PATH = Path("/etc/passwd")
+GROUP_PATH = Path("/etc/group")
+
+# Slurm release series installed from the ubuntu-hpc PPA.
+SLURM_SERIES = "23.02"
 
 MUNGE_KEY_PATH = Path("/etc/munge/munge.key")
+# munged refuses keys outside these bounds, in bytes after base64 decoding.
+MUNGE_KEY_MIN_BYTES = 32
+MUNGE_KEY_MAX_BYTES = 1024
+SLURM_CONF_DIR = Path("/etc/slurm")
+SLURM_CONF_PATH = SLURM_CONF_DIR / "slurm.conf"
+SLURMRESTD_CONFIGLESS_ENV_PATH = Path("/etc/default/slurmrestd-configless")
+SLURMCTLD_PORT = 6817
+# Seconds to wait for `slurmrestd` to load a candidate config in a dry run.
+SLURMRESTD_DRY_RUN_TIMEOUT = 20
+SLURMRESTD_PORT = 6820
+# Seconds a restarted slurmrestd has to answer before peers may restart theirs.
+SLURMRESTD_READY_TIMEOUT = 60
+# Blue/green upgrades briefly run the upgraded slurmrestd on this port, with
+# new connections redirected to it from the nftables table below. Probes
+# of the main instance carry the mark to bypass the redirect.
+SLURMRESTD_ALT_PORT = 6821
+SLURMRESTD_REDIRECT_TABLE = "slurmrestd-upgrade"
+SLURMRESTD_PROBE_MARK = 0x6820
+# Denies package maintainer scripts restarting slurmrestd during an upgrade.
+POLICY_RC_D_PATH = Path("/usr/sbin/policy-rc.d")
+SYSTEMD_SYSTEM_DIR = Path("/usr/lib/systemd/system")
+# Drop-ins with the resource controls and NUMA placement set in charm config
+# are written as <service>.service.d/<name> here, see systemd_dropin.
+SYSTEMD_DROPIN_DIR = Path("/etc/systemd/system")
+CHARM_DROPIN_NAME = "50-charm.conf"
+NUMA_NODE_DIR = Path("/sys/devices/system/node")
+SYSCTL_CONF_PATH = Path("/etc/sysctl.d/60-slurmrestd.conf")
+PROC_SYS_DIR = Path("/proc/sys")
+# Opt-in host tuning: kernel parameters and slurmrestd.service settings per
+# profile. slurmrestd has no listen backlog option, the kernel caps the one it
+# passes to listen() at somaxconn, so raising that raises its accept queue.
+TUNING_PROFILES = {
+    "high-concurrency": {
+        "sysctl": {
+            "net.core.somaxconn": "65535",
+            "net.ipv4.tcp_max_syn_backlog": "65535",
+            "net.ipv4.ip_local_port_range": "1024 65535",
+        },
+        "service": {"LimitNOFILE": "1048576"},
+    },
+}
+# Charm config options mapped to the slurmrestd.service setting they control.
+RESOURCE_CONTROL_OPTIONS = {
+    "cpu-affinity": "CPUAffinity",
+    "cpu-weight": "CPUWeight",
+    "memory-high": "MemoryHigh",
+    "memory-max": "MemoryMax",
+    "limit-nofile": "LimitNOFILE",
+    "tasks-max": "TasksMax",
+    "nice": "Nice",
+}
+KEYRINGS_DIR = Path("/usr/share/keyrings")
+
+# Optional resource with .deb packages to install from instead of the PPA.
+SLURM_DEBS_RESOURCE = "slurm-debs"
+SLURM_DEBS_CHECKSUMS = "SHA256SUMS"
+
+# The installed slurm packages and dependencies, taken from apt's archive cache
+# or else downloaded again by the leader, and shared with peers from the cache
+# dir. Dependencies of these priorities ship with every Ubuntu image, so are
+# left out.
+APT_ARCHIVES_DIR = Path("/var/cache/apt/archives")
+PACKAGE_CACHE_DOWNLOAD_DIR = Path("/var/cache/slurmrestd-package-cache")
+PACKAGE_CACHE_BASE_PRIORITIES = ("required", "important", "standard")
+PACKAGE_CACHE_DIR = Path("/var/lib/slurmrestd-package-cache")
+PACKAGE_CACHE_TARBALL = "slurm-debs.tar.gz"
+PACKAGE_CACHE_PORT = 9821
+# Seconds units other than the leader wait for it to publish the package cache
+# before installing from the PPA.
+PACKAGE_CACHE_WAIT = 600
+# Ports the charm uses besides `metrics-port`, reserved when a tuning profile
+# widens the ephemeral port range so outgoing connections cannot take them.
+RESERVED_PORTS = (SLURMCTLD_PORT, SLURMRESTD_PORT, SLURMRESTD_ALT_PORT, PACKAGE_CACHE_PORT)
+
+# Delay before retrying a failed install, doubling with each failure up to the max.
+INSTALL_RETRY_DELAY = 30
+INSTALL_RETRY_MAX_DELAY = 1800
+
+# Relative to the charm directory, next to the ops state DB.
+SLURMCTLD_BLOB_DIR = ".slurmctld-blobs"
 
 SLURMRESTD_SERVICE = """
 [Unit]
 Description=Slurm REST daemon
 After=network.target munge.service slurmctld.service
-ConditionPathExists=/etc/slurm/slurm.conf
+# Start with a local slurm.conf, or in configless mode with the slurmctld
+# to fetch config from set in /etc/default/slurmrestd-configless.
+ConditionPathExists=|/etc/slurm/slurm.conf
+ConditionPathExists=|/etc/default/slurmrestd-configless
 Documentation=man:slurmrestd(8)
 
 [Service]
 Type=simple
 EnvironmentFile=-/etc/default/slurmrestd
+EnvironmentFile=-/etc/default/slurmrestd-configless
 Environment="SLURM_JWT=daemon"
 ExecStart=/usr/sbin/slurmrestd $SLURMRESTD_OPTIONS -vv 0.0.0.0:6820
 ExecReload=/bin/kill -HUP $MAINPID
@@ -34,6 +124,65 @@ RestartSec=30s
 WantedBy=multi-user.target
 """
 
+SLURMRESTD_INSTANCE_SERVICE = """
+[Unit]
+Description=Slurm REST daemon on port %i
+After=network.target munge.service slurmctld.service
+Documentation=man:slurmrestd(8)
+
+[Service]
+Type=simple
+EnvironmentFile=-/etc/default/slurmrestd
+EnvironmentFile=-/etc/default/slurmrestd-configless
+Environment="SLURM_JWT=daemon"
+ExecStart=/usr/sbin/slurmrestd $SLURMRESTD_OPTIONS -vv 0.0.0.0:%i
+User=slurmrestd
+Group=slurmrestd
+"""
+
+POLICY_RC_D = """#!/bin/sh
+# Written by the slurmrestd charm for the duration of a package upgrade.
+[ "$1" = slurmrestd ] && exit 101
+exit 0
+"""
+
+SLURMRESTD_EXPORTER_STATE_DIR = Path("/var/lib/slurmrestd-exporter")
+
+SLURMRESTD_EXPORTER_SERVICE = """
+[Unit]
+Description=Prometheus exporter for slurmrestd
+After=network.target
+
+[Service]
+Type=simple
+ExecStart=/usr/bin/python3 {exporter} --port {port} --unit slurmrestd --state-dir {state_dir}
+User=slurmrestd
+Group=slurmrestd
+SupplementaryGroups=systemd-journal
+StateDirectory=slurmrestd-exporter
+Restart=on-failure
+RestartSec=10s
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+PACKAGE_CACHE_SERVICE = """
+[Unit]
+Description=Package cache shared with slurmrestd peer units
+After=network.target
+
+[Service]
+Type=simple
+ExecStart=/usr/bin/python3 -m http.server --bind {address} --directory {directory} {port}
+DynamicUser=yes
+Restart=on-failure
+RestartSec=10s
+
+[Install]
+WantedBy=multi-user.target
+"""
+
 
 UBUNTU_HPC_PPA_KEY = """
 -----BEGIN PGP PUBLIC KEY BLOCK-----
@@ -0,0 +1,270 @@
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+"""Timing spans for charm hooks and SlurmrestdManager operations.
+
+Spans are opened with `span()` or the `traced` decorator and count the
+subprocesses forked and files opened for writing while they are active. The
+counts come from a `sys.addaudithook` hook, so code under measurement, the
+vendored apt/systemd libraries included, needs no changes.
+
+Finished hook spans are persisted by `HookProfiler` as a bounded history per
+event kind in `StoredState`, and can optionally be appended to a local file
+in the OTLP JSON format for offline inspection.
+"""
+
+import functools
+import json
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from ops import EventBase, Object, StoredState
+
+logger = logging.getLogger()
+
+_FORK_EVENTS = frozenset({"subprocess.Popen", "os.posix_spawn", "os.system", "os.fork"})
+_WRITE_FLAGS = os.O_WRONLY | os.O_RDWR | os.O_APPEND | os.O_CREAT | os.O_TRUNC
+
+_local = threading.local()
+_finished: List["Span"] = []
+
+
+class Span:
+    """A timed unit of work with subprocess fork and file write counters."""
+
+    def __init__(self, name: str, trace_id: str, parent: Optional["Span"] = None, **attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent = parent
+        self.attributes = attributes
+        self.children: List["Span"] = []
+        self.forks = 0
+        self.writes = 0
+        self.start_ns = time.time_ns()
+        self.end_ns = self.start_ns
+
+    @property
+    def duration_ms(self) -> float:
+        """Return the wall time of the span in milliseconds."""
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def walk(self) -> Iterator["Span"]:
+        """Yield this span and all of its descendants."""
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+def _stack() -> List[Span]:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def _audit(event: str, args: tuple) -> None:
+    stack = getattr(_local, "stack", None)
+    if not stack:
+        return
+    if event in _FORK_EVENTS:
+        for active in stack:
+            active.forks += 1
+    elif event == "open" and len(args) == 3:
+        mode, flags = args[1], args[2]
+        if (mode and any(c in mode for c in "wax+")) or (not mode and flags & _WRITE_FLAGS):
+            for active in stack:
+                active.writes += 1
+
+
+sys.addaudithook(_audit)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """Time the enclosed block as a child of the active span, if any."""
+    stack = _stack()
+    parent = stack[-1] if stack else None
+    current = Span(
+        name, parent.trace_id if parent else secrets.token_hex(16), parent, **attributes
+    )
+    if parent:
+        parent.children.append(current)
+    stack.append(current)
+    try:
+        yield current
+    finally:
+        current.end_ns = time.time_ns()
+        stack.pop()
+        if parent is None:
+            _finished.append(current)
+
+
+def current_span() -> Optional[Span]:
+    """Return the innermost active span of the calling thread, if any."""
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def continue_span(parent: Optional[Span]) -> Iterator[None]:
+    """Make `parent` and its ancestors the active spans of a worker thread.
+
+    Spans opened inside become children of `parent`, and forks and writes
+    count towards it and its ancestors as if run on the thread that opened it.
+    """
+    chain = []
+    while parent is not None:
+        chain.insert(0, parent)
+        parent = parent.parent
+    previous = _stack()
+    _local.stack = chain
+    try:
+        yield
+    finally:
+        _local.stack = previous
+
+
+def traced(func):
+    """Run `func` in a span named after it, tagged with the event kind for handlers."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        attributes = {}
+        if len(args) > 1 and isinstance(args[1], EventBase):
+            attributes["event"] = args[1].handle.kind
+        with span(func.__qualname__, **attributes):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: List[Span], service_name: str, unit: str) -> Dict[str, Any]:
+    """Render root `spans` and their descendants as an OTLP JSON export request."""
+    otlp_spans = []
+    for root in spans:
+        for s in root.walk():
+            attributes = {**s.attributes, "process.forks": s.forks, "file.writes": s.writes}
+            otlp_spans.append(
+                {
+                    "traceId": s.trace_id,
+                    "spanId": s.span_id,
+                    "parentSpanId": s.parent.span_id if s.parent else "",
+                    "name": s.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(s.start_ns),
+                    "endTimeUnixNano": str(s.end_ns),
+                    "attributes": [
+                        {"key": k, "value": _otlp_value(v)} for k, v in attributes.items()
+                    ],
+                }
+            )
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": service_name}},
+                        {"key": "juju.unit", "value": {"stringValue": unit}},
+                    ]
+                },
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": otlp_spans}],
+            }
+        ]
+    }
+
+
+class HookProfiler(Object):
+    """Persist a bounded per-hook history of finished spans."""
+
+    _stored = StoredState()
+
+    def __init__(self, charm, history: int = 20, trace_file: Optional[str] = None):
+        super().__init__(charm, "hook-profiler")
+        self._charm = charm
+        self._history = history
+        self._trace_file = Path(trace_file) if trace_file else None
+        self._stored.set_default(hooks={})
+
+        self.framework.observe(self.framework.on.pre_commit, self._on_pre_commit)
+
+    def _on_pre_commit(self, _) -> None:
+        self.flush()
+
+    def flush(self) -> None:
+        """Move spans finished during this dispatch into the stored history."""
+        if not _finished:
+            return
+        roots = list(_finished)
+        _finished.clear()
+
+        hooks = {kind: [dict(r) for r in records] for kind, records in self._stored.hooks.items()}
+        for root in roots:
+            operations: Dict[str, float] = {}
+            for child in root.walk():
+                if child is not root:
+                    operations[child.name] = operations.get(child.name, 0.0) + child.duration_ms
+            kind = root.attributes.get("event", root.name)
+            records = hooks.setdefault(kind, [])
+            records.append(
+                {
+                    "start": root.start_ns // 1_000_000_000,
+                    "duration_ms": root.duration_ms,
+                    "forks": root.forks,
+                    "writes": root.writes,
+                    "operations": json.dumps(operations),
+                }
+            )
+            del records[: -self._history]
+        self._stored.hooks = hooks
+
+        if self._trace_file:
+            try:
+                with self._trace_file.open("a") as f:
+                    f.write(
+                        json.dumps(to_otlp(roots, self._charm.app.name, self._charm.unit.name))
+                    )
+                    f.write("\n")
+            except OSError as e:
+                logger.warning(f"Could not export hook spans to {self._trace_file}: {e}")
+
+    def reset(self) -> None:
+        """Forget all recorded hook history."""
+        self._stored.hooks = {}
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Summarize the recorded history per hook type."""
+        self.flush()
+        summary = {}
+        for kind, records in self._stored.hooks.items():
+            durations = sorted(r["duration_ms"] for r in records)
+            operations: Dict[str, float] = {}
+            for record in records:
+                for name, ms in json.loads(record["operations"]).items():
+                    operations[name] = operations.get(name, 0.0) + ms / len(records)
+            summary[kind] = {
+                "count": len(records),
+                "last_ms": records[-1]["duration_ms"],
+                "mean_ms": sum(durations) / len(durations),
+                "p50_ms": durations[len(durations) // 2],
+                "max_ms": durations[-1],
+                "mean_forks": sum(r["forks"] for r in records) / len(records),
+                "mean_writes": sum(r["writes"] for r in records) / len(records),
+                "operations_ms": operations,
+            }
+        return summary
@@ -0,0 +1,61 @@
+"""Prometheus scrape interface for exposing slurmrestd metrics to COS."""
+
+import json
+import logging
+
+from ops import Object, RelationJoinedEvent
+
+logger = logging.getLogger()
+
+
+class MetricsEndpoint(Object):
+    """Provider side of the `prometheus_scrape` interface.
+
+    Publishes the same databag layout as the `prometheus_scrape` charm library:
+    a wildcard scrape job in the application databag that Prometheus (or
+    grafana-agent) expands to every unit's published address.
+    """
+
+    def __init__(self, charm, relation_name, port: int):
+        """Set the provides initial data."""
+        super().__init__(charm, relation_name)
+
+        self._charm = charm
+        self._relation_name = relation_name
+        self._port = port
+
+        self.framework.observe(
+            self._charm.on[relation_name].relation_joined, self._on_relation_joined
+        )
+
+    def _on_relation_joined(self, event: RelationJoinedEvent) -> None:
+        """Publish the scrape job on a new metrics consumer."""
+        self.update_scrape_job(self._port)
+
+    def update_scrape_job(self, port: int) -> None:
+        """Publish scrape jobs targeting `port` on every related consumer."""
+        self._port = port
+        model = self._charm.model
+        for relation in model.relations.get(self._relation_name, []):
+            unit_data = relation.data[self._charm.unit]
+            binding = model.get_binding(relation)
+            if binding and (address := binding.network.bind_address):
+                unit_data["prometheus_scrape_unit_address"] = str(address)
+            unit_data["prometheus_scrape_unit_name"] = self._charm.unit.name
+
+            if not self._charm.unit.is_leader():
+                continue
+
+            app_data = relation.data[self._charm.app]
+            app_data["scrape_metadata"] = json.dumps(
+                {
+                    "model": model.name,
+                    "model_uuid": model.uuid,
+                    "application": self._charm.app.name,
+                    "charm_name": self._charm.meta.name,
+                }
+            )
+            app_data["scrape_jobs"] = json.dumps(
+                [{"metrics_path": "/metrics", "static_configs": [{"targets": [f"*:{port}"]}]}]
+            )
+            logger.debug(f"Published scrape job for port {port} on relation {relation.id}.")
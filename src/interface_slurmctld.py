@@ -1,21 +1,106 @@
 """Slurmctld interface for slurmrestd <-> slurmctld integration."""
 
+import binascii
 import logging
+import zlib
+from base64 import b64decode, b64encode
+from pathlib import Path
+from typing import Callable, Dict, Mapping, Optional, Set, Tuple
 
+from blob_store import BlobStore, digest
+from constants import SLURMCTLD_BLOB_DIR, SLURMCTLD_PORT
 from ops import (
+    Application,
     EventBase,
     EventSource,
+    Framework,
     Object,
     ObjectEvents,
+    Relation,
     RelationBrokenEvent,
     RelationChangedEvent,
+    RelationCreatedEvent,
+    StoredState,
 )
 
 logger = logging.getLogger()
 
 
-class SlurmctldAvailableEvent(EventBase):
-    """SlurmctldAvailableEvent."""
+# Marker for a zlib compressed, base64 encoded `slurm_conf` (or include). zstd
+# would compress better but is not in the standard library. Without a marker
+# the value is plain text, as sent by slurmctld charms that predate compression.
+SLURM_CONF_ENCODING = "zlib+base64/v1"
+
+# Optional relation keys carrying slurm.conf sections that slurm.conf pulls in
+# with `Include`, mapped to the include name they are written under. Node
+# churn then only changes these keys and not the whole of `slurm_conf`.
+SLURM_CONF_INCLUDE_KEYS = {
+    "slurm_conf_nodes": "nodes",
+    "slurm_conf_partitions": "partitions",
+}
+
+
+def encode_slurm_conf(slurm_conf: str, key: str = "slurm_conf") -> Dict[str, str]:
+    """Return relation data carrying `slurm_conf` compressed under `key`."""
+    return {
+        key: b64encode(zlib.compress(slurm_conf.encode(), 9)).decode(),
+        f"{key}_encoding": SLURM_CONF_ENCODING,
+    }
+
+
+def decode_slurm_conf(data: Mapping[str, str], key: str = "slurm_conf") -> Optional[str]:
+    """Return the slurm.conf, or section, under `key` in relation `data`, plain or compressed."""
+    slurm_conf = data.get(key)
+    encoding = data.get(f"{key}_encoding")
+    if not slurm_conf or not encoding:
+        return slurm_conf
+    if encoding != SLURM_CONF_ENCODING:
+        logger.error(f"Unsupported {key} encoding '{encoding}'.")
+        return None
+    try:
+        return zlib.decompress(b64decode(slurm_conf, validate=True)).decode()
+    except (binascii.Error, zlib.error, UnicodeDecodeError) as e:
+        logger.error(f"Could not decode {encoding} {key}: {e}")
+        return None
+
+
+def blob_store(framework: Framework) -> BlobStore:
+    """Return the store holding slurmctld payloads for deferred events."""
+    return BlobStore(Path(framework.charm_dir) / SLURMCTLD_BLOB_DIR)
+
+
+class _BlobEvent(EventBase):
+    """Event whose payload fields are snapshotted as blob store digests."""
+
+    _fields: Tuple[str, ...] = ()
+
+    def snapshot(self):
+        """Snapshot the digests of the event data, the payloads go to the blob store."""
+        store = blob_store(self.framework)
+        return {f"{field}_digest": store.put(getattr(self, field)) for field in self._fields}
+
+    def restore(self, snapshot):
+        """Restore the event data from the blob store."""
+        if any(f"{field}_digest" not in snapshot for field in self._fields):
+            # Deferred by a charm revision that stored payloads inline.
+            for field in self._fields:
+                setattr(self, field, snapshot.get(field))
+            return
+
+        store = blob_store(self.framework)
+        try:
+            payloads = {field: store.get(snapshot[f"{field}_digest"]) for field in self._fields}
+        except FileNotFoundError as e:
+            logger.warning(f"Payload of deferred {self.handle.kind} event is gone: {e}")
+            payloads = {}
+        for field in self._fields:
+            setattr(self, field, payloads.get(field))
+
+
+class SlurmctldAvailableEvent(_BlobEvent):
+    """Emitted after the munge key or slurm.conf changed, with both present."""
+
+    _fields = ("munge_key", "slurm_conf")
 
     def __init__(self, handle, munge_key, slurm_conf):
         super().__init__(handle)
@@ -23,17 +108,68 @@ class SlurmctldAvailableEvent(EventBase):
         self.munge_key = munge_key
         self.slurm_conf = slurm_conf
 
+
+class MungeKeyChangedEvent(_BlobEvent):
+    """Emitted when slurmctld publishes a different munge key."""
+
+    _fields = ("munge_key",)
+
+    def __init__(self, handle, munge_key):
+        super().__init__(handle)
+
+        self.munge_key = munge_key
+
+
+class SlurmConfChangedEvent(_BlobEvent):
+    """Emitted when slurmctld publishes a different slurm.conf."""
+
+    _fields = ("slurm_conf",)
+
+    def __init__(self, handle, slurm_conf):
+        super().__init__(handle)
+
+        self.slurm_conf = slurm_conf
+
+
+class SlurmConfIncludeChangedEvent(_BlobEvent):
+    """Emitted when slurmctld publishes a different section included by slurm.conf.
+
+    `content` is empty when slurmctld no longer publishes the section.
+    """
+
+    _fields = ("content",)
+
+    def __init__(self, handle, name, content):
+        super().__init__(handle)
+
+        self.name = name
+        self.content = content
+
+    def snapshot(self):
+        """Snapshot the include name and the digest of its content."""
+        return {**super().snapshot(), "name": self.name}
+
+    def restore(self, snapshot):
+        """Restore the include name and its content from the blob store."""
+        super().restore(snapshot)
+        self.name = snapshot.get("name")
+
+
+class ConfServerChangedEvent(EventBase):
+    """Emitted in configless mode when the slurmctld address to fetch config from changed."""
+
+    def __init__(self, handle, conf_server):
+        super().__init__(handle)
+
+        self.conf_server = conf_server
+
     def snapshot(self):
         """Snapshot the event data."""
-        return {
-            "munge_key": self.munge_key,
-            "slurm_conf": self.slurm_conf,
-        }
+        return {"conf_server": self.conf_server}
 
     def restore(self, snapshot):
         """Restore the snapshot of the event data."""
-        self.munge_key = snapshot.get("munge_key")
-        self.slurm_conf = snapshot.get("slurm_conf")
+        self.conf_server = snapshot.get("conf_server")
 
 
 class SlurmctldUnavailableEvent(EventBase):
@@ -44,6 +180,10 @@ class Events(ObjectEvents):
     """'slurmctld' interface Events."""
 
     slurmctld_available = EventSource(SlurmctldAvailableEvent)
+    munge_key_changed = EventSource(MungeKeyChangedEvent)
+    slurm_conf_changed = EventSource(SlurmConfChangedEvent)
+    slurm_conf_include_changed = EventSource(SlurmConfIncludeChangedEvent)
+    conf_server_changed = EventSource(ConfServerChangedEvent)
     slurmctld_unavailable = EventSource(SlurmctldUnavailableEvent)
 
 
@@ -51,46 +191,185 @@ class Slurmctld(Object):
     """Slurmctld interface."""
 
     on = Events()  # pyright: ignore [reportIncompatibleMethodOverride, reportAssignmentType]
+    _stored = StoredState()
 
-    def __init__(self, charm, relation_name):
-        """Set the provides initial data."""
+    def __init__(
+        self,
+        charm,
+        relation_name,
+        retain: Optional[Callable[[], Set[str]]] = None,
+        configless: bool = False,
+    ):
+        """Set the provides initial data.
+
+        `retain` returns the blob digests the charm still references, all
+        other payloads are removed when the framework commits. In `configless` mode slurm_conf is
+        not required and the slurmctld address is tracked instead.
+        """
         super().__init__(charm, relation_name)
 
         self._charm = charm
         self._relation_name = relation_name
+        self._retain = retain
+        self.configless = configless
+        self._stored.set_default(
+            munge_key_digest="", slurm_conf_digest="", include_digests={}, conf_server=""
+        )
 
+        self.framework.observe(
+            self._charm.on[relation_name].relation_created, self._on_relation_created
+        )
         self.framework.observe(
             self._charm.on[relation_name].relation_changed, self._on_relation_changed
         )
         self.framework.observe(
             self._charm.on[relation_name].relation_broken, self._on_relation_broken
         )
+        self.framework.observe(self.framework.on.commit, self._on_commit)
 
     @property
     def is_joined(self) -> bool:
         """Return True if self._relation is not None."""
         return True if self.framework.model.relations.get(self._relation_name) else False
 
+    def _on_relation_created(self, event: RelationCreatedEvent) -> None:
+        """Tell slurmctld what this unit can consume."""
+        self._publish_capabilities(event.relation)
+
+    def _publish_capabilities(self, relation: Relation) -> None:
+        """Publish the slurm_conf encodings we decode and whether we run configless."""
+        relation.data[self.model.unit].update(
+            {
+                "slurm_conf_encodings": SLURM_CONF_ENCODING,
+                "configless": "true" if self.configless else "false",
+            }
+        )
+
+    def refresh(self) -> None:
+        """Re-emit events for the current relation data, e.g. after switching modes."""
+        self._reset()
+        for relation in self.framework.model.relations.get(self._relation_name, []):
+            self._publish_capabilities(relation)
+            if relation.app:
+                self._emit_from(relation, relation.app)
+
     def _on_relation_changed(self, event: RelationChangedEvent) -> None:
-        """Get the munge key and slurm_conf from slurmctld on relation changed."""
+        """Emit events for the munge key, slurm_conf and include values that changed."""
         if app := event.app:
-            if event_app_data := event.relation.data.get(app):
-
-                munge_key = event_app_data.get("munge_key")
-                slurm_conf = event_app_data.get("slurm_conf")
+            self._emit_from(event.relation, app)
+        else:
+            logger.debug("application not available in relation data.")
 
-                logger.debug(f"munge_key={munge_key}")
-                logger.debug(f"slurm_conf={slurm_conf}")
+    def _emit_from(self, relation: Relation, app: Application) -> None:
+        """Read slurmctld's application data and emit events for what changed."""
+        if not (event_app_data := relation.data.get(app)):
+            logger.debug("application data not available in event databag.")
+            return
 
-                if munge_key and slurm_conf:
-                    self.on.slurmctld_available.emit(munge_key, slurm_conf)
-                else:
-                    logger.debug("'munge_key' or 'slurm_conf' not in relation data.")
+        munge_key = event_app_data.get("munge_key")
+        if self.configless:
+            conf_server = self._conf_server(relation)
+            if munge_key and conf_server:
+                self._emit_changes(munge_key, "", {}, conf_server)
             else:
-                logger.debug("application data not available in event databag.")
+                logger.debug("'munge_key' or slurmctld address not in relation data.")
+            return
+
+        slurm_conf = decode_slurm_conf(event_app_data)
+        if munge_key and slurm_conf:
+            includes = {}
+            for key, name in SLURM_CONF_INCLUDE_KEYS.items():
+                if (content := decode_slurm_conf(event_app_data, key)) is not None:
+                    includes[name] = content
+            self._emit_changes(munge_key, slurm_conf, includes)
         else:
-            logger.debug("application not available in relation data.")
+            logger.debug("'munge_key' or 'slurm_conf' not in relation data.")
+
+    def _conf_server(self, relation: Relation) -> Optional[str]:
+        """Return `host:port` of slurmctld to fetch config from, if known."""
+        host = relation.data[relation.app].get("slurmctld_host") if relation.app else None
+        if not host:
+            for unit in sorted(relation.units, key=lambda u: u.name):
+                if host := relation.data[unit].get("ingress-address"):
+                    break
+        if not host:
+            return None
+        return host if ":" in host else f"{host}:{SLURMCTLD_PORT}"
+
+    def _emit_changes(
+        self,
+        munge_key: str,
+        slurm_conf: str,
+        includes: Dict[str, str],
+        conf_server: str = "",
+    ) -> None:
+        """Emit a typed event per changed value, then slurmctld_available if any changed."""
+        changed = False
+        munge_key_digest = digest(munge_key)
+        if munge_key_digest != self._stored.munge_key_digest:
+            logger.debug(f"munge_key changed: {len(munge_key)} bytes")
+            self.on.munge_key_changed.emit(munge_key)
+            self._stored.munge_key_digest = munge_key_digest
+            changed = True
+
+        slurm_conf_digest = digest(slurm_conf) if slurm_conf else ""
+        if slurm_conf and slurm_conf_digest != self._stored.slurm_conf_digest:
+            logger.debug(
+                f"slurm_conf changed: {len(slurm_conf)} bytes, sha256 {slurm_conf_digest[:12]}"
+            )
+            self.on.slurm_conf_changed.emit(slurm_conf)
+            self._stored.slurm_conf_digest = slurm_conf_digest
+            changed = True
+
+        for name, content in includes.items():
+            include_digest = digest(content)
+            if include_digest != self._stored.include_digests.get(name):
+                logger.debug(
+                    f"slurm.conf include '{name}' changed: {len(content)} bytes, "
+                    f"sha256 {include_digest[:12]}"
+                )
+                self.on.slurm_conf_include_changed.emit(name, content)
+                self._stored.include_digests[name] = include_digest
+                changed = True
+        for name in set(self._stored.include_digests) - set(includes):
+            # An empty include still satisfies an `Include` left in slurm.conf.
+            logger.debug(f"slurm.conf include '{name}' removed")
+            self.on.slurm_conf_include_changed.emit(name, "")
+            del self._stored.include_digests[name]
+            changed = True
+
+        if conf_server and conf_server != self._stored.conf_server:
+            logger.debug(f"slurmctld conf server changed: {conf_server}")
+            self.on.conf_server_changed.emit(conf_server)
+            self._stored.conf_server = conf_server
+            changed = True
+
+        if changed:
+            self.on.slurmctld_available.emit(munge_key, slurm_conf)
+        else:
+            logger.debug("munge_key, slurm_conf and includes unchanged.")
 
     def _on_relation_broken(self, event: RelationBrokenEvent) -> None:
         """Emit slurmctld_unavailable when the relation is broken."""
+        self._reset()
         self.on.slurmctld_unavailable.emit()
+
+    def _reset(self) -> None:
+        """Forget the digests of what slurmctld last published."""
+        self._stored.munge_key_digest = ""
+        self._stored.slurm_conf_digest = ""
+        self._stored.include_digests = {}
+        self._stored.conf_server = ""
+
+    def _on_commit(self, _) -> None:
+        """Remove payloads the charm no longer references.
+
+        Events are snapshotted to the blob store when emitted, but the charm
+        queues their payloads in its own state rather than deferring them, so
+        only the digests `retain` returns are live once the dispatch commits.
+        A payload a deferred event still needs is logged as gone on restore.
+        """
+        store = blob_store(self.framework)
+        if not store.digests():
+            return
+        store.gc(self._retain() if self._retain else ())
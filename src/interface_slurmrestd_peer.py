@@ -0,0 +1,166 @@
+"""Peer interface sharing packages and coordinating restarts between slurmrestd units."""
+
+import logging
+from typing import List, Optional, Tuple
+
+from ops import EventBase, EventSource, Object, ObjectEvents, Relation
+
+logger = logging.getLogger()
+
+
+class PackageCache(Object):
+    """Publish and look up the package cache served by the leader.
+
+    The leader publishes the URL of a tarball in the `slurm-debs` resource
+    format and its sha256 in the application databag. Other units wait for it
+    to show up when installing, and fetch it from there before going to the PPA.
+    """
+
+    def __init__(self, charm, relation_name):
+        """Set the peer relation the cache is published on."""
+        super().__init__(charm, relation_name)
+
+        self._charm = charm
+        self._relation_name = relation_name
+
+    def address(self) -> Optional[str]:
+        """Return the address peers reach this unit on, or None if not known yet."""
+        relation = self._charm.model.get_relation(self._relation_name)
+        if relation is None:
+            return None
+        binding = self._charm.model.get_binding(relation)
+        if not binding or not (address := binding.network.ingress_address):
+            return None
+        return str(address)
+
+    def publish(self, port: int, path: str, sha256: str) -> bool:
+        """Publish the cache served at `path` on `port` of this unit, if leader.
+
+        Return True if the cache was published.
+        """
+        relation = self._charm.model.get_relation(self._relation_name)
+        if relation is None or not self._charm.unit.is_leader():
+            return False
+        if not (address := self.address()):
+            return False
+
+        app_data = relation.data[self._charm.app]
+        app_data["package_cache_url"] = f"http://{address}:{port}/{path}"
+        app_data["package_cache_sha256"] = sha256
+        logger.debug(f"Published package cache at {app_data['package_cache_url']}.")
+        return True
+
+    def source(self) -> Optional[Tuple[str, str]]:
+        """Return the URL and sha256 of the published cache, or None if there is none."""
+        relation = self._charm.model.get_relation(self._relation_name)
+        if relation is None:
+            return None
+        app_data = relation.data[self._charm.app]
+        url = app_data.get("package_cache_url")
+        sha256 = app_data.get("package_cache_sha256")
+        if not url or not sha256:
+            return None
+        return url, sha256
+
+
+class RestartGrantedEvent(EventBase):
+    """Emitted when the leader lets this unit restart slurmrestd."""
+
+
+class RestartLockEvents(ObjectEvents):
+    """Restart lock events."""
+
+    restart_granted = EventSource(RestartGrantedEvent)
+
+
+class RestartLock(Object):
+    """Let at most `batch_size` units restart slurmrestd at a time.
+
+    A unit wanting to restart sets `restart_requested` in its unit databag. The
+    leader grants the lock by listing the unit in the space separated
+    `restart_granted` of the application databag, and hands it on once the unit removed its request
+    again, which it does after its slurmrestd answers requests.
+    """
+
+    on = RestartLockEvents()  # pyright: ignore [reportIncompatibleMethodOverride, reportAssignmentType]  # fmt: skip
+
+    def __init__(self, charm, relation_name, batch_size: int = 1):
+        """Observe the peer relation the lock is kept on."""
+        super().__init__(charm, f"{relation_name}-restart-lock")
+
+        self._charm = charm
+        self._relation_name = relation_name
+        self._batch_size = max(batch_size, 1)
+
+        self.framework.observe(
+            self._charm.on[relation_name].relation_changed, self._on_lock_changed
+        )
+        self.framework.observe(
+            self._charm.on[relation_name].relation_departed, self._on_lock_changed
+        )
+        self.framework.observe(self._charm.on.leader_elected, self._on_lock_changed)
+
+    @property
+    def requested(self) -> bool:
+        """Return True if this unit asked for the lock."""
+        relation = self._charm.model.get_relation(self._relation_name)
+        return relation is not None and "restart_requested" in relation.data[self._charm.unit]
+
+    @property
+    def held(self) -> bool:
+        """Return True if this unit asked for and was granted the lock."""
+        relation = self._charm.model.get_relation(self._relation_name)
+        return self.requested and self._charm.unit.name in self._granted(relation)
+
+    def acquire(self) -> bool:
+        """Ask for the lock, returning True if this unit may restart now.
+
+        A unit without peers always may. Otherwise `restart_granted` is
+        emitted once the leader grants the lock.
+        """
+        relation = self._charm.model.get_relation(self._relation_name)
+        if relation is None or not relation.units:
+            return True
+
+        relation.data[self._charm.unit]["restart_requested"] = "true"
+        if self._charm.unit.is_leader():
+            self._grant(relation)
+        return self.held
+
+    def release(self) -> None:
+        """Give the lock back, or withdraw the request for it."""
+        relation = self._charm.model.get_relation(self._relation_name)
+        if relation is None or not self.requested:
+            return
+        del relation.data[self._charm.unit]["restart_requested"]
+        if self._charm.unit.is_leader():
+            self._grant(relation)
+
+    def _on_lock_changed(self, event: EventBase) -> None:
+        """Grant the lock if leader and tell the charm if this unit holds it."""
+        relation = self._charm.model.get_relation(self._relation_name)
+        if relation is None:
+            return
+        if self._charm.unit.is_leader():
+            self._grant(relation)
+        if self.held:
+            self.on.restart_granted.emit()
+
+    def _granted(self, relation: Relation) -> List[str]:
+        """Return the names of the units holding the lock."""
+        return relation.data[self._charm.app].get("restart_granted", "").split()
+
+    def _grant(self, relation: Relation) -> None:
+        """Fill free slots with waiting units, keeping those that hold the lock."""
+        units = sorted({*relation.units, self._charm.unit}, key=lambda unit: unit.name)
+        requesting = [unit.name for unit in units if "restart_requested" in relation.data[unit]]
+        holders = [name for name in self._granted(relation) if name in requesting]
+        for name in requesting:
+            if len(holders) >= self._batch_size:
+                break
+            if name not in holders:
+                holders.append(name)
+
+        if holders != self._granted(relation):
+            logger.debug(f"Granting restart lock to {holders}.")
+            relation.data[self._charm.app]["restart_granted"] = " ".join(holders)
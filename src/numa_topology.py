@@ -0,0 +1,98 @@
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+"""NUMA topology as exposed under /sys/devices/system/node.
+
+Each `nodeN` directory lists the CPUs of node N in `cpulist`, e.g. "0-15,32-47",
+and its memory in `meminfo`, with lines like "Node 0 MemFree:  1234 kB".
+"""
+
+import re
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+_NODE_DIR = re.compile(r"node([0-9]+)")
+_MEMINFO = re.compile(r"Node\s+[0-9]+\s+(\w+):\s+([0-9]+)\s*kB")
+
+
+class NumaNode(NamedTuple):
+    """CPUs and memory of a NUMA node."""
+
+    id: int
+    cpus: Tuple[int, ...]
+    mem_total_kb: int
+    mem_free_kb: int
+
+
+def parse_cpulist(text: str) -> Tuple[int, ...]:
+    """Return the CPUs in a sysfs cpulist such as "0-3,8"."""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return tuple(cpus)
+
+
+def format_cpulist(cpus: Tuple[int, ...]) -> str:
+    """Return `cpus` as a cpulist, collapsing runs into ranges."""
+    ranges: List[List[int]] = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def _meminfo(path: Path) -> Dict[str, int]:
+    """Return the kB values in a node's meminfo by field name."""
+    try:
+        text = path.read_text()
+    except FileNotFoundError:
+        return {}
+    return {field: int(kb) for field, kb in _MEMINFO.findall(text)}
+
+
+def read_topology(node_dir: Path) -> List[NumaNode]:
+    """Return the NUMA nodes under `node_dir` by id, or none if it does not exist."""
+    if not node_dir.is_dir():
+        return []
+    nodes = []
+    for path in node_dir.iterdir():
+        if not (match := _NODE_DIR.fullmatch(path.name)):
+            continue
+        cpulist = path / "cpulist"
+        meminfo = _meminfo(path / "meminfo")
+        nodes.append(
+            NumaNode(
+                id=int(match.group(1)),
+                cpus=parse_cpulist(cpulist.read_text()) if cpulist.exists() else (),
+                mem_total_kb=meminfo.get("MemTotal", 0),
+                mem_free_kb=meminfo.get("MemFree", 0),
+            )
+        )
+    return sorted(nodes)
+
+
+def choose_node(nodes: List[NumaNode], preference: str) -> Optional[NumaNode]:
+    """Return the node to place daemons on for `preference`, "auto" or a node id.
+
+    "auto" picks the node with CPUs that has the most free memory, and None if
+    there is only one node to choose from.
+
+    Raises:
+        ValueError: if `preference` names a node that does not exist or has no CPUs.
+    """
+    candidates = [node for node in nodes if node.cpus]
+    if preference == "auto":
+        if len(candidates) < 2:
+            return None
+        return max(candidates, key=lambda node: (node.mem_free_kb, -node.id))
+
+    if not preference.isdigit():
+        raise ValueError(f"expected 'auto' or a node id, got '{preference}'")
+    for node in candidates:
+        if node.id == int(preference):
+            return node
+    raise ValueError(f"no NUMA node {preference} with CPUs")
@@ -0,0 +1,210 @@
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+"""Minimal slurm.conf model for telling apart changes that matter to slurmrestd.
+
+Only the structure needed for diffing is parsed: global `Key=Value` parameters,
+and entity lines such as `NodeName=...` or `PartitionName=...` keyed by their
+name. Line parsing is memoized, so re-parsing a large file where only a few
+node lines changed costs little more than splitting it into lines.
+"""
+
+import functools
+import re
+from enum import Enum
+from typing import Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+# Lines starting with one of these define an entity named by its value.
+ENTITY_KEYS = frozenset(
+    {"nodename", "partitionname", "nodeset", "downnodes", "frontendname", "switchname"}
+)
+
+# Parameters slurmrestd only picks up when it starts: authentication and the
+# plugins it loads, and where to find slurmctld.
+RESTART_PARAMETERS = frozenset(
+    {
+        "authtype",
+        "authalttypes",
+        "authaltparameters",
+        "authinfo",
+        "credtype",
+        "clustername",
+        "communicationparameters",
+        "controlmachine",
+        "controladdr",
+        "slurmctldhost",
+        "slurmctldport",
+        "slurmctldaddr",
+        "plugindir",
+        "pluginstackconfig",
+        "include",
+    }
+)
+RESTART_SUFFIXES = ("type", "plugin", "plugins")
+
+# Parameters that only concern other daemons and never affect slurmrestd.
+NOOP_PREFIXES = (
+    "slurmd",
+    "slurmctldlog",
+    "slurmctldtimeout",
+    "slurmctldparameters",
+    "slurmctldpidfile",
+    "slurmctlddebug",
+    "prolog",
+    "epilog",
+    "taskprolog",
+    "taskepilog",
+    "schedulerparameters",
+    "healthcheck",
+    "suspend",
+    "resume",
+    "reboot",
+    "jobacctgatherfrequency",
+    "jobcomp",
+    "statesavelocation",
+    "maxjobcount",
+    "mintimelimit",
+)
+
+
+# One of these must name the controller for slurmrestd to reach slurmctld.
+CONTROLLER_KEYS = ("slurmctldhost", "controlmachine")
+
+
+class Action(Enum):
+    """What slurmrestd needs after a slurm.conf change, ordered by severity."""
+
+    NOOP = 0
+    RELOAD = 1
+    RESTART = 2
+
+
+class SlurmConf(NamedTuple):
+    """Parsed slurm.conf: lowercased parameter names and entity lines."""
+
+    parameters: Dict[str, str]
+    entities: Dict[Tuple[str, str], str]
+
+
+class Diff(NamedTuple):
+    """Parameter names and entities that differ between two slurm.conf files."""
+
+    parameters: FrozenSet[str]
+    entities: FrozenSet[Tuple[str, str]]
+
+    def __bool__(self) -> bool:
+        """Return True if anything changed."""
+        return bool(self.parameters or self.entities)
+
+
+_TOKEN_RE = re.compile(r'([^\s=]+)=("[^"]*"|\S*)')
+
+
+def _logical_lines(text: str) -> Iterator[str]:
+    """Yield lines with comments stripped and backslash continuations joined."""
+    pending = ""
+    for line in text.splitlines():
+        line = line.split("#", 1)[0].rstrip()
+        if line.endswith("\\"):
+            pending += line[:-1] + " "
+            continue
+        line = (pending + line).strip()
+        pending = ""
+        if line:
+            yield line
+    if pending.strip():
+        yield pending.strip()
+
+
+@functools.lru_cache(maxsize=131072)
+def _parse_line(line: str) -> Tuple[Optional[Tuple[str, str]], Tuple[Tuple[str, str], ...]]:
+    """Return the entity key of `line`, if any, and its lowercased key/value pairs."""
+    if line.lower().startswith("include "):
+        return None, (("include", line.split(None, 1)[1]),)
+    pairs = tuple((key.lower(), value) for key, value in _TOKEN_RE.findall(line))
+    if pairs and pairs[0][0] in ENTITY_KEYS:
+        return pairs[0], pairs
+    return None, pairs
+
+
+def parse(text: str) -> SlurmConf:
+    """Parse slurm.conf `text`."""
+    return _parse_lines(_logical_lines(text))
+
+
+def _parse_lines(lines: Iterable[str]) -> SlurmConf:
+    """Parse the logical lines of a slurm.conf."""
+    parameters: Dict[str, str] = {}
+    entities: Dict[Tuple[str, str], str] = {}
+    for line in lines:
+        entity, pairs = _parse_line(line)
+        if entity is not None:
+            # Normalize whitespace and key case so only real edits show in a diff.
+            entities[entity] = " ".join(f"{k}={v}" for k, v in pairs)
+        else:
+            for key, value in pairs:
+                if key == "include" and key in parameters:
+                    value = f"{parameters[key]}\n{value}"
+                parameters[key] = value
+    return SlurmConf(parameters, entities)
+
+
+def validate(text: str, include: bool = False) -> SlurmConf:
+    """Parse slurm.conf `text`, checking it is well formed.
+
+    Every line must consist of `Key=Value` pairs or be an `Include`, and unless
+    `text` is an `include` file it must name the controller.
+
+    Raises:
+        ValueError: describing the first few problems found.
+    """
+    problems: List[str] = []
+    lines = list(_logical_lines(text))
+    for line in lines:
+        _, pairs = _parse_line(line)
+        stray = _TOKEN_RE.sub("", line).strip()
+        if not pairs or (stray and pairs[0][0] != "include"):
+            problems.append(f"malformed line '{line[:60]}'")
+        elif not pairs[0][1]:
+            problems.append(f"empty {pairs[0][0]} in '{line[:60]}'")
+        if len(problems) >= 3:
+            break
+
+    conf = _parse_lines(lines)
+    if not include and not any(key in conf.parameters for key in CONTROLLER_KEYS):
+        problems.append("no SlurmctldHost")
+    if problems:
+        raise ValueError(", ".join(problems))
+    return conf
+
+
+def diff(old: SlurmConf, new: SlurmConf) -> Diff:
+    """Return what differs between `old` and `new`."""
+    parameters = {
+        key
+        for key in old.parameters.keys() | new.parameters.keys()
+        if old.parameters.get(key) != new.parameters.get(key)
+    }
+    entities = {
+        key
+        for key in old.entities.keys() | new.entities.keys()
+        if old.entities.get(key) != new.entities.get(key)
+    }
+    return Diff(frozenset(parameters), frozenset(entities))
+
+
+def _parameter_action(key: str) -> Action:
+    if key in RESTART_PARAMETERS or key.endswith(RESTART_SUFFIXES):
+        return Action.RESTART
+    if key.startswith(NOOP_PREFIXES):
+        return Action.NOOP
+    return Action.RELOAD
+
+
+def classify(changes: Diff) -> Action:
+    """Return the action `changes` require from slurmrestd."""
+    action = Action.RELOAD if changes.entities else Action.NOOP
+    for key in changes.parameters:
+        parameter_action = _parameter_action(key)
+        if parameter_action.value > action.value:
+            action = parameter_action
+    return action
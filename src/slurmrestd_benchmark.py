@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+"""Closed-loop HTTP load generator for sizing slurmrestd.
+
+Each worker thread owns one keep-alive connection and issues requests back to
+back, so `concurrency` is the number of in-flight requests. A ramp runs one
+step per concurrency level and reports where latency starts to climb without
+a matching throughput gain (the "knee").
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import math
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger()
+
+# Wait between reconnects after a connection error, doubling up to the maximum.
+RECONNECT_DELAY = 0.05
+RECONNECT_MAX_DELAY = 1.0
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Return the nearest-rank percentile of already sorted `samples`."""
+    if not samples:
+        return 0.0
+    rank = min(max(math.ceil(fraction * len(samples)) - 1, 0), len(samples) - 1)
+    return samples[rank]
+
+
+def _worker(
+    url: str,
+    path: str,
+    headers: Dict[str, str],
+    deadline: float,
+    timeout: float,
+    latencies: List[float],
+    errors: List[str],
+) -> None:
+    """Issue requests over a single keep-alive connection until `deadline`."""
+    parts = urlsplit(url)
+    conn_cls = (
+        http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    )
+    conn = None
+    delay = RECONNECT_DELAY
+    while time.monotonic() < deadline:
+        if conn is None:
+            conn = conn_cls(parts.hostname or "localhost", parts.port, timeout=timeout)
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors.append("connection")
+            conn.close()
+            conn = None
+            # Don't spin on a server that refuses or drops connections.
+            time.sleep(max(min(delay, deadline - time.monotonic()), 0))
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+            continue
+        delay = RECONNECT_DELAY
+        latencies.append(time.perf_counter() - start)
+        if response.status >= 400:
+            errors.append("status")
+        if response.will_close:
+            conn.close()
+            conn = None
+    if conn is not None:
+        conn.close()
+
+
+def run_step(
+    url: str,
+    path: str,
+    concurrency: int,
+    duration: float,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: float = 10.0,
+) -> Dict[str, float]:
+    """Drive `concurrency` connections against `url` for `duration` seconds."""
+    headers = {"Connection": "keep-alive", **(headers or {})}
+    latencies: List[float] = []
+    errors: List[str] = []
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=_worker,
+            args=(url, path, headers, deadline, timeout, latencies, errors),
+            daemon=True,
+        )
+        for _ in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    attempts = len(latencies) + errors.count("connection")
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "error_rate": len(errors) / attempts if attempts else 0.0,
+    }
+
+
+def find_knee(
+    steps: List[Dict[str, float]], min_gain: float = 0.1, latency_growth: float = 1.5
+) -> Optional[int]:
+    """Return the last concurrency before latency climbs without a throughput gain.
+
+    The knee is reported at step `i - 1` when going to step `i` improves RPS by
+    less than `min_gain` while p95 latency grows by more than `latency_growth`.
+    """
+    for previous, current in zip(steps, steps[1:]):
+        if not previous["rps"] or not previous["p95_ms"]:
+            continue
+        gain = current["rps"] / previous["rps"] - 1
+        growth = current["p95_ms"] / previous["p95_ms"]
+        if gain < min_gain and growth > latency_growth:
+            return int(previous["concurrency"])
+    return None
+
+
+def run(
+    url: str,
+    path: str,
+    ramp: List[int],
+    duration: float,
+    headers: Optional[Dict[str, str]] = None,
+) -> Dict:
+    """Run one step per concurrency level in `ramp` and locate the knee."""
+    steps = []
+    for concurrency in ramp:
+        step = run_step(url, path, concurrency, duration, headers)
+        logger.info(f"benchmark step: {step}")
+        steps.append(step)
+    return {"steps": steps, "knee": find_knee(steps)}
+
+
+def parse_ramp(ramp: str) -> List[int]:
+    """Parse a comma separated list of concurrency levels, e.g. `1,2,4,8`."""
+    levels = [int(level) for level in ramp.split(",") if level.strip()]
+    if not levels or min(levels) < 1:
+        raise ValueError(f"invalid ramp '{ramp}': expected positive integers like '1,2,4,8'")
+    return levels
+
+
+def main() -> None:
+    """Run a benchmark from the command line and print the result as JSON."""
+    parser = argparse.ArgumentParser(description=(__doc__ or "").splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:6820")
+    parser.add_argument("--path", default="/slurm/v0.0.39/ping")
+    parser.add_argument("--ramp", default="1,2,4,8,16,32")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--user", default="")
+    parser.add_argument("--token", default="")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    headers = {}
+    if args.user:
+        headers["X-SLURM-USER-NAME"] = args.user
+    if args.token:
+        headers["X-SLURM-USER-TOKEN"] = args.token
+    print(json.dumps(run(args.url, args.path, parse_ramp(args.ramp), args.duration, headers)))
+
+
+if __name__ == "__main__":
+    main()
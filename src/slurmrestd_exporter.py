@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+"""Prometheus exporter for slurmrestd request metrics.
+
+slurmrestd does not expose any metrics of its own. This exporter tails the
+slurmrestd journal stream, parses the per-request lines logged at `-vv`, and
+serves per-endpoint request counters and latency histograms on `/metrics`.
+
+The journal position is persisted as a cursor so that a restarted exporter
+resumes where it left off instead of re-reading the whole journal history.
+
+This module only depends on the standard library because it is run by the
+system python3 interpreter as a systemd service, outside of the charm venv.
+"""
+
+import argparse
+import json
+import logging
+import re
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_ENDPOINTS = 200
+
+_CONN = r"\[(?P<conn>(?:\[[^\]]*\])?[^\[\]\s]*)\]"
+_REQUEST_RE = re.compile(
+    _CONN + r"\s+(?P<method>GET|POST|PUT|DELETE|PATCH|HEAD|OPTIONS)\s+(?P<path>/\S*)"
+)
+_RESPONSE_RE = re.compile(_CONN + r".*?\b(?:sending|send|response)\b\D*?(?P<status>[1-5]\d\d)\b")
+_CLOSE_RE = re.compile(_CONN + r".*?\bclos(?:e|ed|ing)\b")
+
+_VERSION_RE = re.compile(r"^v\d+\.\d+\.\d+$")
+_NAMED_RESOURCES = frozenset(
+    {
+        "account",
+        "association",
+        "cluster",
+        "job",
+        "node",
+        "partition",
+        "qos",
+        "reservation",
+        "user",
+        "wckey",
+    }
+)
+
+
+def normalize_endpoint(path: str) -> str:
+    """Collapse a request path into a bounded-cardinality endpoint label.
+
+    `/slurm/v0.0.39/job/1234?x=y` becomes `/slurm/{version}/job/{name}`.
+    """
+    segments = path.split("?", 1)[0].split("/")
+    normalized = []
+    previous = ""
+    for segment in segments:
+        if _VERSION_RE.match(segment):
+            segment = "{version}"
+        elif previous in _NAMED_RESOURCES:
+            segment = "{name}"
+        elif segment.isdigit():
+            segment = "{id}"
+        normalized.append(segment)
+        previous = segment
+    return "/".join(normalized) or "/"
+
+
+class Histogram:
+    """Cumulative latency histogram in the Prometheus layout."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Record a single observation."""
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class RequestMetrics:
+    """Thread-safe per-endpoint request counters and latency histograms."""
+
+    def __init__(self, max_endpoints: int = MAX_ENDPOINTS):
+        self._lock = threading.Lock()
+        self._max_endpoints = max_endpoints
+        self._endpoints = set()
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.errors: Dict[Tuple[str, str], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.lines_parsed = 0
+
+    def _endpoint(self, path: str) -> str:
+        endpoint = normalize_endpoint(path)
+        if endpoint not in self._endpoints:
+            if len(self._endpoints) >= self._max_endpoints:
+                return "other"
+            self._endpoints.add(endpoint)
+        return endpoint
+
+    def observe(self, method: str, path: str, status: str, seconds: Optional[float]) -> None:
+        """Record a completed request."""
+        with self._lock:
+            endpoint = self._endpoint(path)
+            key = (method, endpoint, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if status[0] in "45":
+                self.errors[(method, endpoint)] = self.errors.get((method, endpoint), 0) + 1
+            if seconds is not None:
+                self.latency.setdefault((method, endpoint), Histogram()).observe(seconds)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP slurmrestd_requests_total Requests handled by slurmrestd.",
+            "# TYPE slurmrestd_requests_total counter",
+        ]
+        with self._lock:
+            for (method, endpoint, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'slurmrestd_requests_total{{method="{method}",endpoint="{endpoint}",'
+                    f'status="{status}"}} {count}'
+                )
+            lines += [
+                "# HELP slurmrestd_request_errors_total Requests answered with a 4xx or 5xx.",
+                "# TYPE slurmrestd_request_errors_total counter",
+            ]
+            for (method, endpoint), count in sorted(self.errors.items()):
+                lines.append(
+                    f'slurmrestd_request_errors_total{{method="{method}",endpoint="{endpoint}"}} '
+                    f"{count}"
+                )
+            lines += [
+                "# HELP slurmrestd_request_duration_seconds Request latency seen in the journal.",
+                "# TYPE slurmrestd_request_duration_seconds histogram",
+            ]
+            for (method, endpoint), histogram in sorted(self.latency.items()):
+                labels = f'method="{method}",endpoint="{endpoint}"'
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(
+                        f'slurmrestd_request_duration_seconds_bucket{{{labels},le="{bound}"}} '
+                        f"{count}"
+                    )
+                lines.append(
+                    f'slurmrestd_request_duration_seconds_bucket{{{labels},le="+Inf"}} '
+                    f"{histogram.total}"
+                )
+                lines.append(
+                    f"slurmrestd_request_duration_seconds_sum{{{labels}}} {histogram.sum}"
+                )
+                lines.append(
+                    f"slurmrestd_request_duration_seconds_count{{{labels}}} {histogram.total}"
+                )
+            lines += [
+                "# HELP slurmrestd_exporter_journal_lines_total Journal lines parsed.",
+                "# TYPE slurmrestd_exporter_journal_lines_total counter",
+                f"slurmrestd_exporter_journal_lines_total {self.lines_parsed}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+class LogParser:
+    """Turn slurmrestd journal entries into completed request observations.
+
+    slurmrestd logs the request line and the response status as separate
+    messages tagged with the connection name, so requests are correlated
+    per connection and timed with the journal's realtime timestamps.
+    """
+
+    def __init__(self, metrics: RequestMetrics):
+        self._metrics = metrics
+        self._inflight: Dict[str, Tuple[str, str, float]] = {}
+
+    def feed(self, message: str, timestamp: float) -> None:
+        """Parse a single log message logged at `timestamp` seconds."""
+        self._metrics.lines_parsed += 1
+        if match := _REQUEST_RE.search(message):
+            self._inflight[match["conn"]] = (match["method"], match["path"], timestamp)
+        elif match := _RESPONSE_RE.search(message):
+            if request := self._inflight.pop(match["conn"], None):
+                method, path, started = request
+                self._metrics.observe(method, path, match["status"], max(timestamp - started, 0))
+        elif match := _CLOSE_RE.search(message):
+            self._inflight.pop(match["conn"], None)
+
+
+class JournalTailer:
+    """Follow a unit's journal from a persisted cursor."""
+
+    def __init__(self, unit: str, cursor_file: Path, flush_interval: float = 5.0):
+        self._unit = unit
+        self._cursor_file = cursor_file
+        self._flush_interval = flush_interval
+
+    def _load_cursor(self) -> Optional[str]:
+        try:
+            return self._cursor_file.read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _save_cursor(self, cursor: str) -> None:
+        tmp = self._cursor_file.with_suffix(".tmp")
+        tmp.write_text(cursor)
+        tmp.replace(self._cursor_file)
+
+    def command(self) -> List[str]:
+        """Return the journalctl command resuming from the saved cursor."""
+        cmd = ["journalctl", "--unit", self._unit, "--output", "json", "--follow", "--no-pager"]
+        if cursor := self._load_cursor():
+            cmd.append(f"--after-cursor={cursor}")
+        else:
+            # Without a cursor start at the tail; history was never ours to count.
+            cmd.append("--lines=0")
+        return cmd
+
+    def entries(self) -> Iterator[Tuple[str, float]]:
+        """Yield (message, timestamp) pairs forever, restarting journalctl if it exits."""
+        while True:
+            proc = subprocess.Popen(self.command(), stdout=subprocess.PIPE, text=True)
+            cursor, last_flush = None, time.monotonic()
+            assert proc.stdout is not None
+            for line in proc.stdout:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                cursor = entry.get("__CURSOR", cursor)
+                message = entry.get("MESSAGE")
+                if isinstance(message, str):
+                    yield message, int(entry.get("__REALTIME_TIMESTAMP", 0)) / 1e6
+                if cursor and time.monotonic() - last_flush >= self._flush_interval:
+                    self._save_cursor(cursor)
+                    last_flush = time.monotonic()
+            if cursor:
+                self._save_cursor(cursor)
+            logger.warning(f"journalctl exited with {proc.wait()}, restarting.")
+            time.sleep(self._flush_interval)
+
+
+def serve(metrics: RequestMetrics, port: int) -> ThreadingHTTPServer:
+    """Serve `metrics` on http://0.0.0.0:`port`/metrics from a background thread."""
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the exporter."""
+    parser = argparse.ArgumentParser(description=(__doc__ or "").splitlines()[0])
+    parser.add_argument("--port", type=int, default=9820)
+    parser.add_argument("--unit", default="slurmrestd")
+    parser.add_argument("--state-dir", type=Path, default=Path("/var/lib/slurmrestd-exporter"))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    args.state_dir.mkdir(parents=True, exist_ok=True)
+
+    metrics = RequestMetrics()
+    log_parser = LogParser(metrics)
+    serve(metrics, args.port)
+    for message, timestamp in JournalTailer(args.unit, args.state_dir / "cursor").entries():
+        log_parser.feed(message, timestamp)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,28 +2,116 @@
 # See LICENSE file for licensing details.
 """This module provides the SlurmrestdManager."""
 
+import importlib.util
+import io
 import logging
 import os
+import re
+import shutil
 import subprocess
+import sys
+import tarfile
+import time
+import urllib.request
 from base64 import b64decode
-from pathlib import Path
+from binascii import Error as Base64Error
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from hashlib import sha256
+from pathlib import Path, PurePosixPath
+from tempfile import TemporaryDirectory
+from typing import IO, TYPE_CHECKING, Callable, Collection, Dict, List, Optional, Set, Tuple
 
-import charms.operator_libs_linux.v0.apt as apt
-import charms.operator_libs_linux.v1.systemd as systemd
-import distro
 from constants import (
+    APT_ARCHIVES_DIR,
+    CHARM_DROPIN_NAME,
+    GROUP_PATH,
+    KEYRINGS_DIR,
+    MUNGE_KEY_MAX_BYTES,
+    MUNGE_KEY_MIN_BYTES,
     MUNGE_KEY_PATH,
+    NUMA_NODE_DIR,
+    PACKAGE_CACHE_BASE_PRIORITIES,
+    PACKAGE_CACHE_DIR,
+    PACKAGE_CACHE_DOWNLOAD_DIR,
+    PACKAGE_CACHE_SERVICE,
+    PACKAGE_CACHE_TARBALL,
+    PASSWD_PATH,
+    POLICY_RC_D,
+    POLICY_RC_D_PATH,
+    PROC_SYS_DIR,
+    SLURM_CONF_DIR,
+    SLURM_CONF_PATH,
+    SLURM_DEBS_CHECKSUMS,
+    SLURM_SERIES,
+    SLURMRESTD_CONFIGLESS_ENV_PATH,
+    SLURMRESTD_DRY_RUN_TIMEOUT,
     SLURMRESTD_GROUP_GID,
+    SLURMRESTD_EXPORTER_SERVICE,
+    SLURMRESTD_EXPORTER_STATE_DIR,
     SLURMRESTD_GROUP_NAME,
+    SLURMRESTD_INSTANCE_SERVICE,
+    SLURMRESTD_PORT,
     SLURMRESTD_SERVICE,
     SLURMRESTD_USER_NAME,
     SLURMRESTD_USER_UID,
+    SYSCTL_CONF_PATH,
+    SYSTEMD_DROPIN_DIR,
+    SYSTEMD_SYSTEM_DIR,
     UBUNTU_HPC_PPA_KEY,
 )
+from hook_profiler import Span, continue_span, current_span, span, traced
+
+if TYPE_CHECKING:
+    from charms.operator_libs_linux.v0.apt import DebianRepository
+
+    from slurm_conf import Action, SlurmConf
 
 logger = logging.getLogger()
 
 
+def _lazy_import(name: str):
+    """Return module `name`, deferring execution of its body until first attribute access."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+# Only the install and reconfigure paths need these; `update-status` and most
+# relation hooks never touch them, so keep them off the dispatch import path.
+apt = _lazy_import("charms.operator_libs_linux.v0.apt")
+systemd = _lazy_import("charms.operator_libs_linux.v1.systemd")
+distro = _lazy_import("distro")
+slurm_conf_model = _lazy_import("slurm_conf")
+systemd_dropin = _lazy_import("systemd_dropin")
+numa_topology = _lazy_import("numa_topology")
+slurmrestd_upgrade = _lazy_import("slurmrestd_upgrade")
+
+
+# Install steps that must finish before a step starts; others may run at once.
+# The package index is refreshed once, then all packages are downloaded while
+# the account and /etc/slurm are set up. Package steps share the dpkg lock,
+# and the slurmrestd package ships a unit file that service-unit replaces.
+INSTALL_DEPENDENCIES = {
+    "package-index": ("local-packages",),
+    "package-prefetch": ("package-index",),
+    "slurmrestd-package": ("package-prefetch",),
+    "munge-package": ("slurmrestd-package",),
+    "plugins-package": ("munge-package",),
+    "service-unit": ("slurmrestd-package",),
+}
+INSTALL_WORKERS = 4
+
+_INCLUDE_RE = re.compile(r"^(\s*include\s+)(\S+)", re.IGNORECASE | re.MULTILINE)
+
+
 class SlurmrestdManagerError(BaseException):
     """Exception for use with SlurmrestdManager."""
 
@@ -32,25 +120,160 @@ class SlurmrestdManagerError(BaseException):
         self.message = message
 
 
+def _open_member(tar: tarfile.TarFile, member: tarfile.TarInfo) -> IO[bytes]:
+    """Return a file object reading `member` of `tar`.
+
+    Raises:
+        SlurmrestdManagerError: if `member` has no content to read.
+    """
+    if (src := tar.extractfile(member)) is None:
+        raise SlurmrestdManagerError(f"cannot read {member.name} in {tar.name}")
+    return src
+
+
+def _extract_debs(tarball: Path, target: Path) -> List[Path]:
+    """Extract the .deb files in `tarball` to `target`, checking them against its SHA256SUMS.
+
+    Raises:
+        SlurmrestdManagerError: if a .deb is unlisted, missing or does not match its checksum.
+    """
+    with tarfile.open(tarball) as tar:
+        # Only regular files are extracted, flattened by name, so member paths can't escape.
+        members = {PurePosixPath(m.name).name: m for m in tar.getmembers() if m.isfile()}
+        if SLURM_DEBS_CHECKSUMS not in members:
+            raise SlurmrestdManagerError(f"no {SLURM_DEBS_CHECKSUMS} in {tarball.name}")
+        checksums = {}
+        sums = _open_member(tar, members[SLURM_DEBS_CHECKSUMS]).read().decode()
+        for line in sums.splitlines():
+            if line.strip():
+                checksum, name = line.split(None, 1)
+                checksums[PurePosixPath(name.lstrip("*")).name] = checksum
+
+        debs = []
+        for name, member in members.items():
+            if not name.endswith(".deb"):
+                continue
+            if name not in checksums:
+                raise SlurmrestdManagerError(f"{name} not listed in {SLURM_DEBS_CHECKSUMS}")
+            digest = sha256()
+            with _open_member(tar, member) as src, open(target / name, "wb") as dst:
+                while chunk := src.read(1 << 20):
+                    digest.update(chunk)
+                    dst.write(chunk)
+            if digest.hexdigest() != checksums[name]:
+                raise SlurmrestdManagerError(f"checksum mismatch for {name}")
+            debs.append(target / name)
+
+    if missing := set(checksums) - {deb.name for deb in debs}:
+        raise SlurmrestdManagerError(f"{', '.join(sorted(missing))} missing from {tarball.name}")
+    return sorted(debs)
+
+
+def _deb_version(name: str) -> Tuple[str, str]:
+    """Return the package and version of a .deb named as apt names them in its archives."""
+    package, version, _ = (name[: -len(".deb")].split("_") + ["", ""])[:3]
+    return package, version.replace("%3a", ":")
+
+
+def _tarball_versions(tarball: Path) -> Dict[str, str]:
+    """Return the versions of the packages in a .deb tarball, empty if it cannot be read."""
+    try:
+        with tarfile.open(tarball) as tar:
+            names = [PurePosixPath(name).name for name in tar.getnames()]
+    except (OSError, tarfile.TarError):
+        return {}
+    return dict(_deb_version(name) for name in names if name.endswith(".deb"))
+
+
+def _write_debs_tarball(debs: List[Path], tarball: Path) -> str:
+    """Write `debs` and a SHA256SUMS listing them to `tarball`, returning its sha256."""
+    checksums = []
+    tmp = tarball.with_suffix(".tmp")
+    with tarfile.open(tmp, "w:gz") as tar:
+        for deb in debs:
+            checksums.append(f"{_file_sha256(deb)}  {deb.name}\n")
+            tar.add(deb, arcname=deb.name)
+        listing = "".join(checksums).encode()
+        info = tarfile.TarInfo(SLURM_DEBS_CHECKSUMS)
+        info.size = len(listing)
+        tar.addfile(info, io.BytesIO(listing))
+    os.replace(tmp, tarball)
+    return _file_sha256(tarball)
+
+
+def _relocate_includes(text: str, conf_dir: Path) -> str:
+    """Return slurm.conf `text` with `Include`s of files in /etc/slurm pointed at `conf_dir`."""
+
+    def relocate(match: "re.Match[str]") -> str:
+        path = PurePosixPath(match.group(2))
+        if path.parent != PurePosixPath(SLURM_CONF_DIR):
+            return match.group(0)
+        return f"{match.group(1)}{conf_dir / path.name}"
+
+    return _INCLUDE_RE.sub(relocate, text)
+
+
+def _file_sha256(path: Path) -> str:
+    """Return the sha256 of the file at `path`."""
+    digest = sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _ready_steps(pending: Dict[str, Callable[[], bool]], done: Set[str]) -> List[str]:
+    """Return the pending install steps whose dependencies are done."""
+    return [
+        name
+        for name in pending
+        if all(dependency in done for dependency in INSTALL_DEPENDENCIES.get(name, ()))
+    ]
+
+
+def _run_install_step(
+    name: str, step: Callable[[], bool], parent: Optional[Span]
+) -> Tuple[bool, float]:
+    """Run install `step` on a worker thread, returning its success and wall time in ms."""
+    start = time.perf_counter()
+    with continue_span(parent), span(f"SlurmrestdManager.install.{name}"):
+        succeeded = step() is True
+    return succeeded, (time.perf_counter() - start) * 1000
+
+
+def _has_account(db: Path, name: str, id: int) -> bool:
+    """Return True if `db`, /etc/passwd or /etc/group, has `name` with `id`."""
+    try:
+        lines = db.read_text().splitlines()
+    except FileNotFoundError:
+        return False
+    return any(line.split(":")[0:3:2] == [name, str(id)] for line in lines)
+
+
 class CharmedHPCPackageLifecycleManager:
     """Facilitate ubuntu-hpc slurm component package lifecycles."""
 
     def __init__(self, package_name: str):
         self._package_name = package_name
-        self._keyring_path = Path(f"/usr/share/keyrings/ubuntu-hpc-{self._package_name}.asc")
+        self._keyring_path = KEYRINGS_DIR / f"ubuntu-hpc-{self._package_name}.asc"
+
+    @property
+    def package_name(self) -> str:
+        """Return the name of the managed package."""
+        return self._package_name
 
-    def _repo(self) -> apt.DebianRepository:
+    def _repo(self) -> "DebianRepository":
         """Return the ubuntu-hpc repo."""
-        ppa_url: str = "https://ppa.launchpadcontent.net/ubuntu-hpc/slurm-wlm-23.02/ubuntu"
+        ppa_url: str = (
+            f"https://ppa.launchpadcontent.net/ubuntu-hpc/slurm-wlm-{SLURM_SERIES}/ubuntu"
+        )
         sources_list: str = (
             f"deb [signed-by={self._keyring_path}] {ppa_url} {distro.codename()} main"
         )
         return apt.DebianRepository.from_repo_line(sources_list)
 
-    def install(self) -> bool:
-        """Install package using lib apt."""
-        package_installed = False
-
+    def add_repo(self) -> None:
+        """Add the ubuntu-hpc repo, signed by its key, to the apt sources."""
         if self._keyring_path.exists():
             self._keyring_path.unlink()
         self._keyring_path.write_text(UBUNTU_HPC_PPA_KEY)
@@ -58,8 +281,20 @@ class CharmedHPCPackageLifecycleManager:
         repositories = apt.RepositoryMapping()
         repositories.add(self._repo())
 
+    @traced
+    def install(self, update: bool = True) -> bool:
+        """Install package using lib apt.
+
+        With `update`, the repo is added and the package index refreshed first.
+        """
+        package_installed = False
+
+        if update:
+            self.add_repo()
+
         try:
-            apt.update()
+            if update:
+                apt.update()
             apt.add_package([self._package_name])
             package_installed = True
         except apt.PackageNotFoundError:
@@ -82,16 +317,20 @@ class CharmedHPCPackageLifecycleManager:
         if self._keyring_path.exists():
             self._keyring_path.unlink()
 
-    def upgrade_to_latest(self) -> None:
-        """Upgrade package to latest."""
+    @traced
+    def upgrade_to_latest(self) -> bool:
+        """Upgrade package to latest, returning True on success."""
         try:
             slurm_package = apt.DebianPackage.from_system(self._package_name)
             slurm_package.ensure(apt.PackageState.Latest)
             logger.info(f"Updated '{self._package_name}' to: {slurm_package.version.number}.")
         except apt.PackageNotFoundError:
             logger.error(f"'{self._package_name}' not found in package cache or on system.")
+            return False
         except apt.PackageError as e:
             logger.error(f"Could not install '{self._package_name}'. Reason: {e.message}")
+            return False
+        return True
 
     def version(self) -> str:
         """Return the package version."""
@@ -112,53 +351,416 @@ class SlurmrestdManager:
         self._munge_package = CharmedHPCPackageLifecycleManager("munge")
         self._slurmrestd_package = CharmedHPCPackageLifecycleManager("slurmrestd")
         self._slurm_plugins_package = CharmedHPCPackageLifecycleManager("slurm-wlm-basic-plugins")
+        self._offline = False
+
+    @property
+    def offline(self) -> bool:
+        """Return True if the packages were installed from a .deb tarball, not the PPA."""
+        return self._offline
+
+    def install_steps(self, debs: Optional[Path] = None) -> Dict[str, Callable[[], bool]]:
+        """Return the install steps in the order they run, each returning True on success.
+
+        Steps are safe to rerun, but a step recorded as completed need not be.
+        With a `debs` tarball, packages are installed from it instead of the PPA.
+        """
+        steps = {}
+        if debs is not None:
+            steps["local-packages"] = lambda: self._install_local_debs(debs)
+        return {
+            **steps,
+            "package-index": self._update_package_index,
+            "package-prefetch": self._prefetch_packages,
+            "slurmrestd-package": lambda: self._install_package(
+                self._slurmrestd_package, "slurmrestd"
+            ),
+            "munge-package": lambda: self._install_package(self._munge_package, "munge"),
+            "plugins-package": lambda: self._install_package(self._slurm_plugins_package),
+            "user-group": self._install_user_group,
+            "conf-dir": self._install_conf_dir,
+            "service-unit": self._install_service_unit,
+        }
+
+    @traced
+    def install(
+        self,
+        completed: Collection[str] = (),
+        on_step: Optional[Callable[[str], None]] = None,
+        debs: Optional[Path] = None,
+        offline: bool = False,
+    ) -> bool:
+        """Install slurmrestd and munge to the system.
+
+        Steps in `completed` are skipped, and `on_step` is called with the name
+        of each step once it succeeds so a failed install can resume from there.
+        Packages come from the `debs` tarball if given and valid, else the PPA.
+        When resuming, `offline` says an earlier run installed them from a
+        tarball, see `offline`, so the PPA is not set up for the remaining steps.
+
+        Steps run on a thread pool as soon as the steps they depend on, see
+        `INSTALL_DEPENDENCIES`, have succeeded. After a failure no further steps
+        are started, but those already running are waited for.
+        """
+        steps = self.install_steps(debs)
+        on_step = on_step or (lambda name: None)
+        self._offline = self._offline or offline
+        if self.is_installed():
+            logger.info("slurmrestd is already installed and set up, skipping install.")
+            # The image may ship the package's unit file rather than the charm's.
+            self._install_service_unit()
+            # Leave the daemons stopped until configured, as the package steps do.
+            for service in ("slurmrestd", "munge"):
+                systemd.service_stop(service)
+            for name in steps.keys() - set(completed):
+                on_step(name)
+            return True
 
-    def install(self) -> bool:
-        """Install slurmrestd and munge to the system."""
         logger.debug("Installing and configuring slurmrestd and munge packages.")
 
-        if self._slurmrestd_package.install() is not True:
+        pending = {name: step for name, step in steps.items() if name not in completed}
+        # Steps not taken, such as local-packages without debs, count as done.
+        done = set(completed) | {
+            dependency
+            for dependencies in INSTALL_DEPENDENCIES.values()
+            for dependency in dependencies
+            if dependency not in steps
+        }
+        running = {}
+        timings: Dict[str, float] = {}
+        failed = False
+        parent = current_span()
+
+        with ThreadPoolExecutor(max_workers=INSTALL_WORKERS) as pool:
+            while pending or running:
+                for name in [] if failed else _ready_steps(pending, done):
+                    step = pending.pop(name)
+                    running[pool.submit(_run_install_step, name, step, parent)] = name
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    succeeded, timings[name] = future.result()
+                    if not succeeded:
+                        logger.error(f"Install step '{name}' failed.")
+                        failed = True
+                        continue
+                    done.add(name)
+                    on_step(name)
+
+        if skipped := steps.keys() & set(completed):
+            logger.debug(f"Install steps already completed, skipped: {sorted(skipped)}")
+        logger.info(
+            "Install step timings: "
+            + ", ".join(f"{name} {ms:.0f}ms" for name, ms in timings.items())
+        )
+        return not failed
+
+    @traced
+    def is_installed(self) -> bool:
+        """Return True if the system already has what `install` would need apt for.
+
+        That is the packages at the Slurm series of the PPA, the slurmrestd
+        user and group, and /etc/slurm, as on a pre-baked image. The unit file
+        is not checked, writing it needs no apt. Checking takes a single
+        `dpkg-query`.
+        """
+        if not SLURM_CONF_DIR.is_dir():
             return False
-        systemd.service_stop("slurmrestd")
+        if not (
+            _has_account(PASSWD_PATH, SLURMRESTD_USER_NAME, SLURMRESTD_USER_UID)
+            and _has_account(GROUP_PATH, SLURMRESTD_GROUP_NAME, SLURMRESTD_GROUP_GID)
+        ):
+            return False
+
+        packages = (self._slurmrestd_package, self._munge_package, self._slurm_plugins_package)
+        try:
+            result = subprocess.run(
+                [
+                    "dpkg-query",
+                    "--show",
+                    "--showformat=${Package} ${Version} ${db:Status-Status}\n",
+                    *(package.package_name for package in packages),
+                ],
+                capture_output=True,
+                text=True,
+            )
+        except OSError as e:
+            logger.debug(f"Could not query installed packages: {e}")
+            return False
+        versions = {}
+        for line in result.stdout.splitlines():
+            fields = line.split()
+            if len(fields) == 3 and fields[2] == "installed":
+                versions[fields[0]] = fields[1]
+        logger.debug(f"Installed versions: {versions}")
+        return (
+            versions.keys() >= {package.package_name for package in packages}
+            and versions["slurmrestd"].startswith(f"{SLURM_SERIES}.")
+            and versions["slurm-wlm-basic-plugins"].startswith(f"{SLURM_SERIES}.")
+        )
 
-        if self._munge_package.install() is not True:
+    def _update_package_index(self) -> bool:
+        """Add the PPA for the packages and refresh the package index once for all of them."""
+        if self._offline:
+            return True
+        for package in (
+            self._slurmrestd_package,
+            self._munge_package,
+            self._slurm_plugins_package,
+        ):
+            package.add_repo()
+        try:
+            apt.update()
+        except subprocess.CalledProcessError as e:
+            logger.error(f"apt-get update failed: {(e.stderr or b'').decode().strip()}")
             return False
-        systemd.service_stop("munge")
+        return True
+
+    def _prefetch_packages(self) -> bool:
+        """Download the packages and their dependencies to apt's archive cache."""
+        if self._offline:
+            return True
+        packages = (self._slurmrestd_package, self._munge_package, self._slurm_plugins_package)
+        try:
+            subprocess.run(
+                [
+                    "apt-get",
+                    "install",
+                    "--download-only",
+                    "--yes",
+                    *(package.package_name for package in packages),
+                ],
+                env={**os.environ, "DEBIAN_FRONTEND": "noninteractive"},
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Could not download packages: {e.stderr.strip()}")
+            return False
+        return True
 
-        if self._slurm_plugins_package.install() is not True:
+    def _install_package(
+        self, package: CharmedHPCPackageLifecycleManager, service: Optional[str] = None
+    ) -> bool:
+        """Install `package` unless installed from local debs, leaving `service` stopped."""
+        if not self._offline and package.install(update=False) is not True:
             return False
+        if service is not None:
+            systemd.service_stop(service)
+        return True
 
-        self._create_slurmrestd_user_group()
+    def _install_local_debs(self, tarball: Path) -> bool:
+        """Install the packages in `tarball` with dpkg, falling back to the PPA if that fails."""
+        packages = (self._slurmrestd_package, self._munge_package, self._slurm_plugins_package)
+        try:
+            with TemporaryDirectory(prefix="slurm-debs-") as tmp:
+                debs = _extract_debs(tarball, Path(tmp))
+                names = {deb.name.split("_", 1)[0] for deb in debs}
+                if missing := {p.package_name for p in packages} - names:
+                    raise SlurmrestdManagerError(f"no .deb for {', '.join(sorted(missing))}")
+                subprocess.run(
+                    ["dpkg", "--install", *map(str, debs)],
+                    env={**os.environ, "DEBIAN_FRONTEND": "noninteractive"},
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+        except SlurmrestdManagerError as e:
+            logger.warning(f"Not installing from {tarball.name}, using the PPA: {e.message}")
+            return True
+        except (OSError, tarfile.TarError) as e:
+            logger.warning(f"Not installing from {tarball.name}, using the PPA: {e}")
+            return True
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"dpkg failed on {tarball.name}, using the PPA: {e.stderr}")
+            return True
+
+        logger.info(f"Installed {len(debs)} packages from {tarball.name}")
+        self._offline = True
+        return True
 
-        slurm_conf_dir = Path("/etc/slurm")
-        slurm_conf_dir.mkdir(exist_ok=True)
+    def _install_user_group(self) -> bool:
+        """Create the slurmrestd user and group."""
+        try:
+            self._create_slurmrestd_user_group()
+        except subprocess.CalledProcessError:
+            return False
+        return True
 
-        os.chown(f"{slurm_conf_dir}", SLURMRESTD_USER_UID, SLURMRESTD_GROUP_GID)
+    def _install_conf_dir(self) -> bool:
+        """Create /etc/slurm owned by slurmrestd."""
+        SLURM_CONF_DIR.mkdir(exist_ok=True)
+        os.chown(f"{SLURM_CONF_DIR}", SLURMRESTD_USER_UID, SLURMRESTD_GROUP_GID)
+        return True
 
+    def _install_service_unit(self) -> bool:
+        """Write slurmrestd.service, if it differs, and have systemd pick it up."""
+        target = SYSTEMD_SYSTEM_DIR / "slurmrestd.service"
+        if target.is_file() and target.read_text() == SLURMRESTD_SERVICE:
+            return True
         logger.debug("Replacing slurmrestd.service")
-        target = Path("/usr/lib/systemd/system/slurmrestd.service")
         target.write_text(SLURMRESTD_SERVICE)
         systemd.daemon_reload()
-
         return True
 
     def version(self) -> str:
         """Return slurm version."""
         return self._slurmrestd_package.version()
 
+    @traced
     def write_slurm_conf(self, slurm_conf: str) -> None:
         """Render /etc/slurm/slurm.conf."""
-        target = Path("/etc/slurm/slurm.conf")
+        target = SLURM_CONF_PATH
         logger.debug(f"Writing slurm.conf: {target}")
 
         target.write_text(slurm_conf)
 
         os.chown(f"{target}", SLURMRESTD_USER_UID, SLURMRESTD_GROUP_GID)
 
+    def slurm_conf_action(self, slurm_conf: "SlurmConf") -> "Action":
+        """Return what replacing the current slurm.conf with the parsed `slurm_conf` requires."""
+        try:
+            current = slurm_conf_model.parse(SLURM_CONF_PATH.read_text())
+        except FileNotFoundError:
+            return slurm_conf_model.Action.RESTART
+
+        changes = slurm_conf_model.diff(current, slurm_conf)
+        action = slurm_conf_model.classify(changes)
+        logger.debug(
+            f"slurm.conf changes: parameters {sorted(changes.parameters)}, "
+            f"{len(changes.entities)} node/partition entries -> {action.name}"
+        )
+        return action
+
+    @traced
+    def update_slurm_conf(self, slurm_conf: str, action: "Action") -> bool:
+        """Write slurm.conf and restart, reload or leave slurmrestd running as `action` says.
+
+        `action` is what `slurm_conf_action` returned for `slurm_conf`.
+        Return True if slurmrestd was restarted or reloaded.
+        """
+        self.write_slurm_conf(slurm_conf)
+        if action is slurm_conf_model.Action.RESTART:
+            systemd.service_restart("slurmrestd")
+        elif action is slurm_conf_model.Action.RELOAD:
+            systemd.service_reload("slurmrestd")
+        return action is not slurm_conf_model.Action.NOOP
+
+    @traced
+    def write_slurm_conf_include(self, name: str, content: str) -> None:
+        """Render /etc/slurm/<name>.conf, pulled into slurm.conf with `Include`.
+
+        An empty `content` leaves an empty file, so a stale `Include` still resolves.
+        """
+        target = SLURM_CONF_DIR / f"{name}.conf"
+        logger.debug(f"Writing slurm.conf include: {target}")
+
+        target.write_text(content)
+
+        os.chown(f"{target}", SLURMRESTD_USER_UID, SLURMRESTD_GROUP_GID)
+
+    @traced
+    def set_conf_server(self, conf_server: Optional[str]) -> None:
+        """Run slurmrestd configless against `conf_server`, or from the local slurm.conf if None.
+
+        slurm.conf is looked up locally before asking a conf server, so the local
+        copy is removed when switching to configless.
+        """
+        if conf_server is None:
+            SLURMRESTD_CONFIGLESS_ENV_PATH.unlink(missing_ok=True)
+            return
+
+        logger.debug(f"Fetching slurm.conf from {conf_server}")
+        SLURMRESTD_CONFIGLESS_ENV_PATH.write_text(f"SLURM_CONF_SERVER={conf_server}\n")
+        SLURM_CONF_PATH.unlink(missing_ok=True)
+
+    @traced
+    def validate_config(
+        self,
+        munge_key: Optional[str] = None,
+        slurm_conf: Optional[str] = None,
+        includes: Optional[Dict[str, str]] = None,
+        dry_run: bool = False,
+    ) -> Optional["SlurmConf"]:
+        """Check candidate config before anything is stopped for it.
+
+        With `dry_run`, slurmrestd also loads the candidate slurm.conf from a
+        temporary directory, next to copies of the current includes.
+        Return the parsed `slurm_conf`, or None if there is none.
+
+        Raises:
+            SlurmrestdManagerError: if any part of the config would keep slurmrestd down.
+        """
+        if munge_key is not None:
+            try:
+                key = b64decode(munge_key.encode(), validate=True)
+            except (Base64Error, ValueError) as e:
+                raise SlurmrestdManagerError(f"munge key is not valid base64: {e}")
+            if not MUNGE_KEY_MIN_BYTES <= len(key) <= MUNGE_KEY_MAX_BYTES:
+                raise SlurmrestdManagerError(
+                    f"munge key is {len(key)} bytes, "
+                    f"expected {MUNGE_KEY_MIN_BYTES} to {MUNGE_KEY_MAX_BYTES}"
+                )
+
+        includes = includes or {}
+        conf = None
+        try:
+            if slurm_conf is not None:
+                conf = slurm_conf_model.validate(slurm_conf)
+            for content in includes.values():
+                slurm_conf_model.validate(content, include=True)
+        except ValueError as e:
+            raise SlurmrestdManagerError(f"slurm.conf is invalid: {e}")
+
+        if dry_run and (slurm_conf is not None or includes):
+            self._dry_run_slurmrestd(slurm_conf, includes)
+        return conf
+
+    def _dry_run_slurmrestd(self, slurm_conf: Optional[str], includes: Dict[str, str]) -> None:
+        """Have slurmrestd load the candidate config and exit.
+
+        It runs as the slurmrestd user, as the service does, since it refuses
+        to run as root. Includes of /etc/slurm files read the copies next to
+        the candidate instead.
+        """
+        with TemporaryDirectory(prefix="slurmrestd-dry-run-") as tmp:
+            conf_dir = Path(tmp)
+            files = {path.name: path.read_text() for path in SLURM_CONF_DIR.glob("*.conf")}
+            if slurm_conf is not None:
+                files[SLURM_CONF_PATH.name] = slurm_conf
+            files.update({f"{name}.conf": content for name, content in includes.items()})
+            os.chown(conf_dir, SLURMRESTD_USER_UID, SLURMRESTD_GROUP_GID)
+            for name, content in files.items():
+                (conf_dir / name).write_text(_relocate_includes(content, conf_dir))
+                os.chown(conf_dir / name, SLURMRESTD_USER_UID, SLURMRESTD_GROUP_GID)
+
+            logger.debug(f"Dry running slurmrestd against {conf_dir}")
+            try:
+                # Listing the plugins makes slurmrestd read slurm.conf and exit.
+                result = subprocess.run(
+                    ["slurmrestd", "-s", "list"],
+                    env={**os.environ, "SLURM_CONF": str(conf_dir / SLURM_CONF_PATH.name)},
+                    user=SLURMRESTD_USER_NAME,
+                    group=SLURMRESTD_GROUP_NAME,
+                    extra_groups=[],
+                    capture_output=True,
+                    text=True,
+                    timeout=SLURMRESTD_DRY_RUN_TIMEOUT,
+                )
+            except (OSError, subprocess.SubprocessError) as e:
+                raise SlurmrestdManagerError(f"slurmrestd dry run failed: {e}")
+            if result.returncode != 0:
+                error = (result.stderr.strip().splitlines() or ["no output"])[-1]
+                raise SlurmrestdManagerError(f"slurmrestd rejected slurm.conf: {error}")
+
+    @traced
     def write_munge_key(self, munge_key: str) -> None:
         """Base64 decode and write the munge key."""
         MUNGE_KEY_PATH.write_bytes(b64decode(munge_key.encode()))
 
+    @traced
     def check_munged(self) -> bool:
         """Check if munge is working correctly."""
         if not systemd.service_running("munge"):
@@ -185,6 +787,7 @@ class SlurmrestdManager:
 
         return False
 
+    @traced
     def _create_slurmrestd_user_group(self) -> None:
         """Create the slurmrestd user."""
         logger.info("#### Creating slurmrestd user and group")
@@ -224,18 +827,395 @@ class SlurmrestdManager:
 
         logger.info("'{SLURMRESTD_USER_NAME}' user and '{SLURMRESTD_GROUP_NAME}' group created.")
 
+    @traced
     def stop_slurmrestd(self) -> None:
         """Stop slurmrestd service."""
         systemd.service_stop("slurmrestd")
 
+    @traced
     def start_slurmrestd(self) -> None:
         """Start slurmrestd service."""
         systemd.service_start("slurmrestd")
 
+    @traced
+    def restart_slurmrestd(self) -> None:
+        """Restart slurmrestd service."""
+        systemd.service_restart("slurmrestd")
+
+    @traced
+    def wait_slurmrestd_ready(self, timeout: float) -> bool:
+        """Return True once slurmrestd answers requests, or False after `timeout` seconds."""
+        try:
+            slurmrestd_upgrade.wait_ready(SLURMRESTD_PORT, timeout)
+        except slurmrestd_upgrade.UpgradeError as e:
+            logger.warning(f"{e}")
+            return False
+        return True
+
+    @traced
+    def slurmrestd_responds(self) -> bool:
+        """Return True if slurmrestd answers a request now."""
+        return slurmrestd_upgrade.responds(SLURMRESTD_PORT)
+
+    @traced
+    def start_slurmrestd_instance(self, port: int) -> None:
+        """Start a second slurmrestd on `port` from the slurmrestd@ template unit."""
+        target = SYSTEMD_SYSTEM_DIR / "slurmrestd@.service"
+        if not target.exists() or target.read_text() != SLURMRESTD_INSTANCE_SERVICE:
+            target.write_text(SLURMRESTD_INSTANCE_SERVICE)
+            systemd.daemon_reload()
+        systemd.service_start(f"slurmrestd@{port}")
+
+    @traced
+    def stop_slurmrestd_instance(self, port: int) -> None:
+        """Stop the slurmrestd started on `port`."""
+        systemd.service_stop(f"slurmrestd@{port}")
+
+    @traced
+    def upgrade_slurmrestd_packages(self) -> None:
+        """Upgrade slurmrestd and the Slurm plugins, leaving the running slurmrestd alone.
+
+        The package index is refreshed first. Maintainer scripts are kept from
+        restarting slurmrestd, and the charm's unit file is restored if the
+        package replaced it.
+
+        Raises:
+            SlurmrestdManagerError: if the index could not be refreshed or a package upgraded.
+        """
+        try:
+            apt.update()
+        except subprocess.CalledProcessError as e:
+            raise SlurmrestdManagerError(
+                f"apt-get update failed: {(e.stderr or b'').decode().strip()}"
+            )
+
+        guard = not POLICY_RC_D_PATH.exists()
+        if guard:
+            POLICY_RC_D_PATH.write_text(POLICY_RC_D)
+            POLICY_RC_D_PATH.chmod(0o755)
+        else:
+            logger.warning(f"{POLICY_RC_D_PATH} exists, slurmrestd may restart on upgrade.")
+        try:
+            failed = [
+                package.package_name
+                for package in (self._slurmrestd_package, self._slurm_plugins_package)
+                if not package.upgrade_to_latest()
+            ]
+        finally:
+            if guard:
+                POLICY_RC_D_PATH.unlink(missing_ok=True)
+
+        self._install_service_unit()
+        if failed:
+            raise SlurmrestdManagerError(f"could not upgrade {', '.join(failed)}")
+
+    @traced
+    def write_service_dropin(self, service: str, settings: Dict[str, str]) -> bool:
+        """Write the charm's drop-in for `service` holding `settings` if they changed.
+
+        Return True if `service` must restart for the change to apply.
+
+        Raises:
+            SlurmrestdManagerError: if a setting is unsupported or malformed.
+        """
+        try:
+            systemd_dropin.validate(settings)
+        except ValueError as e:
+            raise SlurmrestdManagerError(f"{service}.service: {e}")
+
+        target = SYSTEMD_DROPIN_DIR / f"{service}.service.d" / CHARM_DROPIN_NAME
+        try:
+            current = target.read_text()
+        except FileNotFoundError:
+            current = ""
+        rendered = systemd_dropin.render(settings, header="Managed by the slurmrestd charm.")
+        if rendered == current:
+            return False
+
+        logger.debug(f"Replacing {target}: {sorted(settings)}")
+        if rendered:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(rendered)
+        else:
+            target.unlink()
+        systemd.daemon_reload()
+        return systemd_dropin.needs_restart(systemd_dropin.parse(current), settings)
+
+    @traced
+    def write_sysctl(self, settings: Dict[str, str]) -> bool:
+        """Write and load the kernel parameters in `settings` if they changed.
+
+        Return False if loading them failed. Dropping parameters leaves their
+        current values in place until the next boot.
+        """
+        target = SYSCTL_CONF_PATH
+        rendered = "".join(f"{key} = {value}\n" for key, value in sorted(settings.items()))
+        if rendered:
+            rendered = "# Managed by the slurmrestd charm.\n" + rendered
+        try:
+            current = target.read_text()
+        except FileNotFoundError:
+            current = ""
+        if rendered == current:
+            return True
+        if not rendered:
+            target.unlink()
+            return True
+
+        logger.debug(f"Replacing {target}: {sorted(settings)}")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(rendered)
+        try:
+            subprocess.run(
+                ["sysctl", "--load", str(target)], capture_output=True, text=True, check=True
+            )
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Loading {target} failed: {e.stderr.strip()}")
+            # Try again on the next call.
+            target.unlink()
+            return False
+        return True
+
+    def sysctl_drift(self, settings: Dict[str, str]) -> Dict[str, str]:
+        """Return the current value of each kernel parameter in `settings` that differs."""
+        drift = {}
+        for key, want in settings.items():
+            try:
+                have = (PROC_SYS_DIR / key.replace(".", "/")).read_text().split()
+            except OSError:
+                have = ["unknown"]
+            if have != want.split():
+                drift[key] = " ".join(have)
+        return drift
+
+    def numa_placement(self, preference: str) -> Dict[str, str]:
+        """Return unit settings binding a daemon to the CPUs and memory of one NUMA node.
+
+        `preference` is "auto" or a node id, see `numa_topology.choose_node`.
+        Nothing is bound on a host with a single node and "auto".
+
+        Raises:
+            SlurmrestdManagerError: if `preference` names no usable node.
+        """
+        nodes = numa_topology.read_topology(NUMA_NODE_DIR)
+        try:
+            node = numa_topology.choose_node(nodes, preference)
+        except ValueError as e:
+            raise SlurmrestdManagerError(f"NUMA placement: {e}")
+        if node is None:
+            logger.debug(f"Not binding to a NUMA node, {len(nodes)} node(s) found.")
+            return {}
+
+        logger.debug(f"Binding to NUMA node {node.id}, {node.mem_free_kb} kB free.")
+        return {
+            "CPUAffinity": numa_topology.format_cpulist(node.cpus),
+            "NUMAPolicy": "bind",
+            "NUMAMask": str(node.id),
+        }
+
+    def cpus_within(self, placement: Dict[str, str], cpu_affinity: str) -> str:
+        """Return the CPUs of `cpu_affinity` that lie on the NUMA node of `placement`.
+
+        Raises:
+            SlurmrestdManagerError: if `cpu_affinity` is malformed or has no CPU on the node.
+        """
+        try:
+            wanted = numa_topology.parse_cpulist(cpu_affinity.replace(" ", ","))
+        except ValueError:
+            raise SlurmrestdManagerError(f"invalid CPUAffinity '{cpu_affinity}'")
+        allowed = numa_topology.parse_cpulist(placement["CPUAffinity"])
+        if not (cpus := set(wanted) & set(allowed)):
+            raise SlurmrestdManagerError(
+                f"cpu-affinity {cpu_affinity} has no CPUs on NUMA node {placement['NUMAMask']}"
+            )
+        return numa_topology.format_cpulist(tuple(cpus))
+
+    @traced
+    def restart_munge(self) -> bool:
+        """Restart munge, returning True if munged works afterwards."""
+        self.stop_munge()
+        return self.start_munge()
+
+    @traced
+    def reload_slurmrestd(self) -> None:
+        """Reload slurmrestd so it rereads slurm.conf and its includes."""
+        systemd.service_reload("slurmrestd")
+
+    @traced
+    def write_exporter_service(self, exporter: Path, port: int) -> bool:
+        """Render the slurmrestd-exporter unit to run `exporter` on `port`.
+
+        Return True if the unit changed and the exporter needs a restart.
+        """
+        target = SYSTEMD_SYSTEM_DIR / "slurmrestd-exporter.service"
+        content = SLURMRESTD_EXPORTER_SERVICE.format(
+            exporter=exporter, port=port, state_dir=SLURMRESTD_EXPORTER_STATE_DIR
+        )
+        if target.exists() and target.read_text() == content:
+            return False
+
+        logger.debug("Replacing slurmrestd-exporter.service")
+        target.write_text(content)
+        systemd.daemon_reload()
+        return True
+
+    @traced
+    def restart_exporter(self) -> None:
+        """Enable and (re)start the slurmrestd-exporter service."""
+        systemd.service_enable("slurmrestd-exporter")
+        systemd.service_restart("slurmrestd-exporter")
+
+    def _package_cache_versions(self) -> Dict[str, str]:
+        """Return the installed versions of the slurm packages and the dependencies peers lack.
+
+        Dependencies are followed recursively, leaving out base system packages.
+        """
+        packages = [
+            package.package_name
+            for package in (
+                self._slurmrestd_package,
+                self._munge_package,
+                self._slurm_plugins_package,
+            )
+        ]
+        result = subprocess.run(
+            [
+                "apt-cache",
+                "depends",
+                "--recurse",
+                "--installed",
+                *(f"--no-{kind}" for kind in ("recommends", "suggests", "conflicts", "breaks")),
+                *(f"--no-{kind}" for kind in ("replaces", "enhances")),
+                *packages,
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        # Package names start a line, their dependencies are indented below them.
+        names = {line for line in result.stdout.splitlines() if line and line[0].isalnum()}
+        result = subprocess.run(
+            [
+                "dpkg-query",
+                "--show",
+                "--showformat=${Package} ${Version} ${Priority}\n",
+                *sorted(names | set(packages)),
+            ],
+            capture_output=True,
+            text=True,
+        )
+        versions = {}
+        for line in result.stdout.splitlines():
+            name, version, priority = (line.split() + ["", ""])[:3]
+            if name in packages or priority not in PACKAGE_CACHE_BASE_PRIORITIES:
+                versions[name] = version
+        return versions
+
+    @traced
+    def build_package_cache(self) -> Optional[str]:
+        """Bundle the installed slurm packages into the cache tarball peers install from.
+
+        A tarball already holding the installed versions is kept. Otherwise
+        the packages are taken from apt's archive cache, and only those
+        missing there are downloaded again at the installed versions. Return
+        the sha256 of the tarball, or None if there is no tarball to pass on.
+        """
+        tarball = PACKAGE_CACHE_DIR / PACKAGE_CACHE_TARBALL
+        try:
+            versions = self._package_cache_versions()
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning(f"Could not list packages to share with peers: {e}")
+            versions = {}
+        if tarball.exists() and (not versions or _tarball_versions(tarball) == versions):
+            # Up to date, or installed from a peer's cache or local .debs and passed on as is.
+            return _file_sha256(tarball)
+        if not versions:
+            return None
+
+        shutil.rmtree(PACKAGE_CACHE_DOWNLOAD_DIR, ignore_errors=True)
+        (PACKAGE_CACHE_DOWNLOAD_DIR / "partial").mkdir(parents=True)
+        missing = dict(versions)
+        for deb in APT_ARCHIVES_DIR.glob("*.deb"):
+            name, version = _deb_version(deb.name)
+            if missing.get(name) == version:
+                shutil.copy(deb, PACKAGE_CACHE_DOWNLOAD_DIR)
+                del missing[name]
+        try:
+            if missing:
+                self._download_packages(missing)
+        except (OSError, subprocess.CalledProcessError) as e:
+            shutil.rmtree(PACKAGE_CACHE_DOWNLOAD_DIR, ignore_errors=True)
+            if tarball.exists():
+                return _file_sha256(tarball)
+            logger.warning(f"Could not download packages to share with peers: {e}")
+            return None
+
+        if not (debs := sorted(PACKAGE_CACHE_DOWNLOAD_DIR.glob("*.deb"))):
+            logger.debug("apt downloaded no packages to share with peers.")
+            return None
+        PACKAGE_CACHE_DIR.mkdir(mode=0o755, parents=True, exist_ok=True)
+        checksum = _write_debs_tarball(debs, tarball)
+        shutil.rmtree(PACKAGE_CACHE_DOWNLOAD_DIR, ignore_errors=True)
+        logger.debug(
+            f"Bundled {len(debs)} packages into {PACKAGE_CACHE_TARBALL}, "
+            f"{len(missing)} downloaded again."
+        )
+        return checksum
+
+    def _download_packages(self, versions: Dict[str, str]) -> None:
+        """Download the packages at `versions` to the package cache download dir."""
+        subprocess.run(
+            [
+                "apt-get",
+                "install",
+                "--download-only",
+                "--reinstall",
+                "--yes",
+                "--no-install-recommends",
+                "-o",
+                f"Dir::Cache::archives={PACKAGE_CACHE_DOWNLOAD_DIR}",
+                *(f"{name}={version}" for name, version in sorted(versions.items())),
+            ],
+            env={**os.environ, "DEBIAN_FRONTEND": "noninteractive"},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+    @traced
+    def serve_package_cache(self, address: str, port: int) -> None:
+        """Serve the package cache directory over HTTP on `address`:`port`."""
+        target = SYSTEMD_SYSTEM_DIR / "slurmrestd-package-cache.service"
+        target.write_text(
+            PACKAGE_CACHE_SERVICE.format(address=address, directory=PACKAGE_CACHE_DIR, port=port)
+        )
+        systemd.daemon_reload()
+        systemd.service_enable("slurmrestd-package-cache")
+        systemd.service_restart("slurmrestd-package-cache")
+
+    @traced
+    def fetch_package_cache(self, url: str, checksum: str) -> Optional[Path]:
+        """Download the tarball a peer serves at `url`, returning None unless it matches `checksum`."""
+        PACKAGE_CACHE_DIR.mkdir(mode=0o755, parents=True, exist_ok=True)
+        target = PACKAGE_CACHE_DIR / PACKAGE_CACHE_TARBALL
+        try:
+            with urllib.request.urlopen(url, timeout=60) as response, open(target, "wb") as f:
+                shutil.copyfileobj(response, f, 1 << 20)
+        except OSError as e:
+            logger.warning(f"Could not fetch package cache from {url}: {e}")
+            return None
+        if _file_sha256(target) != checksum:
+            logger.warning(f"Package cache from {url} does not match its checksum.")
+            target.unlink(missing_ok=True)
+            return None
+        return target
+
+    @traced
     def stop_munge(self) -> None:
         """Stop munge."""
         systemd.service_stop("munge")
 
+    @traced
     def start_munge(self) -> bool:
         """Start the munge process.
 
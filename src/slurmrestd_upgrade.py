@@ -0,0 +1,199 @@
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+"""Blue/green upgrade of slurmrestd without taking the API down.
+
+The upgraded slurmrestd is first started as a second instance on an alternate
+port. Once it answers, an nftables redirect atomically sends new connections
+for the main port to it while the main instance restarts onto the new
+packages. The redirect is then dropped again in one transaction and the
+second instance retired after in-flight requests drained.
+
+A probe thread connects to the main port throughout and reports the longest
+stretch during which clients could not get a response: the cut-over gap.
+"""
+
+import http.client
+import logging
+import socket
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from constants import (
+    SLURMRESTD_ALT_PORT,
+    SLURMRESTD_PORT,
+    SLURMRESTD_PROBE_MARK,
+    SLURMRESTD_REDIRECT_TABLE,
+)
+
+logger = logging.getLogger()
+
+# Seconds to keep the alternate instance up for requests it already accepted.
+DRAIN_SECONDS = 2.0
+
+
+class UpgradeError(Exception):
+    """Raised when the upgrade is aborted, with the main instance left serving."""
+
+
+class _MarkedConnection(http.client.HTTPConnection):
+    """HTTP connection whose packets carry a firewall mark, exempting them from the redirect."""
+
+    def __init__(self, *args, mark: Optional[int] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._mark = mark
+
+    def connect(self) -> None:
+        """Connect, setting SO_MARK first if a mark was given."""
+        if self._mark is None:
+            super().connect()
+            return
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_MARK, self._mark)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect((self.host, self.port))
+
+
+def responds(port: int, timeout: float = 1.0, mark: Optional[int] = None) -> bool:
+    """Return True if an HTTP server on localhost `port` answers a request, with any status."""
+    conn = _MarkedConnection("127.0.0.1", port, timeout=timeout, mark=mark)
+    try:
+        conn.request("GET", "/openapi/v3")
+        conn.getresponse().read()
+        return True
+    except (OSError, http.client.HTTPException):
+        return False
+    finally:
+        conn.close()
+
+
+def wait_ready(port: int, timeout: float, mark: Optional[int] = None) -> float:
+    """Wait for slurmrestd on `port` to answer, returning how long it took in seconds.
+
+    Raises:
+        UpgradeError: if it does not answer within `timeout` seconds.
+    """
+    start = time.monotonic()
+    while not responds(port, mark=mark):
+        if time.monotonic() - start > timeout:
+            raise UpgradeError(f"slurmrestd on port {port} not ready after {timeout:.0f}s")
+        time.sleep(0.1)
+    return time.monotonic() - start
+
+
+def _nft(ruleset: str) -> None:
+    """Apply `ruleset` in a single nftables transaction."""
+    try:
+        subprocess.run(
+            ["nft", "-f", "-"], input=ruleset, text=True, capture_output=True, check=True
+        )
+    except FileNotFoundError:
+        raise UpgradeError("nft is needed to switch slurmrestd listeners")
+    except subprocess.CalledProcessError as e:
+        raise UpgradeError(f"nft failed: {e.stderr.strip()}")
+
+
+def redirect(from_port: int, to_port: int) -> None:
+    """Send new connections for `from_port` to `to_port`, except those marked for probing."""
+    table = SLURMRESTD_REDIRECT_TABLE
+    _nft(
+        f"table inet {table}\n"
+        f"delete table inet {table}\n"
+        f"table inet {table} {{\n"
+        "  chain prerouting {\n"
+        "    type nat hook prerouting priority dstnat;\n"
+        f"    tcp dport {from_port} redirect to :{to_port}\n"
+        "  }\n"
+        "  chain output {\n"
+        "    type nat hook output priority -100;\n"
+        f"    meta mark != {SLURMRESTD_PROBE_MARK} tcp dport {from_port} redirect to :{to_port}\n"
+        "  }\n"
+        "}\n"
+    )
+
+
+def clear_redirect() -> None:
+    """Remove the redirect, if any."""
+    table = SLURMRESTD_REDIRECT_TABLE
+    _nft(f"table inet {table}\ndelete table inet {table}\n")
+
+
+class GapProbe:
+    """Measure the longest stretch a port stops answering while the probe runs."""
+
+    def __init__(self, port: int, interval: float = 0.01):
+        self._port = port
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.failures = 0
+        self.max_gap = 0.0
+
+    def _run(self) -> None:
+        down_since = None
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if responds(self._port, timeout=0.5):
+                down_since = None
+            else:
+                self.failures += 1
+                down_since = now if down_since is None else down_since
+                self.max_gap = max(self.max_gap, time.monotonic() - down_since)
+            self._stop.wait(self._interval)
+
+    def __enter__(self) -> "GapProbe":
+        """Start probing."""
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        """Stop probing."""
+        self._stop.set()
+        self._thread.join()
+
+
+def blue_green_upgrade(manager, ready_timeout: float, log: Callable[[str], None]) -> Dict:
+    """Upgrade slurmrestd through an alternate instance, returning versions and timings.
+
+    Raises:
+        UpgradeError: if slurmrestd is not serving, there is no newer version,
+            the upgraded slurmrestd does not become ready, or listeners cannot
+            be switched.
+        SlurmrestdManagerError: if the packages could not be upgraded.
+    """
+    if not responds(SLURMRESTD_PORT, mark=SLURMRESTD_PROBE_MARK):
+        raise UpgradeError(f"slurmrestd is not serving on port {SLURMRESTD_PORT}")
+    # Fail before touching packages if nftables is unusable.
+    clear_redirect()
+
+    old_version = manager.version()
+    with GapProbe(SLURMRESTD_PORT) as probe:
+        log("Upgrading packages, slurmrestd keeps serving")
+        manager.upgrade_slurmrestd_packages()
+        if (new_version := manager.version()) == old_version:
+            raise UpgradeError(f"slurmrestd {old_version} is already the latest version")
+
+        log(f"Starting slurmrestd {new_version} on port {SLURMRESTD_ALT_PORT}")
+        manager.start_slurmrestd_instance(SLURMRESTD_ALT_PORT)
+        try:
+            alt_ready = wait_ready(SLURMRESTD_ALT_PORT, ready_timeout)
+            redirect(SLURMRESTD_PORT, SLURMRESTD_ALT_PORT)
+            log(f"Switched port {SLURMRESTD_PORT} to {SLURMRESTD_ALT_PORT}, restarting slurmrestd")
+            manager.restart_slurmrestd()
+            main_ready = wait_ready(SLURMRESTD_PORT, ready_timeout, mark=SLURMRESTD_PROBE_MARK)
+        finally:
+            # Always fall back to the main instance, upgraded or not.
+            clear_redirect()
+            time.sleep(DRAIN_SECONDS)
+            manager.stop_slurmrestd_instance(SLURMRESTD_ALT_PORT)
+        log(f"Switched port {SLURMRESTD_PORT} back, retired port {SLURMRESTD_ALT_PORT}")
+
+    return {
+        "old_version": old_version,
+        "new_version": new_version,
+        "alt_ready_s": alt_ready,
+        "main_ready_s": main_ready,
+        "cutover_gap_ms": probe.max_gap * 1000,
+        "probe_failures": probe.failures,
+    }
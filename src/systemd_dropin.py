@@ -0,0 +1,76 @@
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+"""Render and compare systemd drop-ins holding `[Service]` settings.
+
+Only plain `Key=Value` lines in a single `[Service]` section are handled, which
+is all the drop-ins the charm writes contain.
+"""
+
+import re
+from typing import Dict, Mapping
+
+# Accepted values per setting, see systemd.resource-control(5) and systemd.exec(5).
+_RANGES = r"[0-9]+(-[0-9]+)?([ ,][0-9]+(-[0-9]+)?)*"
+_BYTES = r"[0-9]+[KMGT]?|[0-9]+(\.[0-9]+)?%|infinity"
+VALUES = {
+    "CPUAffinity": re.compile(_RANGES),
+    "CPUWeight": re.compile(r"[0-9]+|idle"),
+    "MemoryHigh": re.compile(_BYTES),
+    "MemoryMax": re.compile(_BYTES),
+    "LimitNOFILE": re.compile(r"[0-9]+(:[0-9]+)?|infinity"),
+    "TasksMax": re.compile(r"[0-9]+%?|infinity"),
+    "Nice": re.compile(r"-?[0-9]+"),
+    "NUMAPolicy": re.compile(r"default|preferred|bind|interleave|local"),
+    "NUMAMask": re.compile(_RANGES),
+}
+BOUNDS = {
+    "CPUWeight": (1, 10000),
+    "Nice": (-20, 19),
+}
+
+# Settings only applied when the service starts. The others are cgroup
+# attributes systemd updates in place on daemon-reload.
+RESTART_SETTINGS = frozenset({"CPUAffinity", "LimitNOFILE", "Nice", "NUMAPolicy", "NUMAMask"})
+
+
+def validate(settings: Mapping[str, str]) -> None:
+    """Check `settings` are supported and well formed.
+
+    Raises:
+        ValueError: naming the first setting with a bad value.
+    """
+    for key, value in settings.items():
+        if key not in VALUES:
+            raise ValueError(f"unsupported setting {key}")
+        if not VALUES[key].fullmatch(value):
+            raise ValueError(f"invalid {key} '{value}'")
+        if key in BOUNDS and value.lstrip("-").isdigit():
+            low, high = BOUNDS[key]
+            if not low <= int(value) <= high:
+                raise ValueError(f"{key} must be between {low} and {high}")
+
+
+def render(settings: Mapping[str, str], header: str = "") -> str:
+    """Return a drop-in setting `settings` under `[Service]`, or "" if there are none."""
+    if not settings:
+        return ""
+    lines = [f"# {line}".rstrip() for line in header.splitlines()]
+    lines.append("[Service]")
+    lines.extend(f"{key}={value}" for key, value in sorted(settings.items()))
+    return "\n".join(lines) + "\n"
+
+
+def parse(text: str) -> Dict[str, str]:
+    """Return the `Key=Value` settings of a drop-in written by `render`."""
+    settings = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith(("#", "[")) and "=" in line:
+            key, value = line.split("=", 1)
+            settings[key.strip()] = value.strip()
+    return settings
+
+
+def needs_restart(old: Mapping[str, str], new: Mapping[str, str]) -> bool:
+    """Return True if going from `old` to `new` settings only applies on a restart."""
+    return any(old.get(key) != new.get(key) for key in RESTART_SETTINGS)
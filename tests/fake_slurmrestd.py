@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Stand-in slurmrestd server for offline load and regression testing.
+
+Serves the read-mostly slurmrestd OpenAPI paths from synthetic jobs, nodes and
+partitions datasets of configurable size, with injectable latency and error
+rate. Response bodies are serialized once up front so the server itself stays
+cheap and the numbers measured against it reflect the client under test.
+
+Run it standalone on a laptop:
+
+    python3 tests/fake_slurmrestd.py --port 6820 --jobs 50000 --nodes 2000 --latency-ms 5
+
+or drive the charm's benchmark against it in one go:
+
+    PYTHONPATH=src python3 tests/fake_slurmrestd.py --benchmark 1,2,4,8,16
+"""
+
+import argparse
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger()
+
+_JOB_STATES = ("RUNNING", "PENDING", "COMPLETED", "FAILED", "CANCELLED")
+_NODE_STATES = ("IDLE", "ALLOCATED", "MIXED", "DOWN", "DRAIN")
+
+
+def _meta(version: str) -> Dict:
+    return {
+        "plugin": {"type": "openapi/fake", "name": "Fake slurmrestd"},
+        "Slurm": {"version": {"major": 23, "micro": 0, "minor": 2}, "release": "23.02.0"},
+        "version": version,
+    }
+
+
+def _synthetic_nodes(count: int, partitions: int, rng: random.Random):
+    return [
+        {
+            "name": f"compute-{i}",
+            "hostname": f"compute-{i}",
+            "address": f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+            "state": [rng.choice(_NODE_STATES)],
+            "cpus": 64,
+            "real_memory": 256000,
+            "partitions": [f"part-{i % partitions}"],
+        }
+        for i in range(count)
+    ]
+
+
+def _synthetic_jobs(count: int, nodes: int, partitions: int, rng: random.Random):
+    return [
+        {
+            "job_id": 1000 + i,
+            "name": f"job-{i}",
+            "user_name": f"user{i % 97}",
+            "partition": f"part-{i % partitions}",
+            "job_state": [rng.choice(_JOB_STATES)],
+            "nodes": f"compute-{rng.randrange(max(nodes, 1))}",
+            "submit_time": {"set": True, "number": 1700000000 + i},
+        }
+        for i in range(count)
+    ]
+
+
+class FakeSlurmrestd:
+    """Threaded HTTP server mimicking slurmrestd's OpenAPI surface."""
+
+    def __init__(
+        self,
+        jobs: int = 1000,
+        nodes: int = 100,
+        partitions: int = 4,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        version: str = "v0.0.39",
+        require_auth: bool = False,
+        access_log: bool = False,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.version = version
+        self.require_auth = require_auth
+        self.access_log = access_log
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._next_job_id = 1000 + jobs
+        self._lock = threading.Lock()
+
+        node_list = _synthetic_nodes(nodes, partitions, self._rng)
+        job_list = _synthetic_jobs(jobs, nodes, partitions, self._rng)
+        partition_list = [
+            {"name": f"part-{p}", "nodes": {"total": len(node_list[p::partitions])}}
+            for p in range(partitions)
+        ]
+        self._static = {
+            f"/slurm/{version}/ping": self._encode(
+                {"pings": [{"hostname": "slurmctld", "pinged": "UP", "latency": 100}]}
+            ),
+            f"/slurm/{version}/diag": self._encode({"statistics": {"server_thread_count": 1}}),
+            f"/slurm/{version}/jobs": self._encode({"jobs": job_list}),
+            f"/slurm/{version}/nodes": self._encode({"nodes": node_list}),
+            f"/slurm/{version}/partitions": self._encode({"partitions": partition_list}),
+        }
+        self._items = {
+            "job": {str(job["job_id"]): self._encode({"jobs": [job]}) for job in job_list},
+            "node": {node["name"]: self._encode({"nodes": [node]}) for node in node_list},
+            "partition": {p["name"]: self._encode({"partitions": [p]}) for p in partition_list},
+        }
+        self._static["/openapi/v3"] = json.dumps(
+            {
+                "openapi": "3.0.2",
+                "info": {"title": "Fake slurmrestd", "version": version},
+                "paths": {
+                    **{path: {"get": {}} for path in self._static},
+                    **{f"/slurm/{version}/{kind}/{{name}}": {"get": {}} for kind in self._items},
+                    f"/slurm/{version}/job/submit": {"post": {}},
+                },
+            }
+        ).encode()
+        self._item_re = re.compile(rf"^/slurm/{re.escape(version)}/(job|node|partition)/([^/]+)$")
+
+    def _encode(self, payload: Dict) -> bytes:
+        return json.dumps({"meta": _meta(self.version), "errors": [], **payload}).encode()
+
+    @property
+    def url(self) -> str:
+        """Return the base URL the server is listening on."""
+        if self._server is None:
+            raise RuntimeError("fake slurmrestd is not running")
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle(self, method: str, path: str, headers) -> Tuple[int, bytes]:
+        """Return the (status, body) for a request, after the injected latency."""
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            fail = self.error_rate and self._rng.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return 500, self._encode({"errors": [{"error": "injected failure"}]})
+        if self.require_auth and not (
+            headers.get("X-SLURM-USER-NAME") and headers.get("X-SLURM-USER-TOKEN")
+        ):
+            return 401, b"Authentication failure"
+
+        path = path.split("?", 1)[0]
+        if method == "GET":
+            if (body := self._static.get(path)) is not None:
+                return 200, body
+            if match := self._item_re.match(path):
+                if (body := self._items[match[1]].get(match[2])) is not None:
+                    return 200, body
+        elif method == "POST" and path == f"/slurm/{self.version}/job/submit":
+            with self._lock:
+                job_id, self._next_job_id = self._next_job_id, self._next_job_id + 1
+            return 200, self._encode({"job_id": job_id, "step_id": "batch"})
+        return 404, self._encode({"errors": [{"error": f"Unable to find path {path}"}]})
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving from a background thread and return the base URL."""
+        fake = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                conn = f"[{self.client_address[0]}]:{self.client_address[1]}"
+                if fake.access_log:
+                    logger.info(f"operations_router: [{conn}] {self.command} {self.path}")
+                status, body = fake.handle(self.command, self.path, self.headers)
+                if fake.access_log:
+                    logger.info(f"_send_reply: [{conn}] sending {status} response")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = do_DELETE = _respond  # noqa: N815
+
+            def log_message(self, *_):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        threading.Thread(
+            target=self._server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        ).start()
+        return self.url
+
+    def stop(self) -> None:
+        """Stop serving."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeSlurmrestd":
+        """Start serving on an ephemeral port."""
+        self.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        """Stop serving."""
+        self.stop()
+
+
+def main() -> None:
+    """Serve a fake slurmrestd, or benchmark one with the charm's load generator."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6820)
+    parser.add_argument("--jobs", type=int, default=1000)
+    parser.add_argument("--nodes", type=int, default=100)
+    parser.add_argument("--partitions", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--access-log", action="store_true")
+    parser.add_argument("--benchmark", metavar="RAMP", help="e.g. 1,2,4,8; runs and exits")
+    parser.add_argument("--benchmark-path", default="/slurm/v0.0.39/jobs")
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="slurmrestd: %(message)s")
+    fake = FakeSlurmrestd(
+        jobs=args.jobs,
+        nodes=args.nodes,
+        partitions=args.partitions,
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        error_rate=args.error_rate,
+        access_log=args.access_log,
+    )
+    url = fake.start(args.host, 0 if args.benchmark else args.port)
+    logger.info(f"fake slurmrestd listening on {url}")
+
+    if args.benchmark:
+        from slurmrestd_benchmark import parse_ramp, run
+
+        result = run(url, args.benchmark_path, parse_ramp(args.benchmark), args.duration)
+        print(json.dumps(result, indent=2))
+        fake.stop()
+        return
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Fake system sandbox for running SlurmrestdManager end to end, offline.
+
+`FakeSystem` builds a throwaway filesystem root with fake `apt-get`,
+`apt-cache`, `dpkg`, `dpkg-query`, `systemctl`, `munge`, `unmunge`, `groupadd` and `adduser`
+executables on PATH. The absolute paths used by the charm modules and the
+vendored apt library are remapped under that root, so `SlurmrestdManager` and
+the apt/systemd libs run unmodified, forking real (fake) processes.
+
+Every fake command can be given a latency and appends itself to a timeline,
+which makes whole-hook timelines such as install or a config apply
+measurable on a laptop:
+
+    PYTHONPATH=src:lib python3 tests/fake_system.py --latency apt-get=0.5 --latency dpkg=0.05
+"""
+
+import argparse
+import fcntl
+import glob
+import importlib
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterable, List, Optional
+
+# `unittest.mock` is imported lazily: the shims import this module on every
+# fake command and should start as fast as the tools they stand in for.
+
+FAKE_COMMANDS = (
+    "adduser",
+    "apt-cache",
+    "apt-get",
+    "dpkg",
+    "dpkg-query",
+    "groupadd",
+    "munge",
+    "systemctl",
+    "unmunge",
+)
+
+DEFAULT_PACKAGES = {
+    "munge": "0.5.14-6",
+    "slurm-wlm-basic-plugins": "23.02.6-1ubuntu1~ppa1",
+    "slurmrestd": "23.02.6-1ubuntu1~ppa1",
+}
+
+# Directories present on a stock Ubuntu image.
+BASE_LAYOUT = (
+    "etc/apt/sources.list.d",
+    "etc/default",
+    "etc/systemd/system",
+    "usr/lib/systemd/system",
+    "usr/share/keyrings",
+    "var/cache/apt/archives",
+    "var/lib",
+    "var/log",
+)
+
+_DPKG_HEADER = """\
+Desired=Unknown/Install/Remove/Purge/Hold
+| Status=Not/Inst/Conf-files/Unpacked/halF-conf/Half-inst/trig-aWait/Trig-pend
+|/ Err?=(none)/Reinst-required (Status,Err: uppercase=bad)
+||/ Name           Version      Architecture Description
++++-==============-============-============-=================================
+"""
+
+# Files a package drops on install that later charm steps rely on.
+_PACKAGE_FILES = {
+    "munge": ["etc/munge/", "usr/bin/munge", "usr/sbin/munged"],
+    "slurmrestd": ["usr/sbin/slurmrestd", "usr/lib/systemd/system/slurmrestd.service"],
+    "slurm-wlm-basic-plugins": ["usr/lib/x86_64-linux-gnu/slurm-wlm/"],
+}
+
+
+# ---------------------------------------------------------------------------
+# Fake command implementations, run inside the shim processes.
+# ---------------------------------------------------------------------------
+
+
+@contextmanager
+def _locked_state(root: Path):
+    state_file = root / "var/lib/fake-system/state.json"
+    with open(state_file, "r+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        state = json.load(f)
+        yield state
+        f.seek(0)
+        f.truncate()
+        json.dump(state, f)
+
+
+def _install(root: Path, state: Dict, name: str) -> None:
+    state["installed"][name] = state["available"][name]
+    for path in _PACKAGE_FILES.get(name, []):
+        target = root / path
+        if path.endswith("/"):
+            target.mkdir(parents=True, exist_ok=True)
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.touch()
+
+
+def _apt_get(root: Path, state: Dict, args: List[str]) -> int:
+    download_only = "--download-only" in args
+    args = [a for a in args if not a.startswith("-")]
+    command, packages = args[0], args[1:]
+    if command == "update":
+        state["updated"] = True
+        return 0
+    for spec in packages:
+        name = spec.split("=", 1)[0]
+        if command == "install":
+            if not state["updated"] or name not in state["available"]:
+                print(f"E: Unable to locate package {name}", file=sys.stderr)
+                return 100
+            if not download_only:
+                _install(root, state, name)
+        elif command in ("remove", "purge"):
+            state["installed"].pop(name, None)
+    return 0
+
+
+def _apt_cache(state: Dict, args: List[str]) -> int:
+    if args[:1] != ["show"] or not state["updated"]:
+        print("E: No packages found", file=sys.stderr)
+        return 100
+    stanzas = [
+        f"Package: {name}\nArchitecture: amd64\nVersion: {state['available'][name]}\n"
+        for name in args[1:]
+        if name in state["available"]
+    ]
+    if not stanzas:
+        print("E: No packages found", file=sys.stderr)
+        return 100
+    print("\n".join(stanzas))
+    return 0
+
+
+def _dpkg(root: Path, state: Dict, args: List[str]) -> int:
+    if args[:1] in (["-i"], ["--install"]):
+        # Local .deb files are named `<package>_<version>_<arch>.deb`.
+        for deb in args[1:]:
+            name, version = PurePosixPath(deb).name.split("_")[:2]
+            state["available"].setdefault(name, version)
+            _install(root, state, name)
+            state["installed"][name] = version
+        return 0
+    if args == ["--print-architecture"]:
+        print("amd64")
+        return 0
+    if args[:1] == ["-l"]:
+        rows = [
+            f"ii  {name:<14} {state['installed'][name]:<12} amd64        fake package"
+            for name in args[1:]
+            if name in state["installed"]
+        ]
+        if not rows:
+            print(f"dpkg-query: no packages found matching {' '.join(args[1:])}", file=sys.stderr)
+            return 1
+        print(_DPKG_HEADER + "\n".join(rows))
+        return 0
+    return 0
+
+
+def _dpkg_query(state: Dict, args: List[str]) -> int:
+    fmt = next(a.split("=", 1)[1] for a in args if a.startswith("--showformat="))
+    names = [a for a in args if not a.startswith("-")]
+    for name in names:
+        if name in state["installed"]:
+            line = fmt.replace("${Package}", name).replace("${Version}", state["installed"][name])
+            print(line.replace("${db:Status-Status}", "installed").replace("\\n", "\n"), end="")
+        else:
+            print(f"dpkg-query: no packages found matching {name}", file=sys.stderr)
+    return 0 if all(name in state["installed"] for name in names) else 1
+
+
+def _systemctl(state: Dict, args: List[str]) -> int:
+    args = [a for a in args if not a.startswith("-")]
+    verb, units = args[0], args[1:]
+    services = state["services"]
+    if verb == "daemon-reload":
+        state["daemon_reloads"] += 1
+        return 0
+    if verb == "is-active":
+        return 0 if all(services.get(u) == "active" for u in units) else 3
+    if verb == "is-failed":
+        return 0 if all(services.get(u) == "failed" for u in units) else 1
+    for unit in units:
+        if verb in ("start", "restart", "reload", "try-restart"):
+            services[unit] = "active"
+            state["restarts"].append(unit)
+        elif verb == "stop":
+            services[unit] = "inactive"
+        elif verb == "enable":
+            state["enabled"] = sorted(set(state["enabled"]) | {unit})
+        elif verb == "disable":
+            state["enabled"] = sorted(set(state["enabled"]) - {unit})
+    return 0
+
+
+def _munge(root: Path, state: Dict, name: str) -> int:
+    if name == "munge":
+        print("MUNGE:fake-credential:")
+        return 0
+    if state["services"].get("munge") == "active" and (root / "etc/munge/munge.key").exists():
+        print("STATUS:          Success (0)")
+        return 0
+    print("STATUS:          Socket communication error (2)")
+    return 2
+
+
+def _accounts(root: Path, state: Dict, name: str, args: List[str]) -> int:
+    account = args[-1]
+    table = state["groups"] if name == "groupadd" else state["users"]
+    if account in table:
+        print(f"{name}: '{account}' already exists", file=sys.stderr)
+        return 9
+    table.append(account)
+    ids = dict(zip(args, args[1:]))
+    if name == "groupadd":
+        entry = f"{account}:x:{ids['--gid']}:\n"
+        db = root / "etc/group"
+    else:
+        entry = f"{account}:x:{ids['--uid']}:{ids['--gid']}::/nonexistent:/usr/sbin/nologin\n"
+        db = root / "etc/passwd"
+    with open(db, "a") as f:
+        f.write(entry)
+    return 0
+
+
+def run_fake_command(root, name: str, args: List[str]) -> int:
+    """Emulate `name` against the sandbox state under `root`."""
+    root = Path(root)
+    latency = json.loads((root / "var/lib/fake-system/latency.json").read_text())
+    start = time.time()
+    time.sleep(latency.get(name, 0.0))
+    if name == "unmunge":
+        # Drain stdin before taking the state lock, `munge` may still hold it.
+        sys.stdin.read()
+    with _locked_state(root) as state:
+        if name == "apt-get":
+            rc = _apt_get(root, state, args)
+        elif name == "apt-cache":
+            rc = _apt_cache(state, args)
+        elif name == "dpkg":
+            rc = _dpkg(root, state, args)
+        elif name == "dpkg-query":
+            rc = _dpkg_query(state, args)
+        elif name == "systemctl":
+            rc = _systemctl(state, args)
+        elif name in ("munge", "unmunge"):
+            rc = _munge(root, state, name)
+        else:
+            rc = _accounts(root, state, name, args)
+    with open(root / "var/log/fake-system.jsonl", "a") as log:
+        entry = {"cmd": name, "args": args, "rc": rc, "start": start, "end": time.time()}
+        log.write(json.dumps(entry) + "\n")
+    return rc
+
+
+# ---------------------------------------------------------------------------
+# Sandbox setup, used in-process by tests and benchmarks.
+# ---------------------------------------------------------------------------
+
+
+class FakeSystem:
+    """Throwaway filesystem root with fake system tools on PATH."""
+
+    def __init__(
+        self,
+        root: Path,
+        latency: Optional[Dict[str, float]] = None,
+        packages: Optional[Dict[str, str]] = None,
+        installed: Iterable[str] = (),
+        modules: Iterable[str] = ("slurmrestd_ops",),
+    ):
+        self.root = Path(root)
+        self.latency = latency or {}
+        self.packages = dict(packages or DEFAULT_PACKAGES)
+        self.installed = list(installed)
+        self.modules = list(modules)
+        self._patches = []
+
+    def path(self, path) -> Path:
+        """Return where the absolute `path` lives inside the sandbox."""
+        return self.root / str(path).lstrip("/")
+
+    def _write_state(self) -> None:
+        state_dir = self.path("/var/lib/fake-system")
+        state_dir.mkdir(parents=True, exist_ok=True)
+        state = {
+            "available": self.packages,
+            "installed": {},
+            "updated": False,
+            "services": {},
+            "enabled": [],
+            "restarts": [],
+            "daemon_reloads": 0,
+            "groups": [],
+            "users": [],
+        }
+        for name in self.installed:
+            _install(self.root, state, name)
+        (state_dir / "state.json").write_text(json.dumps(state))
+        (state_dir / "latency.json").write_text(json.dumps(self.latency))
+
+    def _write_shims(self) -> Path:
+        bin_dir = self.path("/bin")
+        bin_dir.mkdir(parents=True, exist_ok=True)
+        for name in FAKE_COMMANDS:
+            shim = bin_dir / name
+            shim.write_text(
+                f"#!{sys.executable}\n"
+                "import sys\n"
+                f"sys.path.insert(0, {str(Path(__file__).parent)!r})\n"
+                "from fake_system import run_fake_command\n"
+                f"sys.exit(run_fake_command({str(self.root)!r}, {name!r}, sys.argv[1:]))\n"
+            )
+            shim.chmod(0o755)
+        return bin_dir
+
+    def _remap_apt(self) -> None:
+        from unittest.mock import patch
+
+        import charms.operator_libs_linux.v0.apt as apt
+
+        sources_list_d = self.path("/etc/apt/sources.list.d")
+        sources_list_d.mkdir(parents=True, exist_ok=True)
+        real_prefix = apt.DebianRepository.prefix_from_uri
+
+        def prefix_from_uri(uri: str) -> str:
+            return str(self.path(real_prefix(uri)))
+
+        def mapping_init(mapping):
+            mapping._repository_map = {}
+            mapping.default_file = str(self.path("/etc/apt/sources.list"))
+            if os.path.isfile(mapping.default_file):
+                mapping.load(mapping.default_file)
+            for file in glob.iglob(f"{sources_list_d}/*.list"):
+                mapping.load(file)
+
+        self._patches += [
+            patch.object(apt.DebianRepository, "prefix_from_uri", staticmethod(prefix_from_uri)),
+            patch.object(apt.RepositoryMapping, "__init__", mapping_init),
+        ]
+
+    def _remap_paths(self) -> None:
+        from unittest.mock import patch
+
+        for module_name in self.modules:
+            module = importlib.import_module(module_name)
+            for name, value in vars(module).items():
+                if isinstance(value, PurePosixPath) and value.is_absolute():
+                    self._patches.append(patch.object(module, name, self.path(value)))
+
+    def __enter__(self) -> "FakeSystem":
+        """Build the sandbox and redirect PATH and system paths into it."""
+        from unittest.mock import patch
+
+        for directory in BASE_LAYOUT:
+            self.path(directory).mkdir(parents=True, exist_ok=True)
+        self._write_state()
+        self.path("/var/log/fake-system.jsonl").touch()
+        bin_dir = self._write_shims()
+
+        self._patches.append(
+            patch.dict(os.environ, {"PATH": f"{bin_dir}{os.pathsep}{os.environ['PATH']}"})
+        )
+        if os.geteuid() != 0:
+            self._patches.append(patch("os.chown"))
+        self._remap_apt()
+        self._remap_paths()
+        for p in self._patches:
+            p.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        """Undo all redirections."""
+        for p in reversed(self._patches):
+            p.stop()
+        self._patches.clear()
+
+    def state(self) -> Dict:
+        """Return the current fake system state."""
+        return json.loads(self.path("/var/lib/fake-system/state.json").read_text())
+
+    def timeline(self) -> List[Dict]:
+        """Return every fake command run so far, in start order."""
+        lines = self.path("/var/log/fake-system.jsonl").read_text().splitlines()
+        return sorted((json.loads(line) for line in lines), key=lambda e: e["start"])
+
+
+def summarize(timeline: List[Dict]) -> Dict[str, Dict[str, float]]:
+    """Aggregate calls and wall time per fake command."""
+    summary: Dict[str, Dict[str, float]] = {}
+    for entry in timeline:
+        cmd = summary.setdefault(entry["cmd"], {"calls": 0, "seconds": 0.0})
+        cmd["calls"] += 1
+        cmd["seconds"] += entry["end"] - entry["start"]
+    return summary
+
+
+def main() -> None:
+    """Run SlurmrestdManager install and a config apply in a sandbox and print timelines."""
+    from tempfile import TemporaryDirectory
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--latency", action="append", default=[], metavar="CMD=SECONDS")
+    args = parser.parse_args()
+    latency = {cmd: float(seconds) for cmd, seconds in (a.split("=", 1) for a in args.latency)}
+
+    from slurmrestd_ops import SlurmrestdManager
+
+    with TemporaryDirectory() as tmp, FakeSystem(Path(tmp), latency=latency) as system:
+        manager = SlurmrestdManager()
+        for phase, run in (
+            ("install", manager.install),
+            ("config-apply", lambda: _config_apply(manager)),
+        ):
+            before = len(system.timeline())
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            print(f"{phase}: {elapsed:.3f}s")
+            for cmd, stats in sorted(summarize(system.timeline()[before:]).items()):
+                print(f"  {cmd:<10} calls={stats['calls']:<3} seconds={stats['seconds']:.3f}")
+
+
+def _config_apply(manager) -> None:
+    manager.stop_slurmrestd()
+    manager.stop_munge()
+    manager.write_munge_key("bXVuZ2Uta2V5LWZvci10ZXN0aW5nLWZha2Utc3lzdGVtLTMyLWJ5dGVz")
+    manager.write_slurm_conf("ClusterName=sandbox\n")
+    manager.start_munge()
+    manager.start_slurmrestd()
+
+
+if __name__ == "__main__":
+    main()
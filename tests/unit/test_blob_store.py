@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Test the blob store and compact snapshots of deferred slurmctld events."""
+
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from blob_store import BlobStore, digest
+from charm import SlurmrestdCharm
+from constants import SLURMCTLD_BLOB_DIR
+from ops.testing import Harness
+
+SLURMCTLD_DATA = {
+    "munge_key": "bXVuZ2Uta2V5LWZvci10ZXN0aW5nLWJsb2Itc3RvcmUtMzItYnl0ZXM=",
+    "slurm_conf": "ClusterName=test\nSlurmctldHost=slurmctld-0\n"
+    + "NodeName=compute-[0-9999] CPUs=64\n" * 1000,
+}
+
+
+class TestBlobStore(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = BlobStore(Path(tmp.name) / "blobs")
+
+    def test_put_get(self):
+        key = self.store.put("payload")
+        self.assertEqual(key, digest("payload"))
+        self.assertEqual(self.store.get(key), "payload")
+        self.assertEqual(self.store.put("payload"), key)
+        self.assertEqual(self.store.digests(), {key})
+
+    def test_get_missing(self):
+        with self.assertRaises(FileNotFoundError):
+            self.store.get(digest("missing"))
+
+    def test_gc(self):
+        keep = self.store.put("keep")
+        self.store.put("drop")
+        self.assertEqual(self.store.gc({keep}), 1)
+        self.assertEqual(self.store.digests(), {keep})
+
+
+def _on_slurmctld_available(self, event):
+    event.defer()
+
+
+class TestDeferredSnapshot(unittest.TestCase):
+    def setUp(self) -> None:
+        # The charm queues config itself, so defer from a stand-in handler.
+        deferring = patch.object(
+            SlurmrestdCharm, "_on_slurmctld_available", _on_slurmctld_available
+        )
+        deferring.start()
+        self.addCleanup(deferring.stop)
+        self.deferring = deferring
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.harness = Harness(SlurmrestdCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        self.harness.framework.charm_dir = Path(tmp.name)
+        self.store = BlobStore(Path(tmp.name) / SLURMCTLD_BLOB_DIR)
+        self.relation_id = self.harness.add_relation("slurmctld", "slurmctld")
+        self.harness.add_relation_unit(self.relation_id, "slurmctld/0")
+
+    def _deferred_snapshots(self):
+        storage = self.harness.framework._storage
+        prefix = f"{self.harness.charm._slurmctld.on.handle.path}/slurmctld_available["
+        return [
+            storage.load_snapshot(path)
+            for path, _, _ in storage.notices()
+            if path.startswith(prefix)
+        ]
+
+    def test_snapshot_holds_digests(self):
+        self.harness.update_relation_data(self.relation_id, "slurmctld", SLURMCTLD_DATA)
+
+        (snapshot,) = self._deferred_snapshots()
+        self.assertEqual(
+            snapshot,
+            {
+                "munge_key_digest": digest(SLURMCTLD_DATA["munge_key"]),
+                "slurm_conf_digest": digest(SLURMCTLD_DATA["slurm_conf"]),
+            },
+        )
+        self.assertEqual(
+            self.store.get(snapshot["slurm_conf_digest"]), SLURMCTLD_DATA["slurm_conf"]
+        )
+
+    @patch("slurmrestd_ops.SlurmrestdManager.start_slurmrestd")
+    @patch("slurmrestd_ops.SlurmrestdManager.start_munge")
+    @patch("slurmrestd_ops.SlurmrestdManager.stop_munge")
+    @patch("slurmrestd_ops.SlurmrestdManager.stop_slurmrestd")
+    @patch("slurmrestd_ops.SlurmrestdManager.write_slurm_conf")
+    @patch("slurmrestd_ops.SlurmrestdManager.write_munge_key")
+    def test_reemit_restores_and_collects(self, write_munge_key, write_slurm_conf, *_):
+        self.harness.update_relation_data(self.relation_id, "slurmctld", SLURMCTLD_DATA)
+        self.harness.framework.commit()
+        self.assertEqual(len(self.store.digests()), 2)
+
+        self.deferring.stop()
+        self.harness.charm._stored.slurm_installed = True
+        self.harness.framework.reemit()
+        write_munge_key.assert_called_once_with(SLURMCTLD_DATA["munge_key"])
+        write_slurm_conf.assert_called_once_with(SLURMCTLD_DATA["slurm_conf"])
+
+        self.harness.framework.commit()
+        self.assertEqual(self._deferred_snapshots(), [])
+        self.assertEqual(self.store.digests(), set())
+
+    def test_commit_keeps_pending_config(self):
+        self.deferring.stop()
+        self.harness.update_relation_data(self.relation_id, "slurmctld", SLURMCTLD_DATA)
+        self.harness.update_relation_data(
+            self.relation_id, "slurmctld", {"slurm_conf": "ClusterName=newer\n"}
+        )
+        self.harness.framework.commit()
+
+        # Waiting for install: the superseded slurm.conf goes, the queued config stays.
+        self.assertEqual(self._deferred_snapshots(), [])
+        self.assertEqual(
+            self.store.digests(),
+            {digest(SLURMCTLD_DATA["munge_key"]), digest("ClusterName=newer\n")},
+        )
+
+    def test_restore_inline_snapshot(self):
+        event = self.harness.charm._slurmctld.on.slurmctld_available
+        restored = event.event_type.__new__(event.event_type)
+        restored.framework = self.harness.framework
+        restored.restore({"munge_key": "key", "slurm_conf": "conf"})
+        self.assertEqual((restored.munge_key, restored.slurm_conf), ("key", "conf"))
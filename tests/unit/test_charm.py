@@ -16,12 +16,17 @@
 """Test default charm events such as upgrade charm, install, etc."""
 
 import unittest
-from unittest.mock import PropertyMock, patch
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import ANY, Mock, PropertyMock, patch
 
 from charm import SlurmrestdCharm
 from ops.model import ActiveStatus, BlockedStatus
 from ops.testing import Harness
 
+MUNGE_KEY = "bXVuZ2Uta2V5LWZvci10ZXN0aW5nLWxhdGVzdC13aW5z"
+SLURMCTLD_HOST = "SlurmctldHost=slurmctld-0\n"
+
 
 class TestCharm(unittest.TestCase):
     def setUp(self) -> None:
@@ -33,15 +38,55 @@ class TestCharm(unittest.TestCase):
         "interface_slurmctld.Slurmctld.is_joined",
         new_callable=PropertyMock(return_value=True),
     )
+    @patch("slurmrestd_ops.SlurmrestdManager.restart_exporter")
+    @patch("slurmrestd_ops.SlurmrestdManager.write_exporter_service")
     @patch("slurmrestd_ops.SlurmrestdManager.version", return_value="1.1.1")
     @patch("slurmrestd_ops.SlurmrestdManager.install")
     @patch("slurmrestd_ops.CharmedHPCPackageLifecycleManager.install")
     def test_install_success(self, *_):
+        self.harness.set_leader(True)
         self.harness.charm._stored.slurmctld_available = True
         self.harness.charm.on.install.emit()
         self.assertTrue(self.harness.charm._stored.slurm_installed)
         self.assertEqual(self.harness.charm.unit.status, ActiveStatus())
 
+    @patch("charm.time.time", return_value=1000.0)
+    @patch("slurmrestd_ops.SlurmrestdManager.restart_exporter")
+    @patch("slurmrestd_ops.SlurmrestdManager.write_exporter_service")
+    @patch("slurmrestd_ops.SlurmrestdManager.version", return_value="1.1.1")
+    @patch("slurmrestd_ops.SlurmrestdManager.install_steps")
+    def test_install_resumes_with_backoff(self, install_steps, _version, _service, _exporter, now):
+        self.harness.set_leader(True)
+        steps = {"repo": Mock(return_value=True), "package": Mock(return_value=False)}
+        install_steps.return_value = steps
+
+        self.harness.charm.on.install.emit()
+        self.assertFalse(self.harness.charm._stored.slurm_installed)
+        self.assertEqual(list(self.harness.charm._stored.install_steps), ["repo"])
+        self.assertEqual(self.harness.charm._stored.install_retry_at, 1030.0)
+
+        # Still backing off: nothing is retried.
+        now.return_value = 1020.0
+        self.harness.framework.reemit()
+        self.assertEqual(steps["package"].call_count, 1)
+
+        now.return_value = 1031.0
+        self.harness.framework.reemit()
+        self.assertEqual(self.harness.charm._stored.install_retry_at, 1031.0 + 60)
+
+        now.return_value = 1100.0
+        steps["package"].return_value = True
+        self.harness.framework.reemit()
+        self.assertTrue(self.harness.charm._stored.slurm_installed)
+        steps["repo"].assert_called_once()
+        self.assertEqual(steps["package"].call_count, 3)
+        self.assertEqual(self.harness.charm._stored.install_failures, 0)
+
+    def test_slurm_debs_resource(self):
+        self.assertIsNone(self.harness.charm._slurm_debs())
+        self.harness.add_resource("slurm-debs", b"tarball")
+        self.assertEqual(self.harness.charm._slurm_debs().read_bytes(), b"tarball")
+
     def test_update_status_fail(self):
         self.harness.charm.on.update_status.emit()
         self.assertEqual(
@@ -58,3 +103,46 @@ class TestCharm(unittest.TestCase):
 
         self.harness.charm.on.update_status.emit()
         self.assertEqual(self.harness.charm.unit.status, ActiveStatus())
+
+    @patch("slurmrestd_ops.SlurmrestdManager.restart_exporter")
+    @patch("slurmrestd_ops.SlurmrestdManager.write_exporter_service")
+    def test_metrics_endpoint_scrape_job(self, write_exporter_service, _):
+        self.harness.set_leader(True)
+        self.harness.charm._stored.slurm_installed = True
+        relation_id = self.harness.add_relation("metrics-endpoint", "prometheus")
+        self.harness.update_config({"metrics-port": 9900})
+
+        write_exporter_service.assert_called_with(ANY, 9900)
+        app_data = self.harness.get_relation_data(relation_id, "slurmrestd")
+        self.assertIn('"*:9900"', app_data["scrape_jobs"])
+
+    @patch("slurmrestd_ops.SlurmrestdManager.start_slurmrestd")
+    @patch("slurmrestd_ops.SlurmrestdManager.start_munge")
+    @patch("slurmrestd_ops.SlurmrestdManager.stop_munge")
+    @patch("slurmrestd_ops.SlurmrestdManager.stop_slurmrestd")
+    @patch("slurmrestd_ops.SlurmrestdManager.write_slurm_conf")
+    @patch("slurmrestd_ops.SlurmrestdManager.write_munge_key")
+    @patch("slurmrestd_ops.SlurmrestdManager.restart_exporter")
+    @patch("slurmrestd_ops.SlurmrestdManager.write_exporter_service")
+    @patch("slurmrestd_ops.SlurmrestdManager.version", return_value="1.1.1")
+    @patch("slurmrestd_ops.SlurmrestdManager.install", return_value=True)
+    def test_pending_config_latest_wins(
+        self, _install, _version, _service, _exporter, _key, write_slurm_conf, stop_slurmrestd, *_
+    ):
+        self.harness.set_leader(True)
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.harness.framework.charm_dir = Path(tmp.name)
+        relation_id = self.harness.add_relation("slurmctld", "slurmctld")
+        for cluster in ("one", "two", "three"):
+            self.harness.update_relation_data(
+                relation_id,
+                "slurmctld",
+                {"munge_key": MUNGE_KEY, "slurm_conf": f"ClusterName={cluster}\n{SLURMCTLD_HOST}"},
+            )
+        write_slurm_conf.assert_not_called()
+
+        self.harness.charm.on.install.emit()
+        write_slurm_conf.assert_called_once_with(f"ClusterName=three\n{SLURMCTLD_HOST}")
+        stop_slurmrestd.assert_called_once()
+        self.assertEqual(self.harness.charm._stored.pending_slurm_conf, "")
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Test the fake slurmrestd server used for offline load testing."""
+
+import json
+import time
+import unittest
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from tests.fake_slurmrestd import FakeSlurmrestd
+
+
+class TestFakeSlurmrestd(unittest.TestCase):
+    def _get(self, fake: FakeSlurmrestd, path: str, **kwargs):
+        with urlopen(Request(f"{fake.url}{path}", **kwargs), timeout=5) as response:
+            return response.status, json.loads(response.read())
+
+    def test_datasets(self):
+        with FakeSlurmrestd(jobs=25, nodes=10, partitions=2) as fake:
+            _, jobs = self._get(fake, "/slurm/v0.0.39/jobs")
+            _, nodes = self._get(fake, "/slurm/v0.0.39/nodes")
+            _, job = self._get(fake, "/slurm/v0.0.39/job/1003")
+            _, openapi = self._get(fake, "/openapi/v3")
+
+        self.assertEqual(len(jobs["jobs"]), 25)
+        self.assertEqual(len(nodes["nodes"]), 10)
+        self.assertEqual(job["jobs"][0]["job_id"], 1003)
+        self.assertIn("/slurm/v0.0.39/partitions", openapi["paths"])
+
+    def test_submit(self):
+        with FakeSlurmrestd(jobs=5) as fake:
+            _, submitted = self._get(fake, "/slurm/v0.0.39/job/submit", data=b"{}")
+        self.assertEqual(submitted["job_id"], 1005)
+
+    def test_injected_latency_and_errors(self):
+        with FakeSlurmrestd(latency=0.05) as fake:
+            start = time.perf_counter()
+            self._get(fake, "/slurm/v0.0.39/ping")
+            self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+
+        with FakeSlurmrestd(error_rate=1.0) as fake:
+            with self.assertRaises(HTTPError) as e:
+                self._get(fake, "/slurm/v0.0.39/ping")
+        self.assertEqual(e.exception.code, 500)
+
+    def test_auth(self):
+        with FakeSlurmrestd(require_auth=True) as fake:
+            with self.assertRaises(HTTPError) as e:
+                self._get(fake, "/slurm/v0.0.39/ping")
+            status, _ = self._get(
+                fake,
+                "/slurm/v0.0.39/ping",
+                headers={"X-SLURM-USER-NAME": "root", "X-SLURM-USER-TOKEN": "t"},
+            )
+        self.assertEqual(e.exception.code, 401)
+        self.assertEqual(status, 200)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Run SlurmrestdManager and the install hook end to end in the fake system sandbox."""
+
+import io
+import subprocess
+import tarfile
+import time
+import unittest
+from hashlib import sha256
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Dict
+from unittest.mock import patch
+
+from charm import SlurmrestdCharm
+from constants import SLURMRESTD_SERVICE
+from ops.testing import Harness
+from slurmrestd_ops import SlurmrestdManager
+from tests.fake_system import FakeSystem, summarize
+
+MUNGE_KEY = "bXVuZ2Uta2V5LWZvci10ZXN0aW5nLWZha2Utc3lzdGVtLTMyLWJ5dGVz"
+
+DEBS = {
+    "slurmrestd_23.02.7-1_amd64.deb": b"slurmrestd",
+    "munge_0.5.15-1_amd64.deb": b"munge",
+    "slurm-wlm-basic-plugins_23.02.7-1_amd64.deb": b"plugins",
+    "libmunge2_0.5.15-1_amd64.deb": b"libmunge2",
+}
+
+
+def make_debs_tarball(path: Path, debs: Dict[str, bytes], checksums: Dict[str, bytes]) -> Path:
+    """Write a slurm-debs resource with `debs` and a SHA256SUMS for `checksums`."""
+    sums = "".join(f"{sha256(data).hexdigest()}  ./{name}\n" for name, data in checksums.items())
+    with tarfile.open(path, "w:gz") as tar:
+        for name, data in {**debs, "SHA256SUMS": sums.encode()}.items():
+            info = tarfile.TarInfo(f"./{name}")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return path
+
+
+class TestFakeSystem(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+
+    def test_install(self):
+        with FakeSystem(self.root) as system:
+            self.assertTrue(SlurmrestdManager().install())
+
+            state = system.state()
+            self.assertEqual(
+                set(state["installed"]), {"munge", "slurmrestd", "slurm-wlm-basic-plugins"}
+            )
+            self.assertEqual(state["users"], ["slurmrestd"])
+            self.assertEqual(state["groups"], ["slurmrestd"])
+            self.assertTrue(system.path("/usr/lib/systemd/system/slurmrestd.service").exists())
+            self.assertTrue(system.path("/usr/share/keyrings/ubuntu-hpc-munge.asc").exists())
+            self.assertIn("apt-get", summarize(system.timeline()))
+
+    def test_config_apply(self):
+        with FakeSystem(self.root) as system:
+            manager = SlurmrestdManager()
+            manager.install()
+            manager.write_munge_key(MUNGE_KEY)
+            manager.write_slurm_conf("ClusterName=sandbox\n")
+            self.assertTrue(manager.start_munge())
+            manager.start_slurmrestd()
+
+            self.assertEqual(system.state()["services"]["slurmrestd"], "active")
+            self.assertEqual(
+                system.path("/etc/slurm/slurm.conf").read_text(), "ClusterName=sandbox\n"
+            )
+
+    def test_command_latency(self):
+        with FakeSystem(self.root, latency={"apt-get": 0.05}) as system:
+            SlurmrestdManager().install()
+            apt_get = summarize(system.timeline())["apt-get"]
+        self.assertGreaterEqual(apt_get["seconds"], 0.05 * apt_get["calls"])
+
+    def test_install_overlaps_steps(self):
+        latency = {"apt-get": 0.2, "groupadd": 0.1, "adduser": 0.2}
+        with FakeSystem(self.root, latency=latency) as system:
+            with self.assertLogs(level="INFO") as logs:
+                self.assertTrue(SlurmrestdManager().install())
+            timeline = system.timeline()
+
+        apt_get = [e for e in timeline if e["cmd"] == "apt-get"]
+        groupadd = next(e for e in timeline if e["cmd"] == "groupadd")
+        adduser = next(e for e in timeline if e["cmd"] == "adduser")
+        self.assertLess(groupadd["start"], apt_get[0]["end"])
+        # One index refresh, then the download overlaps creating the account.
+        self.assertEqual([e["args"][0] for e in apt_get[:1]], ["update"])
+        self.assertEqual(sum("update" in e["args"] for e in apt_get), 1)
+        prefetch = apt_get[1]
+        self.assertIn("--download-only", prefetch["args"])
+        self.assertLess(adduser["start"], prefetch["end"])
+        self.assertLess(prefetch["start"], adduser["end"])
+        # Packages install one at a time, they share the dpkg lock.
+        for previous, current in zip(apt_get, apt_get[1:]):
+            self.assertGreaterEqual(current["start"], previous["end"])
+        self.assertTrue(any("user-group" in line for line in logs.output))
+
+    def test_install_on_prebaked_image(self):
+        with FakeSystem(self.root) as system:
+            SlurmrestdManager().install()
+            # The image was booted with the daemons running.
+            subprocess.run(["systemctl", "start", "slurmrestd", "munge"], check=True)
+            baked = len(system.timeline())
+
+            start = time.perf_counter()
+            completed = []
+            self.assertTrue(SlurmrestdManager().install(on_step=completed.append))
+            elapsed = time.perf_counter() - start
+            commands = [e["cmd"] for e in system.timeline()[baked:]]
+            state = system.state()
+
+        self.assertEqual(commands, ["dpkg-query", "systemctl", "systemctl"])
+        self.assertEqual(state["services"], {"slurmrestd": "inactive", "munge": "inactive"})
+        self.assertEqual(set(completed), set(SlurmrestdManager().install_steps()))
+        self.assertLess(elapsed, 1.0)
+
+    def test_prebaked_image_with_package_unit(self):
+        with FakeSystem(self.root) as system:
+            SlurmrestdManager().install()
+            unit = system.path("/usr/lib/systemd/system/slurmrestd.service")
+            unit.write_text("[Service]\nExecStart=/usr/sbin/slurmrestd\n")
+            baked = len(system.timeline())
+
+            self.assertTrue(SlurmrestdManager().install())
+            commands = [e["cmd"] for e in system.timeline()[baked:]]
+            self.assertEqual(unit.read_text(), SLURMRESTD_SERVICE)
+            self.assertEqual(system.state()["daemon_reloads"], 2)
+
+        self.assertNotIn("apt-get", commands)
+        self.assertEqual(commands, ["dpkg-query", "systemctl", "systemctl", "systemctl"])
+
+    def test_prebaked_image_at_other_series(self):
+        with FakeSystem(self.root):
+            manager = SlurmrestdManager()
+            manager.install()
+            self.assertTrue(manager.is_installed())
+        packages = {
+            "munge": "0.5.14-6",
+            "slurmrestd": "23.11.1-1",
+            "slurm-wlm-basic-plugins": "23.11.1-1",
+        }
+        with FakeSystem(self.root, packages=packages, installed=packages):
+            self.assertFalse(manager.is_installed())
+
+    def test_install_stops_after_failure(self):
+        ran = []
+        steps = {
+            name: (lambda name=name: ran.append(name) or name != "munge-package")
+            for name in SlurmrestdManager().install_steps()
+        }
+        with patch("slurmrestd_ops.SlurmrestdManager.install_steps", return_value=steps):
+            completed = []
+            self.assertFalse(SlurmrestdManager().install(on_step=completed.append))
+        self.assertNotIn("plugins-package", ran)
+        self.assertIn("service-unit", completed)
+        self.assertLess(ran.index("slurmrestd-package"), ran.index("munge-package"))
+
+    def test_install_from_debs(self):
+        debs = make_debs_tarball(self.root / "slurm-debs.tar.gz", DEBS, DEBS)
+        with FakeSystem(self.root) as system:
+            self.assertTrue(SlurmrestdManager().install(debs=debs))
+
+            state = system.state()
+            self.assertEqual(state["installed"]["slurmrestd"], "23.02.7-1")
+            self.assertIn("libmunge2", state["installed"])
+            self.assertNotIn("apt-get", summarize(system.timeline()))
+            self.assertFalse(system.path("/usr/share/keyrings/ubuntu-hpc-munge.asc").exists())
+
+    def test_resume_install_from_debs(self):
+        debs = make_debs_tarball(self.root / "slurm-debs.tar.gz", DEBS, DEBS)
+        with FakeSystem(self.root) as system:
+            # The first hook only gets as far as installing the .debs.
+            manager = SlurmrestdManager()
+            steps = manager.install_steps(debs).keys() - {"local-packages"}
+            self.assertTrue(manager.install(completed=steps, debs=debs))
+            self.assertTrue(manager.offline)
+
+            resumed = SlurmrestdManager()
+            self.assertTrue(resumed.install(completed={"local-packages"}, offline=manager.offline))
+            self.assertTrue(resumed.is_installed())
+            self.assertEqual(system.state()["installed"]["slurmrestd"], "23.02.7-1")
+            self.assertNotIn("apt-get", summarize(system.timeline()))
+            self.assertFalse(system.path("/usr/share/keyrings/ubuntu-hpc-munge.asc").exists())
+
+    def test_install_from_corrupt_debs_uses_ppa(self):
+        corrupt = {**DEBS, "munge_0.5.15-1_amd64.deb": b"truncated"}
+        debs = make_debs_tarball(self.root / "slurm-debs.tar.gz", corrupt, DEBS)
+        with FakeSystem(self.root) as system:
+            self.assertTrue(SlurmrestdManager().install(debs=debs))
+
+            state = system.state()
+            self.assertEqual(state["installed"]["slurmrestd"], "23.02.6-1ubuntu1~ppa1")
+            self.assertNotIn("libmunge2", state["installed"])
+            self.assertIn("apt-get", summarize(system.timeline()))
+
+    def test_install_hook(self):
+        with FakeSystem(self.root) as system:
+            harness = Harness(SlurmrestdCharm)
+            self.addCleanup(harness.cleanup)
+            harness.set_leader(True)
+            harness.begin()
+            harness.charm.on.install.emit()
+
+            self.assertTrue(harness.charm._stored.slurm_installed)
+            self.assertIn("slurmrestd-exporter", system.state()["enabled"])
+            self.assertTrue(
+                system.path("/usr/lib/systemd/system/slurmrestd-exporter.service").exists()
+            )
+
+            # An unchanged exporter unit keeps running with its histograms.
+            calls = len(system.timeline())
+            harness.charm.on.config_changed.emit()
+            self.assertNotIn("systemctl", summarize(system.timeline()[calls:]))
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Subprocess, restart and wall time budgets for each hook.
+
+Every hook runs through `Harness` with `subprocess` and file writes intercepted,
+so nothing touches the host. Fork, write and restart counts must not exceed
+the recorded baseline, and wall time must stay within a generous multiple of
+it. After an intentional change, refresh the baseline with:
+
+    UPDATE_HOOK_BASELINE=1 tox -e unit -- -k HookBudget
+"""
+
+import io
+import json
+import os
+import subprocess
+import time
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from charm import SlurmrestdCharm
+from ops.testing import Harness
+
+BASELINE_FILE = Path(__file__).parent / "hook_budgets.json"
+UPDATE_BASELINE = os.getenv("UPDATE_HOOK_BASELINE") == "1"
+WALL_TOLERANCE = 3.0
+WALL_SLACK_MS = 50.0
+RUNS = 5
+
+SLURMCTLD_DATA = {
+    "munge_key": "bXVuZ2Uta2V5LWZvci10ZXN0aW5nLWJ1ZGdldHMtMzItYnl0ZXM=",
+    "slurm_conf": "ClusterName=test\nSlurmctldHost=slurmctld-0\n",
+}
+
+
+class _Interceptor:
+    """Record subprocesses and file writes instead of performing them."""
+
+    def __init__(self):
+        self.commands = []
+        self.writes = []
+        self._real_open = open
+
+    @property
+    def restarts(self) -> int:
+        verbs = {"start", "stop", "restart", "reload", "try-restart"}
+        return sum(1 for cmd in self.commands if cmd[0] == "systemctl" and cmd[1] in verbs)
+
+    def _run(self, cmd, *_, **kwargs):
+        self.commands.append(list(cmd))
+        out = "amd64\n" if list(cmd) == ["dpkg", "--print-architecture"] else ""
+        return subprocess.CompletedProcess(cmd, 0, stdout=out, stderr="")
+
+    def _check_output(self, cmd, *args, **kwargs):
+        out = self._run(cmd).stdout
+        return out if kwargs.get("text") or kwargs.get("universal_newlines") else out.encode()
+
+    def _popen(self, cmd, *_, **__):
+        self.commands.append(list(cmd))
+        return SimpleNamespace(stdout=None, communicate=lambda *_: (b"STATUS: Success (0)", b""))
+
+    def _open(self, file, mode="r", *args, **kwargs):
+        if any(c in mode for c in "wax+"):
+            self.writes.append(str(file))
+            return io.BytesIO() if "b" in mode else io.StringIO()
+        return self._real_open(file, mode, *args, **kwargs)
+
+    def patches(self):
+        return [
+            patch("subprocess.run", self._run),
+            patch("subprocess.check_output", self._check_output),
+            patch("subprocess.check_call", self._run),
+            patch("subprocess.Popen", self._popen),
+            patch("charms.operator_libs_linux.v0.apt.check_output", self._check_output),
+            patch("builtins.open", self._open),
+            patch("io.open", self._open),
+            patch("os.chown", lambda path, *_: self.writes.append(f"chown:{path}")),
+            patch(
+                "pathlib.Path.mkdir", lambda path, *_, **__: self.writes.append(f"mkdir:{path}")
+            ),
+            patch("pathlib.Path.unlink", lambda path, *_: self.writes.append(f"unlink:{path}")),
+        ]
+
+
+class TestHookBudget(unittest.TestCase):
+    measured = {}
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.baseline = json.loads(BASELINE_FILE.read_text()) if BASELINE_FILE.exists() else {}
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        if UPDATE_BASELINE:
+            BASELINE_FILE.write_text(json.dumps(cls.measured, indent=2, sort_keys=True) + "\n")
+
+    def setUp(self) -> None:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.harness = Harness(SlurmrestdCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.set_leader(True)
+        self.harness.begin()
+        self.harness.framework.charm_dir = Path(tmp.name)
+        self.relation_id = self.harness.add_relation("slurmctld", "slurmctld")
+        self.harness.add_relation_unit(self.relation_id, "slurmctld/0")
+
+    def _slurmctld_changed(self):
+        relation = self.harness.model.get_relation("slurmctld", self.relation_id)
+        self.harness.charm.on["slurmctld"].relation_changed.emit(
+            relation, self.harness.model.get_app("slurmctld")
+        )
+
+    def _measure(self, hook: str, emit) -> _Interceptor:
+        """Run `emit` RUNS times and check the median against the budget for `hook`."""
+        samples = []
+        for _ in range(RUNS):
+            interceptor = _Interceptor()
+            patches = interceptor.patches()
+            for p in patches:
+                p.start()
+            try:
+                start = time.perf_counter()
+                emit()
+                wall_ms = (time.perf_counter() - start) * 1000
+            finally:
+                for p in reversed(patches):
+                    p.stop()
+            samples.append((wall_ms, interceptor))
+        samples.sort(key=lambda sample: sample[0])
+        wall_ms, interceptor = samples[len(samples) // 2]
+
+        measured = {
+            "forks": len(interceptor.commands),
+            "writes": len(interceptor.writes),
+            "restarts": interceptor.restarts,
+            "wall_ms": round(wall_ms, 3),
+        }
+        self.measured[hook] = measured
+        if UPDATE_BASELINE:
+            return interceptor
+
+        budget = self.baseline.get(hook)
+        self.assertIsNotNone(budget, f"no baseline for '{hook}', run with UPDATE_HOOK_BASELINE=1")
+        for key in ("forks", "writes", "restarts"):
+            self.assertLessEqual(
+                measured[key],
+                budget[key],
+                f"'{hook}' {key} over budget: {interceptor.commands} {interceptor.writes}",
+            )
+        self.assertLessEqual(wall_ms, budget["wall_ms"] * WALL_TOLERANCE + WALL_SLACK_MS)
+        return interceptor
+
+    @patch("slurmrestd_ops.CharmedHPCPackageLifecycleManager.version", return_value="23.02.5")
+    @patch("slurmrestd_ops.CharmedHPCPackageLifecycleManager.install", return_value=True)
+    def test_install(self, *_):
+        def emit():
+            # Start each run from scratch, a completed install skips every step.
+            self.harness.charm._stored.slurm_installed = False
+            self.harness.charm._stored.install_steps = []
+            self.harness.charm._stored.install_failures = 0
+            self.harness.charm._stored.install_retry_at = 0.0
+            self.harness.charm.on.install.emit()
+
+        interceptor = self._measure("install", emit)
+        self.assertTrue(self.harness.charm._stored.slurm_installed)
+        self.assertIn(["apt-get", "update"], interceptor.commands)
+
+    def test_update_status(self):
+        self.harness.charm._stored.slurm_installed = True
+        interceptor = self._measure("update_status", self.harness.charm.on.update_status.emit)
+        self.assertLessEqual(len(interceptor.commands), 1)
+
+    def test_config_changed(self):
+        self.harness.charm._stored.slurm_installed = True
+        self._measure("config_changed", self.harness.charm.on.config_changed.emit)
+
+    def _seed_slurmctld_data(self):
+        with patch("slurmrestd_ops.systemd"), patch(
+            "slurmrestd_ops.SlurmrestdManager.start_munge"
+        ):
+            with patch("slurmrestd_ops.SlurmrestdManager.write_munge_key"):
+                with patch("slurmrestd_ops.SlurmrestdManager.write_slurm_conf"):
+                    self.harness.update_relation_data(
+                        self.relation_id, "slurmctld", SLURMCTLD_DATA
+                    )
+
+    def test_slurmctld_relation_changed(self):
+        self.harness.charm._stored.slurm_installed = True
+        self._seed_slurmctld_data()
+
+        def emit():
+            self.harness.charm._slurmctld._stored.munge_key_digest = ""
+            self.harness.charm._slurmctld._stored.slurm_conf_digest = ""
+            self.harness.charm._stored.applied_munge_key = ""
+            self.harness.charm._stored.applied_slurm_conf = ""
+            self._slurmctld_changed()
+
+        interceptor = self._measure("slurmctld_relation_changed", emit)
+        self.assertEqual(interceptor.restarts, 4)
+
+    def test_slurmctld_relation_changed_unchanged(self):
+        self.harness.charm._stored.slurm_installed = True
+        self._seed_slurmctld_data()
+
+        interceptor = self._measure(
+            "slurmctld_relation_changed_unchanged", self._slurmctld_changed
+        )
+        self.assertEqual(interceptor.restarts, 0)
+
+    def test_slurmctld_relation_broken(self):
+        relation = self.harness.model.get_relation("slurmctld", self.relation_id)
+        self._measure(
+            "slurmctld_relation_broken",
+            lambda: self.harness.charm.on["slurmctld"].relation_broken.emit(relation),
+        )
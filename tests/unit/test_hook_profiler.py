@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Test hook timing spans, stored history and the hook-stats action."""
+
+import json
+import subprocess
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import PropertyMock, patch
+
+import hook_profiler
+from charm import SlurmrestdCharm
+from ops.testing import Harness
+
+
+class TestSpans(unittest.TestCase):
+    def tearDown(self) -> None:
+        hook_profiler._finished.clear()
+
+    def test_span_counts_forks_and_writes(self):
+        with TemporaryDirectory() as tmp:
+            with hook_profiler.span("outer") as outer:
+                subprocess.run(["true"])
+                with hook_profiler.span("inner") as inner:
+                    (Path(tmp) / "file").write_text("data")
+                    (Path(tmp) / "file").read_text()
+
+        self.assertEqual((outer.forks, outer.writes), (1, 1))
+        self.assertEqual((inner.forks, inner.writes), (0, 1))
+        self.assertEqual(inner.parent, outer)
+        self.assertEqual(hook_profiler._finished, [outer])
+
+    def test_span_continued_on_worker_thread(self):
+        def work(parent):
+            with hook_profiler.continue_span(parent), hook_profiler.span("step") as step:
+                subprocess.run(["true"])
+            return step
+
+        with hook_profiler.span("outer") as outer:
+            with hook_profiler.span("install") as install:
+                with ThreadPoolExecutor(max_workers=1) as pool:
+                    step = pool.submit(work, hook_profiler.current_span()).result()
+
+        self.assertEqual(step.parent, install)
+        self.assertEqual((outer.forks, install.forks, step.forks), (1, 1, 1))
+        self.assertEqual(hook_profiler._finished, [outer])
+
+    def test_otlp_export(self):
+        with hook_profiler.span("outer", event="install") as outer:
+            with hook_profiler.span("inner"):
+                pass
+
+        export = hook_profiler.to_otlp([outer], "slurmrestd", "slurmrestd/0")
+        spans = export["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        self.assertEqual([s["name"] for s in spans], ["outer", "inner"])
+        self.assertEqual(spans[1]["parentSpanId"], spans[0]["spanId"])
+        self.assertEqual(spans[1]["traceId"], spans[0]["traceId"])
+
+
+class TestHookStats(unittest.TestCase):
+    def setUp(self) -> None:
+        self.harness = Harness(SlurmrestdCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+
+    @patch(
+        "interface_slurmctld.Slurmctld.is_joined",
+        new_callable=PropertyMock(return_value=True),
+    )
+    @patch("slurmrestd_ops.systemd.service_stop")
+    def test_hook_stats_action(self, *_):
+        self.harness.charm._stored.slurm_installed = True
+        for _ in range(3):
+            self.harness.charm.on.update_status.emit()
+        self.harness.charm._slurmctld.on.slurmctld_unavailable.emit()
+
+        results = self.harness.run_action("hook-stats", {"reset": True}).results
+        self.assertEqual(results["update-status"]["count"], "3.00")
+        self.assertIn(
+            "slurmrestdmanager-stop-slurmrestd",
+            results["slurmctld-unavailable"]["operations-ms"],
+        )
+
+        results = self.harness.run_action("hook-stats").results
+        self.assertNotIn("update-status", results)
+
+    def test_history_is_bounded(self):
+        self.harness.charm._hook_profiler._history = 2
+        for _ in range(5):
+            self.harness.charm.on.update_status.emit()
+        self.assertEqual(self.harness.charm._hook_profiler.stats()["update_status"]["count"], 2)
+
+    def test_trace_file(self):
+        with TemporaryDirectory() as tmp:
+            trace_file = Path(tmp) / "hooks.otlp.jsonl"
+            profiler = self.harness.charm._hook_profiler
+            profiler._trace_file = trace_file
+            self.harness.charm.on.update_status.emit()
+            profiler.flush()
+
+            export = json.loads(trace_file.read_text().splitlines()[0])
+        span = export["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        self.assertEqual(span["name"], "SlurmrestdCharm._on_update_status")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Import time budget for the charm's dispatch path.
+
+Every hook starts a fresh interpreter and imports `charm`, so anything pulled
+in at module level is paid on each `update-status`. This measures a cold
+`import charm` with `python -X importtime` in a subprocess.
+
+Deployed units keep the bytecode compiled by the first hook, so the modules
+are compiled once into a scratch cache before measuring.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Dict
+
+ROOT = Path(__file__).parents[2]
+RUNS = 3
+
+# Modules only the install path or actions need.
+DEFERRED = (
+    "charms.operator_libs_linux.v0.apt",
+    "distro",
+    "slurm_conf",
+    "systemd_dropin",
+    "numa_topology",
+    "slurmrestd_benchmark",
+    "slurmrestd_upgrade",
+)
+
+# Cumulative microseconds for the charm's own modules, excluding ops itself.
+OWN_MODULES_BUDGET_US = 15_000
+OWN_MODULES = (
+    "slurmrestd_ops",
+    "interface_slurmctld",
+    "interface_prometheus_scrape",
+    "interface_slurmrestd_peer",
+)
+
+
+def _import_times(pycache: str) -> Dict[str, int]:
+    """Return cumulative import time in microseconds per module for `import charm`."""
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(str(ROOT / p) for p in ("", "lib", "src")),
+        "PYTHONPYCACHEPREFIX": pycache,
+    }
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import charm"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        with TemporaryDirectory() as pycache:
+            _import_times(pycache)
+            cls.runs = [_import_times(pycache) for _ in range(RUNS)]
+
+    def test_heavy_modules_deferred(self):
+        for module in DEFERRED:
+            self.assertNotIn(module, self.runs[0], f"'{module}' imported on dispatch")
+
+    def test_own_modules_budget(self):
+        totals = sorted(sum(times.get(module, 0) for module in OWN_MODULES) for times in self.runs)
+        self.assertLessEqual(totals[len(totals) // 2], OWN_MODULES_BUDGET_US)
+
+    def test_lazy_modules_load_on_use(self):
+        import slurmrestd_ops
+
+        self.assertTrue(callable(slurmrestd_ops.apt.add_package))
+        self.assertTrue(callable(slurmrestd_ops.systemd.service_running))
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Test change detection in the slurmctld interface."""
+
+import logging
+import time
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from blob_store import digest
+from charm import SlurmrestdCharm
+from interface_slurmctld import SLURM_CONF_ENCODING, decode_slurm_conf, encode_slurm_conf
+from ops import ActiveStatus, BlockedStatus
+from ops.testing import Harness
+from slurm_conf import Action
+
+MUNGE_KEY = "bXVuZ2Uta2V5LWZvci10ZXN0aW5nLWludGVyZmFjZS0zMi1ieXRlcw=="
+SLURM_CONF = "ClusterName=test\nSlurmctldHost=slurmctld-0\n"
+
+
+class TestSlurmctldInterface(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.harness = Harness(SlurmrestdCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        self.harness.framework.charm_dir = Path(tmp.name)
+        self.relation_id = self.harness.add_relation("slurmctld", "slurmctld")
+        self.harness.add_relation_unit(self.relation_id, "slurmctld/0")
+
+        # Record the events reaching the charm on the way to its real handlers.
+        self.emitted = []
+        for kind in ("munge_key_changed", "slurm_conf_changed", "slurmctld_available"):
+            handler = getattr(SlurmrestdCharm, f"_on_{kind}")
+            recorder = patch.object(
+                SlurmrestdCharm,
+                f"_on_{kind}",
+                autospec=True,
+                side_effect=lambda charm, event, h=handler: (
+                    self.emitted.append(event.handle.kind),
+                    h(charm, event),
+                ),
+            )
+            recorder.start()
+            self.addCleanup(recorder.stop)
+
+    def _publish(self, munge_key=MUNGE_KEY, slurm_conf=SLURM_CONF):
+        self.emitted.clear()
+        self.harness.update_relation_data(
+            self.relation_id, "slurmctld", {"munge_key": munge_key, "slurm_conf": slurm_conf}
+        )
+
+    def test_emits_only_changes(self):
+        self._publish()
+        self.assertEqual(
+            self.emitted, ["munge_key_changed", "slurm_conf_changed", "slurmctld_available"]
+        )
+
+        self._publish(slurm_conf="ClusterName=other\nSlurmctldHost=slurmctld-0\n")
+        self.assertEqual(self.emitted, ["slurm_conf_changed", "slurmctld_available"])
+
+        relation = self.harness.model.get_relation("slurmctld", self.relation_id)
+        self.emitted.clear()
+        self.harness.charm.on["slurmctld"].relation_changed.emit(
+            relation, self.harness.model.get_app("slurmctld")
+        )
+        self.assertEqual(self.emitted, [])
+
+    def test_logs_sizes_not_contents(self):
+        with self.assertLogs(level="DEBUG") as logs:
+            self._publish()
+        self.assertFalse(any(MUNGE_KEY in line for line in logs.output))
+        self.assertTrue(any(f"{len(SLURM_CONF)} bytes" in line for line in logs.output))
+
+    @patch("slurmrestd_ops.SlurmrestdManager.start_slurmrestd")
+    @patch("slurmrestd_ops.SlurmrestdManager.start_munge")
+    @patch("slurmrestd_ops.SlurmrestdManager.stop_munge")
+    @patch("slurmrestd_ops.SlurmrestdManager.stop_slurmrestd")
+    @patch("slurmrestd_ops.SlurmrestdManager.update_slurm_conf")
+    @patch("slurmrestd_ops.SlurmrestdManager.write_slurm_conf")
+    @patch("slurmrestd_ops.SlurmrestdManager.write_munge_key")
+    def test_slurm_conf_change_keeps_munge_running(
+        self, write_munge_key, write_slurm_conf, update_slurm_conf, stop_slurmrestd, stop_munge, *_
+    ):
+        self.harness.charm._stored.slurm_installed = True
+        self._publish()
+        self.assertEqual(stop_munge.call_count, 1)
+
+        self._publish(slurm_conf="ClusterName=other\nSlurmctldHost=slurmctld-0\n")
+        update_slurm_conf.assert_called_once_with(
+            "ClusterName=other\nSlurmctldHost=slurmctld-0\n", Action.RESTART
+        )
+        write_slurm_conf.assert_called_once()
+        write_munge_key.assert_called_once()
+        self.assertEqual(stop_munge.call_count, 1)
+        self.assertEqual(stop_slurmrestd.call_count, 1)
+
+
+class TestConfigValidation(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.harness = Harness(SlurmrestdCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        self.harness.framework.charm_dir = Path(tmp.name)
+        self.harness.charm._stored.slurm_installed = True
+        self.relation_id = self.harness.add_relation("slurmctld", "slurmctld")
+        self.harness.add_relation_unit(self.relation_id, "slurmctld/0")
+
+        self.manager = {}
+        for method in (
+            "stop_slurmrestd",
+            "start_slurmrestd",
+            "stop_munge",
+            "start_munge",
+            "write_munge_key",
+            "write_slurm_conf",
+            "update_slurm_conf",
+            "write_exporter_service",
+            "restart_exporter",
+        ):
+            patcher = patch(f"slurmrestd_ops.SlurmrestdManager.{method}")
+            self.manager[method] = patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _publish(self, **data):
+        self.harness.update_relation_data(self.relation_id, "slurmctld", data)
+
+    def test_invalid_config_keeps_serving(self):
+        self._publish(munge_key=MUNGE_KEY, slurm_conf=SLURM_CONF)
+        self.manager["start_slurmrestd"].assert_called_once()
+        for mock in self.manager.values():
+            mock.reset_mock()
+
+        self._publish(slurm_conf="ClusterName=test\n")
+        self._publish(munge_key="a2V5")
+        for mock in self.manager.values():
+            mock.assert_not_called()
+        self.assertEqual(self.harness.charm._stored.applied_slurm_conf, digest(SLURM_CONF))
+        self.assertEqual(
+            self.harness.charm.unit.status,
+            BlockedStatus("Invalid slurmctld config: munge key is 3 bytes, expected 32 to 1024"),
+        )
+
+        self._publish(munge_key=MUNGE_KEY, slurm_conf="ClusterName=other\n" + SLURM_CONF)
+        self.manager["update_slurm_conf"].assert_called_once()
+        self.assertEqual(self.harness.charm.unit.status, ActiveStatus())
+
+    def test_rejected_config_stays_queued(self):
+        new_key = "bmV3LW11bmdlLWtleS1mb3ItdGVzdGluZy1pbnRlcmZhY2UtMzItYnl0ZXM="
+        self._publish(munge_key=MUNGE_KEY, slurm_conf=SLURM_CONF)
+        self._publish(munge_key=new_key, slurm_conf="ClusterName=test\n")
+        self.manager["write_munge_key"].assert_called_once_with(MUNGE_KEY)
+        self.assertIsInstance(self.harness.charm.unit.status, BlockedStatus)
+
+        # Only slurm.conf is fixed, the new munge key is not published again.
+        self._publish(slurm_conf="ClusterName=other\n" + SLURM_CONF)
+        self.manager["write_munge_key"].assert_called_with(new_key)
+        self.assertEqual(self.harness.charm._stored.applied_munge_key, digest(new_key))
+        self.assertEqual(self.harness.charm.unit.status, ActiveStatus())
+
+    @patch("slurmrestd_ops.os.chown")
+    @patch("slurmrestd_ops.subprocess.run", side_effect=FileNotFoundError("slurmrestd"))
+    def test_dry_run(self, run, _):
+        self.harness.update_config({"config-dry-run": True})
+        self._publish(munge_key=MUNGE_KEY, slurm_conf=SLURM_CONF)
+        run.assert_called_once()
+        self.manager["stop_slurmrestd"].assert_not_called()
+        self.assertIn("dry run failed", self.harness.charm.unit.status.message)
+
+
+def synthetic_slurm_conf(nodes: int = 10_000, partitions: int = 8) -> str:
+    """Return a slurm.conf with one NodeName line per node, as large clusters have."""
+    lines = ["ClusterName=bench", "SlurmctldHost=slurmctld-0(10.0.0.1)", "AuthType=auth/munge"]
+    lines += [
+        f"NodeName=compute-{i} NodeAddr=10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255} "
+        f"CPUs=64 Boards=1 SocketsPerBoard=2 CoresPerSocket=16 ThreadsPerCore=2 "
+        f"RealMemory={256000 + (i % 7) * 1024} State=UNKNOWN"
+        for i in range(nodes)
+    ]
+    lines += [
+        f"PartitionName=part-{p} Nodes=compute-[{p * nodes // partitions}-"
+        f"{(p + 1) * nodes // partitions - 1}] MaxTime=INFINITE State=UP"
+        for p in range(partitions)
+    ]
+    return "\n".join(lines) + "\n"
+
+
+class TestSlurmConfEncoding(unittest.TestCase):
+    def test_round_trip(self):
+        data = encode_slurm_conf(SLURM_CONF)
+        self.assertEqual(data["slurm_conf_encoding"], SLURM_CONF_ENCODING)
+        self.assertEqual(decode_slurm_conf(data), SLURM_CONF)
+
+    def test_plain(self):
+        self.assertEqual(decode_slurm_conf({"slurm_conf": SLURM_CONF}), SLURM_CONF)
+        self.assertIsNone(decode_slurm_conf({}))
+
+    def test_unsupported_or_corrupt(self):
+        data = encode_slurm_conf(SLURM_CONF)
+        self.assertIsNone(decode_slurm_conf({**data, "slurm_conf_encoding": "zstd+base64/v1"}))
+        self.assertIsNone(decode_slurm_conf({**data, "slurm_conf": "not base64!"}))
+
+    def test_advertises_encoding(self):
+        harness = Harness(SlurmrestdCharm)
+        self.addCleanup(harness.cleanup)
+        harness.begin()
+        relation_id = harness.add_relation("slurmctld", "slurmctld")
+        self.assertEqual(
+            harness.get_relation_data(relation_id, "slurmrestd/0")["slurm_conf_encodings"],
+            SLURM_CONF_ENCODING,
+        )
+
+
+class TestSlurmConfTransportBenchmark(unittest.TestCase):
+    """Databag size and relation-changed time for a 10k node slurm.conf."""
+
+    def _relation_changed_ms(self, data) -> float:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        harness = Harness(SlurmrestdCharm)
+        self.addCleanup(harness.cleanup)
+        harness.begin()
+        harness.framework.charm_dir = Path(tmp.name)
+        relation_id = harness.add_relation("slurmctld", "slurmctld")
+        harness.add_relation_unit(relation_id, "slurmctld/0")
+        start = time.perf_counter()
+        harness.update_relation_data(relation_id, "slurmctld", {"munge_key": MUNGE_KEY, **data})
+        elapsed = (time.perf_counter() - start) * 1000
+        pending = harness.charm._stored.pending_slurm_conf
+        self.assertEqual(digest(self.slurm_conf), pending)
+        return elapsed
+
+    def test_synthetic_10k_nodes(self):
+        self.slurm_conf = synthetic_slurm_conf()
+        plain = {"slurm_conf": self.slurm_conf}
+        compressed = encode_slurm_conf(self.slurm_conf)
+
+        plain_size = sum(len(v) for v in plain.values())
+        compressed_size = sum(len(v) for v in compressed.values())
+        plain_ms = self._relation_changed_ms(plain)
+        compressed_ms = self._relation_changed_ms(compressed)
+        logging.getLogger().info(
+            f"10k nodes: plain {plain_size} bytes {plain_ms:.1f}ms, "
+            f"{SLURM_CONF_ENCODING} {compressed_size} bytes {compressed_ms:.1f}ms"
+        )
+        self.assertLess(compressed_size, plain_size / 5)
+
+
+class TestSlurmConfIncludes(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.harness = Harness(SlurmrestdCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        self.harness.framework.charm_dir = Path(tmp.name)
+        self.harness.charm._stored.slurm_installed = True
+        self.relation_id = self.harness.add_relation("slurmctld", "slurmctld")
+        self.harness.add_relation_unit(self.relation_id, "slurmctld/0")
+
+        self.manager = {}
+        for method in (
+            "stop_slurmrestd",
+            "start_slurmrestd",
+            "reload_slurmrestd",
+            "stop_munge",
+            "start_munge",
+            "write_munge_key",
+            "write_slurm_conf",
+            "write_slurm_conf_include",
+        ):
+            patcher = patch(f"slurmrestd_ops.SlurmrestdManager.{method}")
+            self.manager[method] = patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _publish(self, nodes: str, partitions: str = "PartitionName=all Nodes=ALL\n"):
+        self.harness.update_relation_data(
+            self.relation_id,
+            "slurmctld",
+            {
+                "munge_key": MUNGE_KEY,
+                "slurm_conf": "ClusterName=test\nSlurmctldHost=slurmctld-0\nInclude nodes.conf\nInclude partitions.conf\n",
+                **encode_slurm_conf(nodes, "slurm_conf_nodes"),
+                "slurm_conf_partitions": partitions,
+            },
+        )
+
+    def test_node_churn_reloads(self):
+        self._publish("NodeName=compute-0\n")
+        self.manager["write_slurm_conf_include"].assert_any_call("nodes", "NodeName=compute-0\n")
+        self.assertEqual(self.manager["start_slurmrestd"].call_count, 1)
+        for mock in self.manager.values():
+            mock.reset_mock()
+
+        self._publish("NodeName=compute-0\nNodeName=compute-1\n")
+        self.manager["write_slurm_conf_include"].assert_called_once_with(
+            "nodes", "NodeName=compute-0\nNodeName=compute-1\n"
+        )
+        self.manager["reload_slurmrestd"].assert_called_once()
+        self.manager["stop_slurmrestd"].assert_not_called()
+        self.manager["write_slurm_conf"].assert_not_called()
+
+    def test_removed_include_is_emptied(self):
+        self._publish("NodeName=compute-0\n")
+        for mock in self.manager.values():
+            mock.reset_mock()
+
+        self.harness.update_relation_data(
+            self.relation_id,
+            "slurmctld",
+            {"slurm_conf_nodes": "", "slurm_conf_nodes_encoding": ""},
+        )
+        self.manager["write_slurm_conf_include"].assert_called_once_with("nodes", "")
+        self.manager["reload_slurmrestd"].assert_called_once()
+        self.assertNotIn("nodes", self.harness.charm._stored.applied_includes)
+
+        self._publish("NodeName=compute-0\n")
+        self.manager["write_slurm_conf_include"].assert_called_with(
+            "nodes", "NodeName=compute-0\n"
+        )
+
+    def test_unchanged_include_is_noop(self):
+        self._publish("NodeName=compute-0\n")
+        for mock in self.manager.values():
+            mock.reset_mock()
+
+        self._publish("NodeName=compute-0\n")
+        for mock in self.manager.values():
+            mock.assert_not_called()
+
+
+class TestConfigless(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.harness = Harness(SlurmrestdCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        self.harness.framework.charm_dir = Path(tmp.name)
+        self.harness.charm._stored.slurm_installed = True
+        self.relation_id = self.harness.add_relation("slurmctld", "slurmctld")
+        self.harness.add_relation_unit(self.relation_id, "slurmctld/0")
+
+        self.manager = {}
+        for method in (
+            "stop_slurmrestd",
+            "start_slurmrestd",
+            "stop_munge",
+            "start_munge",
+            "write_munge_key",
+            "write_slurm_conf",
+            "update_slurm_conf",
+            "set_conf_server",
+            "restart_exporter",
+            "write_exporter_service",
+        ):
+            patcher = patch(f"slurmrestd_ops.SlurmrestdManager.{method}")
+            self.manager[method] = patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_switch_to_configless(self):
+        self.harness.update_relation_data(
+            self.relation_id,
+            "slurmctld",
+            {"munge_key": MUNGE_KEY, "slurm_conf": SLURM_CONF, "slurmctld_host": "10.0.0.1"},
+        )
+        self.manager["write_slurm_conf"].assert_called_once_with(SLURM_CONF)
+
+        self.harness.update_config({"configless": True})
+        self.manager["set_conf_server"].assert_called_once_with("10.0.0.1:6817")
+        self.manager["stop_munge"].assert_called_once()
+        self.assertEqual(
+            self.harness.get_relation_data(self.relation_id, "slurmrestd/0")["configless"], "true"
+        )
+
+        self.harness.update_config({"configless": False})
+        self.manager["set_conf_server"].assert_called_with(None)
+        self.manager["update_slurm_conf"].assert_called_once_with(SLURM_CONF, Action.RESTART)
+
+    def test_ingress_address_fallback(self):
+        self.harness.update_config({"configless": True})
+        self.harness.update_relation_data(
+            self.relation_id, "slurmctld/0", {"ingress-address": "10.0.0.2"}
+        )
+        self.harness.update_relation_data(self.relation_id, "slurmctld", {"munge_key": MUNGE_KEY})
+        self.manager["set_conf_server"].assert_called_once_with("10.0.0.2:6817")
+        self.manager["write_slurm_conf"].assert_not_called()
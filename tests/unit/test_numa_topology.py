@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Test reading NUMA topology from sysfs and placing daemons on a node."""
+
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Dict, Tuple
+from unittest.mock import patch
+
+from charm import SlurmrestdCharm
+from numa_topology import NumaNode, choose_node, format_cpulist, parse_cpulist, read_topology
+from ops import BlockedStatus
+from ops.testing import Harness
+from slurmrestd_ops import SlurmrestdManager, SlurmrestdManagerError
+
+# Dual socket host with SMT: node id -> (cpulist, MemTotal kB, MemFree kB).
+DUAL_SOCKET = {
+    0: ("0-15,32-47", 131_072_000, 20_000_000),
+    1: ("16-31,48-63", 131_072_000, 90_000_000),
+}
+
+
+def _sysfs(root: Path, nodes: Dict[int, Tuple[str, int, int]]) -> Path:
+    """Write a /sys/devices/system/node tree for `nodes` under `root`."""
+    node_dir = root / "sys" / "devices" / "system" / "node"
+    node_dir.mkdir(parents=True)
+    (node_dir / "online").write_text(f"0-{len(nodes) - 1}\n")
+    (node_dir / "possible").write_text(f"0-{len(nodes) - 1}\n")
+    for node, (cpulist, total, free) in nodes.items():
+        path = node_dir / f"node{node}"
+        path.mkdir()
+        (path / "cpulist").write_text(f"{cpulist}\n")
+        (path / "meminfo").write_text(
+            f"Node {node} MemTotal:       {total} kB\n"
+            f"Node {node} MemFree:        {free} kB\n"
+            f"Node {node} MemUsed:        {total - free} kB\n"
+            f"Node {node} HugePages_Total:     0\n"
+        )
+    return node_dir
+
+
+class TestNumaTopology(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+
+    def test_cpulist(self):
+        self.assertEqual(parse_cpulist("0-3,8\n"), (0, 1, 2, 3, 8))
+        self.assertEqual(parse_cpulist("\n"), ())
+        self.assertEqual(format_cpulist((8, 0, 1, 2, 3, 10)), "0-3,8,10")
+        self.assertEqual(format_cpulist(parse_cpulist("16-31,48-63")), "16-31,48-63")
+
+    def test_read_dual_socket(self):
+        nodes = read_topology(_sysfs(self.root, DUAL_SOCKET))
+        self.assertEqual([node.id for node in nodes], [0, 1])
+        self.assertEqual(len(nodes[1].cpus), 32)
+        self.assertEqual(nodes[1].cpus[:2], (16, 17))
+        self.assertEqual(nodes[1].mem_free_kb, 90_000_000)
+
+    def test_read_memory_only_node(self):
+        # CXL or HBM memory shows up as a node without CPUs.
+        nodes = read_topology(_sysfs(self.root, {**DUAL_SOCKET, 2: ("", 65_536_000, 65_000_000)}))
+        self.assertEqual(nodes[2].cpus, ())
+        self.assertEqual(choose_node(nodes, "auto").id, 1)
+        with self.assertRaisesRegex(ValueError, "no NUMA node 2 with CPUs"):
+            choose_node(nodes, "2")
+
+    def test_read_missing(self):
+        self.assertEqual(read_topology(self.root / "missing"), [])
+
+    def test_choose_node(self):
+        nodes = read_topology(_sysfs(self.root, DUAL_SOCKET))
+        self.assertEqual(choose_node(nodes, "auto").id, 1)
+        self.assertEqual(choose_node(nodes, "0").id, 0)
+        self.assertIsNone(choose_node(nodes[:1], "auto"))
+        self.assertEqual(choose_node(nodes[:1], "0").id, 0)
+        for preference in ("3", "first"):
+            with self.assertRaises(ValueError):
+                choose_node(nodes, preference)
+
+    def test_choose_node_tie(self):
+        nodes = [NumaNode(1, (1,), 10, 5), NumaNode(0, (0,), 10, 5)]
+        self.assertEqual(choose_node(nodes, "auto").id, 0)
+
+
+class TestNumaPlacement(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        patch("slurmrestd_ops.NUMA_NODE_DIR", _sysfs(self.root, DUAL_SOCKET)).start()
+        patch("slurmrestd_ops.SYSTEMD_DROPIN_DIR", self.root / "systemd").start()
+        patch("slurmrestd_ops.systemd").start()
+        self.addCleanup(patch.stopall)
+
+    def test_numa_placement(self):
+        manager = SlurmrestdManager()
+        self.assertEqual(
+            manager.numa_placement("auto"),
+            {"CPUAffinity": "16-31,48-63", "NUMAPolicy": "bind", "NUMAMask": "1"},
+        )
+        with self.assertRaisesRegex(SlurmrestdManagerError, "no NUMA node 4"):
+            manager.numa_placement("4")
+
+    def _harness(self) -> Harness:
+        harness = Harness(SlurmrestdCharm)
+        self.addCleanup(harness.cleanup)
+        harness.begin()
+        harness.charm._stored.slurm_installed = True
+        harness.add_relation("slurmctld", "slurmctld")
+        for method in ("write_exporter_service", "restart_exporter"):
+            patch(f"slurmrestd_ops.SlurmrestdManager.{method}").start()
+        return harness
+
+    def _dropin(self, service: str) -> str:
+        return (self.root / "systemd" / f"{service}.service.d" / "50-charm.conf").read_text()
+
+    def test_munge_and_slurmrestd_share_node(self):
+        harness = self._harness()
+        harness.update_config({"numa-node": "0", "cpu-affinity": "2-5"})
+        munge = self._dropin("munge")
+        slurmrestd = self._dropin("slurmrestd")
+        self.assertIn("CPUAffinity=0-15,32-47\n", munge)
+        self.assertIn("NUMAMask=0\n", munge)
+        self.assertIn("CPUAffinity=2-5\n", slurmrestd)
+        self.assertIn("NUMAMask=0\n", slurmrestd)
+        self.assertIn("NUMAPolicy=bind\n", slurmrestd)
+
+    def test_cpu_affinity_within_node(self):
+        harness = self._harness()
+        harness.update_config({"numa-node": "0", "cpu-affinity": "12-20"})
+        self.assertIn("CPUAffinity=12-15\n", self._dropin("slurmrestd"))
+
+        harness.update_config({"cpu-affinity": "16-20"})
+        self.assertIn("CPUAffinity=12-15\n", self._dropin("slurmrestd"))
+        harness.charm.on.update_status.emit()
+        self.assertEqual(
+            harness.charm.unit.status,
+            BlockedStatus("Invalid unit settings: cpu-affinity 16-20 has no CPUs on NUMA node 0"),
+        )
+
+    def test_auto_node_kept(self):
+        harness = self._harness()
+        harness.update_config({"numa-node": "auto"})
+        self.assertIn("NUMAMask=1\n", self._dropin("slurmrestd"))
+
+        # Free memory shifting to node 0 does not move the daemons.
+        patch(
+            "slurmrestd_ops.NUMA_NODE_DIR",
+            _sysfs(
+                self.root / "later", {0: DUAL_SOCKET[0][:2] + (99_000_000,), 1: DUAL_SOCKET[1]}
+            ),
+        ).start()
+        harness.update_config({"cpu-weight": 50})
+        self.assertIn("NUMAMask=1\n", self._dropin("slurmrestd"))
+
+        harness.update_config({"numa-node": ""})
+        harness.update_config({"numa-node": "auto"})
+        self.assertIn("NUMAMask=0\n", self._dropin("slurmrestd"))
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Test sharing downloaded packages with peer units."""
+
+import unittest
+from hashlib import sha256
+from pathlib import Path
+from subprocess import CalledProcessError, CompletedProcess
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from charm import SlurmrestdCharm
+from ops import WaitingStatus
+from ops.testing import Harness
+from slurmrestd_ops import SlurmrestdManager, _deb_version, _extract_debs
+
+APT_CACHE_DEPENDS = """\
+slurmrestd
+  Depends: libc6
+  Depends: libslurm39
+munge
+  Depends: libmunge2
+  Depends: <libc6-dev>
+libslurm39
+  Depends: libc6
+libmunge2
+libc6
+"""
+DPKG_QUERY = """\
+slurmrestd 23.02.7-1 optional
+munge 0.5.15-1 optional
+slurm-wlm-basic-plugins 23.02.7-1 optional
+libslurm39 23.02.7-1 optional
+libmunge2 0.5.15-1 optional
+libc6 2.35-0ubuntu3 required
+"""
+
+
+class TestPackageCacheManager(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        self.downloads = self.root / "downloads"
+        self.cache = self.root / "cache"
+        patch("slurmrestd_ops.PACKAGE_CACHE_DOWNLOAD_DIR", self.downloads).start()
+        patch("slurmrestd_ops.PACKAGE_CACHE_DIR", self.cache).start()
+        self.archives = self.root / "archives"
+        self.archives.mkdir()
+        patch("slurmrestd_ops.APT_ARCHIVES_DIR", self.archives).start()
+        self.run = patch("slurmrestd_ops.subprocess.run", side_effect=self._run).start()
+        self.addCleanup(patch.stopall)
+        self.manager = SlurmrestdManager()
+        self.online = True
+
+    def _run(self, cmd, **_):
+        if cmd[0] == "apt-cache":
+            return CompletedProcess(cmd, 0, APT_CACHE_DEPENDS, "")
+        if cmd[0] == "dpkg-query":
+            return CompletedProcess(cmd, 0, DPKG_QUERY, "")
+        if not self.online:
+            raise CalledProcessError(100, cmd, stderr="E: Version '23.02.7-1' not found")
+        for spec in cmd[cmd.index("--no-install-recommends") + 3 :]:
+            name, version = spec.split("=")
+            (self.downloads / f"{name}_{version}_amd64.deb").write_bytes(name.encode())
+        return CompletedProcess(cmd, 0, "", "")
+
+    def test_build_downloads_packages_and_dependencies(self):
+        checksum = self.manager.build_package_cache()
+        apt_get = self.run.call_args.args[0]
+        self.assertIn(f"Dir::Cache::archives={self.downloads}", apt_get)
+        self.assertEqual(
+            apt_get[-5:],
+            [
+                "libmunge2=0.5.15-1",
+                "libslurm39=23.02.7-1",
+                "munge=0.5.15-1",
+                "slurm-wlm-basic-plugins=23.02.7-1",
+                "slurmrestd=23.02.7-1",
+            ],
+        )
+        self.assertFalse(self.downloads.exists())
+
+        tarball = self.cache / "slurm-debs.tar.gz"
+        self.assertEqual(checksum, sha256(tarball.read_bytes()).hexdigest())
+        extracted = self.root / "extracted"
+        extracted.mkdir()
+        debs = _extract_debs(tarball, extracted)
+        self.assertEqual(len(debs), 5)
+
+    def _apt_gets(self):
+        return [c.args[0] for c in self.run.call_args_list if c.args[0][0] == "apt-get"]
+
+    def test_build_from_apt_archives(self):
+        for deb in ("slurmrestd_23.02.7-1_amd64.deb", "munge_0.5.15-1_amd64.deb"):
+            (self.archives / deb).write_bytes(b"archived")
+        # Another version of a package than the one installed is not shared.
+        (self.archives / "libmunge2_0.5.14-1_amd64.deb").write_bytes(b"old")
+
+        self.manager.build_package_cache()
+        (apt_get,) = self._apt_gets()
+        self.assertEqual(
+            apt_get[-3:],
+            ["libmunge2=0.5.15-1", "libslurm39=23.02.7-1", "slurm-wlm-basic-plugins=23.02.7-1"],
+        )
+        extracted = self.root / "extracted"
+        extracted.mkdir()
+        debs = _extract_debs(self.cache / "slurm-debs.tar.gz", extracted)
+        self.assertEqual(len(debs), 5)
+        self.assertEqual((extracted / "munge_0.5.15-1_amd64.deb").read_bytes(), b"archived")
+
+    def test_build_skipped_when_current(self):
+        checksum = self.manager.build_package_cache()
+        self.assertEqual(self.manager.build_package_cache(), checksum)
+        self.assertEqual(len(self._apt_gets()), 1)
+
+    def test_deb_version(self):
+        self.assertEqual(_deb_version("libfoo_1%3a2.0-1_amd64.deb"), ("libfoo", "1:2.0-1"))
+
+    def test_build_offline(self):
+        self.online = False
+        self.assertIsNone(self.manager.build_package_cache())
+
+    def test_build_and_fetch(self):
+        checksum = self.manager.build_package_cache()
+        tarball = self.cache / "slurm-debs.tar.gz"
+
+        served = self.root / "served.tar.gz"
+        served.write_bytes(tarball.read_bytes())
+        tarball.unlink()
+        self.assertIsNone(self.manager.fetch_package_cache(served.as_uri(), "0" * 64))
+        self.assertFalse(tarball.exists())
+        self.assertEqual(self.manager.fetch_package_cache(served.as_uri(), checksum), tarball)
+
+        # A unit installed from the cache, without the PPA, passes it on once it leads.
+        self.online = False
+        self.assertEqual(self.manager.build_package_cache(), checksum)
+
+    @patch("slurmrestd_ops.systemd")
+    def test_serve_binds_address(self, _systemd):
+        with patch("slurmrestd_ops.SYSTEMD_SYSTEM_DIR", self.root):
+            self.manager.serve_package_cache("10.0.0.10", 9821)
+        unit = (self.root / "slurmrestd-package-cache.service").read_text()
+        self.assertIn("http.server --bind 10.0.0.10 --directory", unit)
+
+    def test_fetch_unreachable(self):
+        self.assertIsNone(self.manager.fetch_package_cache("http://127.0.0.1:1/x", "0" * 64))
+
+
+class TestPackageCachePeers(unittest.TestCase):
+    def setUp(self) -> None:
+        self.harness = Harness(SlurmrestdCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.add_network("10.0.0.10")
+        self.relation_id = self.harness.add_relation("slurmrestd-peers", "slurmrestd")
+        for method in ("write_exporter_service", "restart_exporter"):
+            patch(f"slurmrestd_ops.SlurmrestdManager.{method}").start()
+        patch("slurmrestd_ops.SlurmrestdManager.version", return_value="23.02.7").start()
+        self.install = patch("slurmrestd_ops.SlurmrestdManager.install").start()
+        self.addCleanup(patch.stopall)
+
+    @patch("slurmrestd_ops.SlurmrestdManager.serve_package_cache")
+    @patch("slurmrestd_ops.SlurmrestdManager.build_package_cache", return_value="abc123")
+    def test_leader_publishes(self, _build, serve):
+        self.harness.set_leader(True)
+        self.harness.begin()
+        self.harness.charm.on.install.emit()
+
+        serve.assert_called_once_with("10.0.0.10", 9821)
+        self.assertEqual(
+            self.harness.get_relation_data(self.relation_id, "slurmrestd"),
+            {
+                "package_cache_url": "http://10.0.0.10:9821/slurm-debs.tar.gz",
+                "package_cache_sha256": "abc123",
+            },
+        )
+
+    @patch("slurmrestd_ops.SlurmrestdManager.fetch_package_cache")
+    def test_unit_installs_from_leader(self, fetch):
+        self.harness.update_relation_data(
+            self.relation_id,
+            "slurmrestd",
+            {
+                "package_cache_url": "http://10.0.0.10:9821/slurm-debs.tar.gz",
+                "package_cache_sha256": "abc123",
+            },
+        )
+        self.harness.begin()
+        self.harness.charm.on.install.emit()
+
+        fetch.assert_called_once_with("http://10.0.0.10:9821/slurm-debs.tar.gz", "abc123")
+        self.assertEqual(self.install.call_args.kwargs["debs"], fetch.return_value)
+
+    @patch("charm.time.time", return_value=1000.0)
+    @patch("slurmrestd_ops.SlurmrestdManager.is_installed", return_value=False)
+    @patch("slurmrestd_ops.SlurmrestdManager.fetch_package_cache")
+    def test_unit_waits_for_leader(self, fetch, _installed, now):
+        # Juju creates the peer relation only after the install hook.
+        harness = Harness(SlurmrestdCharm)
+        self.addCleanup(harness.cleanup)
+        harness.begin()
+        harness.charm.on.install.emit()
+        self.install.assert_not_called()
+        self.assertEqual(
+            harness.charm.unit.status, WaitingStatus("Waiting for the leader's package cache")
+        )
+
+        relation_id = harness.add_relation("slurmrestd-peers", "slurmrestd")
+        harness.update_relation_data(
+            relation_id,
+            "slurmrestd",
+            {
+                "package_cache_url": "http://10.0.0.10:9821/slurm-debs.tar.gz",
+                "package_cache_sha256": "abc123",
+            },
+        )
+        harness.framework.reemit()
+        fetch.assert_called_once_with("http://10.0.0.10:9821/slurm-debs.tar.gz", "abc123")
+        self.assertEqual(self.install.call_args.kwargs["debs"], fetch.return_value)
+
+    @patch("charm.time.time", return_value=1000.0)
+    @patch("slurmrestd_ops.SlurmrestdManager.is_installed", return_value=False)
+    def test_unit_falls_back_to_ppa(self, _installed, now):
+        self.harness.begin()
+        self.harness.charm.on.install.emit()
+        self.install.assert_not_called()
+
+        now.return_value = 1000.0 + 600
+        self.harness.framework.reemit()
+        self.assertIsNone(self.install.call_args.kwargs["debs"])
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Test peer-coordinated restarts of slurmrestd units."""
+
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from charm import SlurmrestdCharm
+from ops import WaitingStatus
+from ops.testing import Harness
+
+MUNGE_KEY = "bXVuZ2Uta2V5LWZvci10ZXN0aW5nLWludGVyZmFjZS0zMi1ieXRlcw=="
+SLURM_CONF = "ClusterName=test\nSlurmctldHost=slurmctld-0\n"
+
+
+class TestRestartLock(unittest.TestCase):
+    def setUp(self) -> None:
+        self.harness = Harness(SlurmrestdCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.peers = self.harness.add_relation("slurmrestd-peers", "slurmrestd")
+        for unit in ("slurmrestd/1", "slurmrestd/2"):
+            self.harness.add_relation_unit(self.peers, unit)
+        self.harness.set_leader(True)
+        # Leave the lock alone, the charm would give up turns it has no use for.
+        patch.object(SlurmrestdCharm, "_on_restart_granted", autospec=True).start()
+        self.addCleanup(patch.stopall)
+
+    def _request(self, unit: str, requested: bool = True) -> None:
+        self.harness.update_relation_data(
+            self.peers, unit, {"restart_requested": "true" if requested else ""}
+        )
+
+    def _granted(self) -> str:
+        return self.harness.get_relation_data(self.peers, "slurmrestd").get("restart_granted")
+
+    def test_one_unit_at_a_time(self):
+        self.harness.begin()
+        lock = self.harness.charm._restart_lock
+        self.assertTrue(lock.acquire())
+        self._request("slurmrestd/1")
+        self._request("slurmrestd/2")
+        self.assertEqual(self._granted(), "slurmrestd/0")
+
+        lock.release()
+        self.assertFalse(lock.held)
+        self.assertEqual(self._granted(), "slurmrestd/1")
+
+        # The next unit only gets its turn once slurmrestd/1 answered again.
+        self._request("slurmrestd/1", False)
+        self.assertEqual(self._granted(), "slurmrestd/2")
+        self._request("slurmrestd/2", False)
+        self.assertFalse(self._granted())
+
+    def test_batches(self):
+        self.harness.update_config({"restart-batch-size": 2})
+        self.harness.begin()
+        for unit in ("slurmrestd/1", "slurmrestd/2"):
+            self._request(unit)
+        self.assertEqual(self._granted(), "slurmrestd/1 slurmrestd/2")
+        self.assertFalse(self.harness.charm._restart_lock.acquire())
+
+        self._request("slurmrestd/2", False)
+        self.assertEqual(self._granted(), "slurmrestd/1 slurmrestd/0")
+
+        # A departed unit's turn is handed on.
+        self.harness.remove_relation_unit(self.peers, "slurmrestd/1")
+        self.assertEqual(self._granted(), "slurmrestd/0")
+
+    def test_alone(self):
+        self.harness.remove_relation_unit(self.peers, "slurmrestd/1")
+        self.harness.remove_relation_unit(self.peers, "slurmrestd/2")
+        self.harness.begin()
+        self.assertTrue(self.harness.charm._restart_lock.acquire())
+        self.assertIsNone(self._granted())
+
+
+class TestRollingRestart(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.harness = Harness(SlurmrestdCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.peers = self.harness.add_relation("slurmrestd-peers", "slurmrestd")
+        self.harness.add_relation_unit(self.peers, "slurmrestd/1")
+        self.harness.begin()
+        self.harness.framework.charm_dir = Path(tmp.name)
+        self.harness.charm._stored.slurm_installed = True
+        self.slurmctld = self.harness.add_relation("slurmctld", "slurmctld")
+        self.harness.add_relation_unit(self.slurmctld, "slurmctld/0")
+
+        self.manager = {}
+        for method in (
+            "stop_slurmrestd",
+            "start_slurmrestd",
+            "stop_munge",
+            "start_munge",
+            "write_munge_key",
+            "write_slurm_conf",
+            "wait_slurmrestd_ready",
+        ):
+            self.manager[method] = patch(f"slurmrestd_ops.SlurmrestdManager.{method}").start()
+        self.addCleanup(patch.stopall)
+
+    def _grant(self, units: str) -> None:
+        self.harness.update_relation_data(self.peers, "slurmrestd", {"restart_granted": units})
+
+    def _requested(self) -> bool:
+        return "restart_requested" in self.harness.get_relation_data(self.peers, "slurmrestd/0")
+
+    def test_waits_for_turn(self):
+        self.harness.update_relation_data(
+            self.slurmctld, "slurmctld", {"munge_key": MUNGE_KEY, "slurm_conf": SLURM_CONF}
+        )
+        self.manager["stop_slurmrestd"].assert_not_called()
+        self.assertTrue(self._requested())
+        self.assertEqual(
+            self.harness.charm.unit.status,
+            WaitingStatus("Waiting for peers to restart slurmrestd"),
+        )
+
+        self._grant("slurmrestd/1")
+        self.manager["stop_slurmrestd"].assert_not_called()
+
+        self._grant("slurmrestd/0")
+        self.manager["write_munge_key"].assert_called_once_with(MUNGE_KEY)
+        self.manager["write_slurm_conf"].assert_called_once_with(SLURM_CONF)
+        self.manager["start_slurmrestd"].assert_called_once()
+        self.manager["wait_slurmrestd_ready"].assert_called_once()
+        self.assertFalse(self._requested())
+
+    def test_holds_turn_until_ready(self):
+        self._grant("slurmrestd/0")
+        self.manager["wait_slurmrestd_ready"].return_value = False
+        self.harness.update_relation_data(
+            self.slurmctld, "slurmctld", {"munge_key": MUNGE_KEY, "slurm_conf": SLURM_CONF}
+        )
+        self.manager["start_slurmrestd"].assert_called_once()
+        self.assertTrue(self._requested())
+        self.assertEqual(
+            self.harness.charm.unit.status,
+            WaitingStatus("Waiting for slurmrestd to answer after restart"),
+        )
+
+        # update-status only probes once rather than waiting.
+        with patch("slurmrestd_ops.SlurmrestdManager.slurmrestd_responds") as responds:
+            responds.return_value = False
+            self.harness.charm.on.update_status.emit()
+            self.assertTrue(self._requested())
+
+            responds.return_value = True
+            self.harness.charm.on.update_status.emit()
+        self.assertFalse(self._requested())
+        self.assertEqual(responds.call_count, 2)
+        self.manager["wait_slurmrestd_ready"].assert_called_once()
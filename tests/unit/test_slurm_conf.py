@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Test slurm.conf parsing and change classification."""
+
+import logging
+import time
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from subprocess import CompletedProcess
+from unittest.mock import patch
+
+import slurm_conf
+from slurm_conf import Action
+from slurmrestd_ops import SlurmrestdManager, SlurmrestdManagerError
+
+BASE = """\
+# Generated by slurmctld
+ClusterName=test
+SlurmctldHost=slurmctld-0(10.0.0.1)
+AuthType=auth/munge
+SlurmdTimeout=300
+NodeName=compute-0 CPUs=64 \\
+    RealMemory=256000
+PartitionName=all Nodes=ALL Default=YES
+"""
+
+# Upper bound for parsing a 50k line slurm.conf, generous enough for slow CI.
+PARSE_BUDGET_S = 2.0
+
+
+def _classify(old: str, new: str) -> Action:
+    return slurm_conf.classify(slurm_conf.diff(slurm_conf.parse(old), slurm_conf.parse(new)))
+
+
+class TestSlurmConf(unittest.TestCase):
+    def test_parse(self):
+        conf = slurm_conf.parse(BASE)
+        self.assertEqual(conf.parameters["clustername"], "test")
+        self.assertEqual(conf.parameters["slurmdtimeout"], "300")
+        self.assertEqual(
+            conf.entities[("nodename", "compute-0")],
+            "nodename=compute-0 cpus=64 realmemory=256000",
+        )
+        self.assertIn(("partitionname", "all"), conf.entities)
+
+    def test_validate(self):
+        self.assertEqual(slurm_conf.validate(BASE), slurm_conf.parse(BASE))
+        slurm_conf.validate("NodeName=compute-1 CPUs=64\n", include=True)
+        for text, problem in (
+            ("ClusterName=test\n", "no SlurmctldHost"),
+            (BASE + "NodeName compute-1\n", "malformed line"),
+            (BASE + "NodeName= CPUs=64\n", "empty nodename"),
+        ):
+            with self.assertRaisesRegex(ValueError, problem):
+                slurm_conf.validate(text)
+
+    def test_auth_change_restarts(self):
+        self.assertEqual(_classify(BASE, BASE.replace("auth/munge", "auth/slurm")), Action.RESTART)
+        self.assertEqual(_classify(BASE, BASE + "SelectType=select/cons_tres\n"), Action.RESTART)
+
+    def test_node_change_reloads(self):
+        self.assertEqual(_classify(BASE, BASE + "NodeName=compute-1 CPUs=64\n"), Action.RELOAD)
+        self.assertEqual(_classify(BASE, BASE.replace("CPUs=64", "CPUs=128")), Action.RELOAD)
+
+    def test_irrelevant_change_is_noop(self):
+        self.assertEqual(_classify(BASE, BASE.replace("=300", "=600")), Action.NOOP)
+        self.assertEqual(_classify(BASE, "# Regenerated\n" + BASE), Action.NOOP)
+        self.assertEqual(_classify(BASE, BASE.replace("CPUs=64 ", "CPUs=64   ")), Action.NOOP)
+
+    def test_parse_large_file(self):
+        lines = [f"NodeName=compute-{i} CPUs=64 RealMemory=256000" for i in range(50_000)]
+        text = BASE + "\n".join(lines)
+        slurm_conf._parse_line.cache_clear()
+
+        start = time.perf_counter()
+        conf = slurm_conf.parse(text)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        slurm_conf.parse(text.replace("compute-49999 CPUs=64", "compute-49999 CPUs=128"))
+        warm = time.perf_counter() - start
+        logging.info(
+            f"parsed 50k line slurm.conf: cold {cold * 1e3:.1f}ms, warm {warm * 1e3:.1f}ms"
+        )
+
+        self.assertEqual(len(conf.entities), 50_001)
+        self.assertLess(cold, PARSE_BUDGET_S)
+        self.assertLess(warm, cold)
+
+
+class TestUpdateSlurmConf(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "slurm.conf"
+        patch("slurmrestd_ops.SLURM_CONF_PATH", self.path).start()
+        patch("slurmrestd_ops.os.chown").start()
+        self.systemd = patch("slurmrestd_ops.systemd").start()
+        self.addCleanup(patch.stopall)
+        self.manager = SlurmrestdManager()
+
+    def _update(self, text: str) -> bool:
+        action = self.manager.slurm_conf_action(slurm_conf.parse(text))
+        return self.manager.update_slurm_conf(text, action)
+
+    def test_first_write_restarts(self):
+        self.assertTrue(self._update(BASE))
+        self.assertEqual(self.path.read_text(), BASE)
+        self.systemd.service_restart.assert_called_once_with("slurmrestd")
+
+    def test_node_change_reloads(self):
+        self.path.write_text(BASE)
+        self.assertTrue(self._update(BASE + "NodeName=compute-1\n"))
+        self.systemd.service_reload.assert_called_once_with("slurmrestd")
+        self.systemd.service_restart.assert_not_called()
+
+    def test_noop_change_writes_without_restart(self):
+        self.path.write_text(BASE)
+        new = BASE.replace("=300", "=600")
+        self.assertFalse(self._update(new))
+        self.assertEqual(self.path.read_text(), new)
+        self.systemd.service_reload.assert_not_called()
+        self.systemd.service_restart.assert_not_called()
+
+
+class TestValidateConfig(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.conf_dir = Path(tmp.name)
+        (self.conf_dir / "nodes.conf").write_text("NodeName=compute-0\n")
+        patch("slurmrestd_ops.SLURM_CONF_DIR", self.conf_dir).start()
+        self.chown = patch("slurmrestd_ops.os.chown").start()
+        self.run = patch("slurmrestd_ops.subprocess.run").start()
+        self.addCleanup(patch.stopall)
+        self.manager = SlurmrestdManager()
+
+    def test_munge_key(self):
+        self.manager.validate_config(munge_key="a" * 44)
+        for munge_key, problem in (("a2V5", "3 bytes"), ("not base64!", "not valid base64")):
+            with self.assertRaisesRegex(SlurmrestdManagerError, problem):
+                self.manager.validate_config(munge_key=munge_key)
+
+    def test_slurm_conf(self):
+        conf = self.manager.validate_config(
+            slurm_conf=BASE, includes={"nodes": "NodeName=compute-1\n"}
+        )
+        self.assertEqual(conf, slurm_conf.parse(BASE))
+        self.assertIsNone(self.manager.validate_config(munge_key="a" * 44))
+        with self.assertRaisesRegex(SlurmrestdManagerError, "slurm.conf is invalid"):
+            self.manager.validate_config(slurm_conf="ClusterName=test\n")
+        with self.assertRaisesRegex(SlurmrestdManagerError, "slurm.conf is invalid"):
+            self.manager.validate_config(includes={"nodes": "compute-1\n"})
+        self.run.assert_not_called()
+
+    def test_dry_run(self):
+        def run(args, env, **kwargs):
+            conf = Path(env["SLURM_CONF"])
+            self.assertEqual(conf.read_text(), BASE)
+            self.assertEqual((conf.parent / "nodes.conf").read_text(), "NodeName=compute-0\n")
+            return CompletedProcess(args, 1, "", "error: Unable to process configuration file\n")
+
+        self.run.side_effect = run
+        with self.assertRaisesRegex(SlurmrestdManagerError, "Unable to process configuration"):
+            self.manager.validate_config(slurm_conf=BASE, dry_run=True)
+        self.assertEqual(self.run.call_args.args[0], ["slurmrestd", "-s", "list"])
+
+    def test_dry_run_as_slurmrestd(self):
+        candidate = BASE + f"Include {self.conf_dir}/nodes.conf\ninclude /opt/extra.conf\n"
+
+        def run(args, env, **kwargs):
+            conf = Path(env["SLURM_CONF"])
+            # The candidate reads the copies of /etc/slurm files it includes.
+            self.assertIn(f"Include {conf.parent}/nodes.conf\n", conf.read_text())
+            self.assertIn("include /opt/extra.conf\n", conf.read_text())
+            self.assertEqual((conf.parent / "nodes.conf").read_text(), "NodeName=compute-1\n")
+            self.assertEqual(kwargs["user"], "slurmrestd")
+            self.assertEqual(kwargs["group"], "slurmrestd")
+            self.chown.assert_any_call(conf.parent, 64031, 64031)
+            self.chown.assert_any_call(conf, 64031, 64031)
+            return CompletedProcess(args, 0, "rest_auth/local\n", "")
+
+        self.run.side_effect = run
+        conf = self.manager.validate_config(
+            slurm_conf=candidate, includes={"nodes": "NodeName=compute-1\n"}, dry_run=True
+        )
+        self.assertEqual(conf, slurm_conf.parse(candidate))
+        self.run.assert_called_once()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Test the slurmrestd benchmark load generator."""
+
+import socket
+import time
+import unittest
+from unittest.mock import call, patch
+
+from slurmrestd_benchmark import find_knee, parse_ramp, percentile, run, run_step
+from tests.fake_slurmrestd import FakeSlurmrestd
+
+
+class TestSlurmrestdBenchmark(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fake = FakeSlurmrestd(jobs=100, nodes=10)
+        self.url = self.fake.start()
+        self.addCleanup(self.fake.stop)
+
+    def test_run_step(self):
+        step = run_step(self.url, "/slurm/v0.0.39/ping", concurrency=2, duration=0.2)
+        self.assertGreater(step["requests"], 0)
+        self.assertEqual(step["error_rate"], 0.0)
+        self.assertLessEqual(step["p50_ms"], step["p99_ms"])
+
+    def test_ramp_against_fake_slurmrestd(self):
+        self.fake.latency = 0.005
+        result = run(self.url, "/slurm/v0.0.39/jobs", [1, 4], duration=0.2)
+        self.assertEqual([step["concurrency"] for step in result["steps"]], [1, 4])
+        self.assertGreater(result["steps"][1]["rps"], result["steps"][0]["rps"])
+        self.assertEqual(self.fake.requests, sum(s["requests"] for s in result["steps"]))
+
+    def test_run_step_counts_errors(self):
+        step = run_step(self.url, "/missing", concurrency=1, duration=0.1)
+        self.assertEqual(step["error_rate"], 1.0)
+
+    def test_run_step_backs_off_on_connection_errors(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        with patch("slurmrestd_benchmark.time.sleep", wraps=time.sleep) as sleep:
+            step = run_step(f"http://127.0.0.1:{port}", "/", concurrency=1, duration=0.2)
+        self.assertEqual(step["requests"], 0)
+        self.assertEqual(step["error_rate"], 1.0)
+        # 50ms, 100ms, ... between attempts rather than a tight reconnect loop.
+        self.assertEqual(sleep.call_args_list[:2], [call(0.05), call(0.1)])
+        self.assertLessEqual(sleep.call_count, 4)
+
+    def test_find_knee(self):
+        steps = [
+            {"concurrency": 1, "rps": 100.0, "p95_ms": 10.0},
+            {"concurrency": 2, "rps": 190.0, "p95_ms": 11.0},
+            {"concurrency": 4, "rps": 200.0, "p95_ms": 25.0},
+        ]
+        self.assertEqual(find_knee(steps), 2)
+        self.assertIsNone(find_knee(steps[:2]))
+
+    def test_percentile_and_ramp(self):
+        self.assertEqual(percentile([1.0, 2.0, 3.0, 4.0], 0.5), 2.0)
+        self.assertEqual(percentile([1.0, 2.0, 3.0, 4.0], 0.99), 4.0)
+        self.assertEqual(parse_ramp("1, 2,4"), [1, 2, 4])
+        self.assertRaises(ValueError, parse_ramp, "0,1")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Test the slurmrestd journal parser and metrics rendering."""
+
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from slurmrestd_exporter import JournalTailer, LogParser, RequestMetrics, normalize_endpoint
+
+
+class TestSlurmrestdExporter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.metrics = RequestMetrics()
+        self.parser = LogParser(self.metrics)
+
+    def test_normalize_endpoint(self):
+        self.assertEqual(
+            normalize_endpoint("/slurm/v0.0.39/job/1234?x=y"), "/slurm/{version}/job/{name}"
+        )
+        self.assertEqual(normalize_endpoint("/slurm/v0.0.39/jobs"), "/slurm/{version}/jobs")
+
+    def test_request_correlation(self):
+        self.parser.feed(
+            "debug:  operations_router: [[localhost]:4711] GET /slurm/v0.0.39/diag", 1.0
+        )
+        self.parser.feed(
+            "debug:  operations_router: [[localhost]:4712] GET /slurm/v0.0.39/jobs", 1.0
+        )
+        self.parser.feed("debug:  _send_reply: [[localhost]:4712] sending 500 response", 1.3)
+        self.parser.feed("debug:  _send_reply: [[localhost]:4711] sending 200 response", 1.02)
+
+        rendered = self.metrics.render()
+        self.assertIn(
+            'slurmrestd_requests_total{method="GET",endpoint="/slurm/{version}/diag",status="200"} 1',
+            rendered,
+        )
+        self.assertIn(
+            'slurmrestd_request_errors_total{method="GET",endpoint="/slurm/{version}/jobs"} 1',
+            rendered,
+        )
+        self.assertIn(
+            'slurmrestd_request_duration_seconds_bucket{method="GET",'
+            'endpoint="/slurm/{version}/diag",le="0.025"} 1',
+            rendered,
+        )
+
+    def test_closed_connection_is_forgotten(self):
+        self.parser.feed("operations_router: [fd:9] GET /slurm/v0.0.39/ping", 1.0)
+        self.parser.feed("_conmgr: [fd:9] closing connection", 1.1)
+        self.parser.feed("_send_reply: [fd:9] sending 200 response", 1.2)
+        self.assertEqual(self.metrics.requests, {})
+
+    def test_endpoint_cardinality_is_bounded(self):
+        metrics = RequestMetrics(max_endpoints=1)
+        metrics.observe("GET", "/a", "200", 0.1)
+        metrics.observe("GET", "/b", "200", 0.1)
+        self.assertIn(("GET", "other", "200"), metrics.requests)
+
+    def test_journal_cursor(self):
+        with TemporaryDirectory() as tmp:
+            tailer = JournalTailer("slurmrestd", Path(tmp) / "cursor")
+            self.assertIn("--lines=0", tailer.command())
+
+            (Path(tmp) / "cursor").write_text("s=abc;i=1")
+            self.assertIn("--after-cursor=s=abc;i=1", tailer.command())
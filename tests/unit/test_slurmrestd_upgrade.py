@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Test the blue/green slurmrestd upgrade."""
+
+import time
+import unittest
+from pathlib import Path
+from subprocess import CalledProcessError
+from tempfile import TemporaryDirectory
+from unittest.mock import Mock, call, patch
+
+from charm import SlurmrestdCharm
+from constants import SLURMRESTD_SERVICE
+from ops.testing import ActionFailed, Harness
+from slurmrestd_ops import SlurmrestdManager, SlurmrestdManagerError
+from slurmrestd_upgrade import GapProbe, UpgradeError, blue_green_upgrade, responds, wait_ready
+from tests.fake_slurmrestd import FakeSlurmrestd
+
+
+def _port(fake: FakeSlurmrestd) -> int:
+    return int(fake.url.rsplit(":", 1)[1])
+
+
+class TestProbing(unittest.TestCase):
+    def test_responds(self):
+        with FakeSlurmrestd() as fake:
+            port = _port(fake)
+            self.assertTrue(responds(port))
+            self.assertLess(wait_ready(port, timeout=1), 1)
+        self.assertFalse(responds(port))
+        with self.assertRaisesRegex(UpgradeError, "not ready"):
+            wait_ready(port, timeout=0.2)
+
+    def test_gap_probe(self):
+        fake = FakeSlurmrestd()
+        fake.start()
+        port = _port(fake)
+        with GapProbe(port) as probe:
+            time.sleep(0.1)
+            fake.stop()
+            time.sleep(0.2)
+            fake.start(port=port)
+            time.sleep(0.1)
+        fake.stop()
+        self.assertGreaterEqual(probe.max_gap, 0.15)
+        self.assertGreater(probe.failures, 0)
+
+
+class TestBlueGreenUpgrade(unittest.TestCase):
+    def setUp(self) -> None:
+        self.calls = Mock()
+        for name in ("responds", "wait_ready", "redirect", "clear_redirect"):
+            self.calls.attach_mock(patch(f"slurmrestd_upgrade.{name}").start(), name)
+        self.calls.responds.return_value = True
+        self.calls.wait_ready.return_value = 0.5
+        patch("slurmrestd_upgrade.time.sleep").start()
+        probe = patch("slurmrestd_upgrade.GapProbe").start().return_value.__enter__.return_value
+        probe.max_gap, probe.failures = 0.0, 0
+        self.addCleanup(patch.stopall)
+        self.manager = self.calls.manager
+        self.manager.version.side_effect = ["23.02.6", "23.02.7"]
+
+    def test_upgrade(self):
+        result = blue_green_upgrade(self.manager, 30, Mock())
+        self.assertEqual(result["old_version"], "23.02.6")
+        self.assertEqual(result["new_version"], "23.02.7")
+        self.assertEqual(
+            [c for c in self.calls.mock_calls if c[0] != "manager.version"],
+            [
+                call.responds(6820, mark=0x6820),
+                call.clear_redirect(),
+                call.manager.upgrade_slurmrestd_packages(),
+                call.manager.start_slurmrestd_instance(6821),
+                call.wait_ready(6821, 30),
+                call.redirect(6820, 6821),
+                call.manager.restart_slurmrestd(),
+                call.wait_ready(6820, 30, mark=0x6820),
+                call.clear_redirect(),
+                call.manager.stop_slurmrestd_instance(6821),
+            ],
+        )
+
+    def test_failed_upgrade_falls_back(self):
+        self.calls.wait_ready.side_effect = [0.5, UpgradeError("not ready after 30s")]
+        with self.assertRaisesRegex(UpgradeError, "not ready"):
+            blue_green_upgrade(self.manager, 30, Mock())
+        self.assertEqual(self.calls.clear_redirect.call_count, 2)
+        self.manager.stop_slurmrestd_instance.assert_called_once_with(6821)
+
+    def test_nothing_to_upgrade(self):
+        self.manager.version.side_effect = ["23.02.7", "23.02.7"]
+        with self.assertRaisesRegex(UpgradeError, "23.02.7 is already the latest"):
+            blue_green_upgrade(self.manager, 30, Mock())
+        self.manager.start_slurmrestd_instance.assert_not_called()
+        self.manager.restart_slurmrestd.assert_not_called()
+
+    def test_not_serving(self):
+        self.calls.responds.return_value = False
+        with self.assertRaisesRegex(UpgradeError, "not serving"):
+            blue_green_upgrade(self.manager, 30, Mock())
+        self.manager.upgrade_slurmrestd_packages.assert_not_called()
+
+
+class TestUpgradePackages(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = Path(tmp.name)
+        (root / "slurmrestd.service").write_text(SLURMRESTD_SERVICE)
+        patch("slurmrestd_ops.SYSTEMD_SYSTEM_DIR", root).start()
+        patch("slurmrestd_ops.POLICY_RC_D_PATH", root / "policy-rc.d").start()
+        self.apt = patch("slurmrestd_ops.apt").start()
+        self.upgrade = patch(
+            "slurmrestd_ops.CharmedHPCPackageLifecycleManager.upgrade_to_latest",
+            return_value=True,
+        ).start()
+        self.addCleanup(patch.stopall)
+        self.manager = SlurmrestdManager()
+
+    def test_refreshes_index_first(self):
+        self.apt.attach_mock(self.upgrade, "upgrade_to_latest")
+        self.manager.upgrade_slurmrestd_packages()
+        self.assertEqual(
+            self.apt.mock_calls,
+            [call.update(), call.upgrade_to_latest(), call.upgrade_to_latest()],
+        )
+
+    def test_errors_raise(self):
+        self.upgrade.side_effect = [True, False]
+        with self.assertRaisesRegex(SlurmrestdManagerError, "slurm-wlm-basic-plugins"):
+            self.manager.upgrade_slurmrestd_packages()
+
+        self.apt.update.side_effect = CalledProcessError(100, "apt-get", stderr=b"E: offline")
+        with self.assertRaisesRegex(SlurmrestdManagerError, "apt-get update failed: E: offline"):
+            self.manager.upgrade_slurmrestd_packages()
+        self.assertEqual(self.upgrade.call_count, 2)
+
+
+class TestUpgradeAction(unittest.TestCase):
+    def setUp(self) -> None:
+        self.harness = Harness(SlurmrestdCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        patch("slurmrestd_ops.SlurmrestdManager.version", return_value="23.02.7").start()
+        self.addCleanup(patch.stopall)
+
+    @patch("slurmrestd_upgrade.blue_green_upgrade")
+    def test_upgrade_action(self, upgrade):
+        self.harness.charm._stored.slurm_installed = True
+        upgrade.return_value = {
+            "old_version": "23.02.6",
+            "new_version": "23.02.7",
+            "alt_ready_s": 1.234,
+            "main_ready_s": 2.5,
+            "cutover_gap_ms": 0.0,
+            "probe_failures": 0,
+        }
+        results = self.harness.run_action("upgrade", {"ready-timeout": 10}).results
+        self.assertEqual(upgrade.call_args.args[1], 10.0)
+        self.assertEqual(results["new-version"], "23.02.7")
+        self.assertEqual(results["cutover-gap-ms"], "0.0")
+        self.assertEqual(results["alt-ready-s"], "1.23")
+        self.assertEqual(self.harness.get_workload_version(), "23.02.7")
+
+    @patch("slurmrestd_upgrade.blue_green_upgrade")
+    def test_upgrade_action_fails(self, upgrade):
+        with self.assertRaises(ActionFailed):
+            self.harness.run_action("upgrade")
+        upgrade.assert_not_called()
+
+        self.harness.charm._stored.slurm_installed = True
+        upgrade.side_effect = UpgradeError("nft is needed to switch slurmrestd listeners")
+        with self.assertRaisesRegex(ActionFailed, "nft is needed"):
+            self.harness.run_action("upgrade")
+
+        upgrade.side_effect = SlurmrestdManagerError("could not upgrade slurmrestd")
+        with self.assertRaisesRegex(ActionFailed, "Upgrade failed: could not upgrade slurmrestd"):
+            self.harness.run_action("upgrade")
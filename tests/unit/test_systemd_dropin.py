@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Test the slurmrestd.service drop-in rendered from charm config."""
+
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+import systemd_dropin
+from charm import SlurmrestdCharm
+from ops import BlockedStatus
+from ops.testing import Harness
+from slurmrestd_ops import SlurmrestdManager, SlurmrestdManagerError
+
+
+class TestSystemdDropin(unittest.TestCase):
+    def test_render(self):
+        self.assertEqual(systemd_dropin.render({}), "")
+        self.assertEqual(
+            systemd_dropin.render({"MemoryMax": "4G", "CPUWeight": "200"}, header="Managed."),
+            "# Managed.\n[Service]\nCPUWeight=200\nMemoryMax=4G\n",
+        )
+
+    def test_parse_round_trip(self):
+        settings = {"CPUAffinity": "0-3 8", "LimitNOFILE": "65536", "Nice": "-5"}
+        self.assertEqual(systemd_dropin.parse(systemd_dropin.render(settings, "x")), settings)
+
+    def test_validate(self):
+        systemd_dropin.validate(
+            {
+                "CPUAffinity": "0-3,8",
+                "CPUWeight": "idle",
+                "MemoryHigh": "80%",
+                "MemoryMax": "infinity",
+                "LimitNOFILE": "1024:65536",
+                "TasksMax": "15%",
+                "Nice": "-20",
+            }
+        )
+        for settings, problem in (
+            ({"CPUQuota": "50%"}, "unsupported setting CPUQuota"),
+            ({"CPUAffinity": "all"}, "invalid CPUAffinity"),
+            ({"MemoryMax": "4 GB"}, "invalid MemoryMax"),
+            ({"CPUWeight": "0"}, "between 1 and 10000"),
+            ({"Nice": "20"}, "between -20 and 19"),
+        ):
+            with self.assertRaisesRegex(ValueError, problem):
+                systemd_dropin.validate(settings)
+
+    def test_needs_restart(self):
+        self.assertFalse(systemd_dropin.needs_restart({}, {"MemoryMax": "4G", "CPUWeight": "50"}))
+        self.assertTrue(systemd_dropin.needs_restart({}, {"LimitNOFILE": "65536"}))
+        self.assertTrue(systemd_dropin.needs_restart({"Nice": "5"}, {}))
+
+
+class TestWriteServiceDropin(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "slurmrestd.service.d" / "50-charm.conf"
+        patch("slurmrestd_ops.SYSTEMD_DROPIN_DIR", Path(tmp.name)).start()
+        self.systemd = patch("slurmrestd_ops.systemd").start()
+        self.addCleanup(patch.stopall)
+        self.manager = SlurmrestdManager()
+
+    def test_rewrites_only_on_change(self):
+        self.assertFalse(self.manager.write_service_dropin("slurmrestd", {}))
+        self.assertFalse(self.path.exists())
+        self.systemd.daemon_reload.assert_not_called()
+
+        self.assertFalse(self.manager.write_service_dropin("slurmrestd", {"MemoryMax": "4G"}))
+        self.assertIn("MemoryMax=4G\n", self.path.read_text())
+        self.assertTrue(
+            self.manager.write_service_dropin("slurmrestd", {"MemoryMax": "4G", "Nice": "5"})
+        )
+        self.assertFalse(
+            self.manager.write_service_dropin("slurmrestd", {"MemoryMax": "4G", "Nice": "5"})
+        )
+        self.assertEqual(self.systemd.daemon_reload.call_count, 2)
+
+        self.assertTrue(self.manager.write_service_dropin("slurmrestd", {}))
+        self.assertFalse(self.path.exists())
+        self.assertEqual(self.systemd.daemon_reload.call_count, 3)
+
+    def test_invalid(self):
+        with self.assertRaisesRegex(SlurmrestdManagerError, "invalid MemoryMax"):
+            self.manager.write_service_dropin("slurmrestd", {"MemoryMax": "lots"})
+        self.assertFalse(self.path.exists())
+
+
+class TestResourceControlConfig(unittest.TestCase):
+    def setUp(self) -> None:
+        self.harness = Harness(SlurmrestdCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        self.harness.charm._stored.slurm_installed = True
+        for method in ("write_exporter_service", "restart_exporter"):
+            patch(f"slurmrestd_ops.SlurmrestdManager.{method}").start()
+        self.write = patch("slurmrestd_ops.SlurmrestdManager.write_service_dropin").start()
+        self.restart = patch("slurmrestd_ops.SlurmrestdManager.restart_slurmrestd").start()
+        self.restart_munge = patch("slurmrestd_ops.SlurmrestdManager.restart_munge").start()
+        patch("slurmrestd_ops.SlurmrestdManager.wait_slurmrestd_ready").start()
+        self.addCleanup(patch.stopall)
+
+    def test_config_to_settings(self):
+        self.write.return_value = False
+        self.harness.update_config({"cpu-weight": 50, "memory-max": "4G", "nice": 0})
+        self.write.assert_any_call("slurmrestd", {"CPUWeight": "50", "MemoryMax": "4G"})
+        self.write.assert_called_with("munge", {})
+        self.restart.assert_not_called()
+
+    def test_restart_when_running(self):
+        self.write.return_value = True
+        self.harness.update_config({"limit-nofile": 65536})
+        self.restart.assert_not_called()
+
+        self.harness.charm._stored.applied_munge_key = "digest"
+        self.harness.update_config({"limit-nofile": 131072})
+        self.restart.assert_called_once()
+        self.restart_munge.assert_called_once()
+        self.assertEqual(list(self.harness.charm._stored.pending_restarts), [])
+
+    def test_invalid_config_blocks(self):
+        self.write.side_effect = SlurmrestdManagerError("slurmrestd.service: invalid MemoryMax")
+        self.harness.add_relation("slurmctld", "slurmctld")
+        self.harness.update_config({"memory-max": "lots"})
+        self.harness.charm.on.update_status.emit()
+        self.assertEqual(
+            self.harness.charm.unit.status,
+            BlockedStatus("Invalid unit settings: slurmrestd.service: invalid MemoryMax"),
+        )
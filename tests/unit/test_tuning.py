@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# Copyright 2024 Omnivector, LLC.
+# See LICENSE file for licensing details.
+
+"""Test the high-concurrency host tuning profile."""
+
+import subprocess
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from charm import SlurmrestdCharm
+from constants import TUNING_PROFILES
+from ops import ActiveStatus, BlockedStatus
+from ops.testing import Harness
+from slurmrestd_ops import SlurmrestdManager
+
+SYSCTL = TUNING_PROFILES["high-concurrency"]["sysctl"]
+
+
+def _proc_sys(root: Path, values) -> Path:
+    """Write /proc/sys files for `values` under `root`."""
+    proc_sys = root / "proc" / "sys"
+    for key, value in values.items():
+        path = proc_sys / key.replace(".", "/")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"{value}\n")
+    return proc_sys
+
+
+class TestSysctl(unittest.TestCase):
+    def setUp(self) -> None:
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        self.path = self.root / "sysctl.d" / "60-slurmrestd.conf"
+        patch("slurmrestd_ops.SYSCTL_CONF_PATH", self.path).start()
+        self.run = patch("slurmrestd_ops.subprocess.run").start()
+        self.addCleanup(patch.stopall)
+        self.manager = SlurmrestdManager()
+
+    def test_write_only_on_change(self):
+        self.assertTrue(self.manager.write_sysctl(SYSCTL))
+        self.assertIn("net.core.somaxconn = 65535\n", self.path.read_text())
+        self.assertIn("net.ipv4.ip_local_port_range = 1024 65535\n", self.path.read_text())
+        self.assertEqual(self.run.call_args.args[0], ["sysctl", "--load", str(self.path)])
+
+        self.assertTrue(self.manager.write_sysctl(SYSCTL))
+        self.assertEqual(self.run.call_count, 1)
+
+        self.assertTrue(self.manager.write_sysctl({}))
+        self.assertFalse(self.path.exists())
+        self.assertEqual(self.run.call_count, 1)
+
+    def test_load_failure_retried(self):
+        self.run.side_effect = subprocess.CalledProcessError(
+            255, "sysctl", stderr="sysctl: permission denied on key 'net.core.somaxconn'"
+        )
+        self.assertFalse(self.manager.write_sysctl(SYSCTL))
+        self.assertFalse(self.path.exists())
+
+        self.run.side_effect = None
+        self.assertTrue(self.manager.write_sysctl(SYSCTL))
+        self.assertEqual(self.run.call_count, 2)
+
+    def test_drift(self):
+        proc_sys = _proc_sys(
+            self.root,
+            {
+                "net.core.somaxconn": "4096",
+                "net.ipv4.tcp_max_syn_backlog": "65535",
+                "net.ipv4.ip_local_port_range": "1024\t65535",
+            },
+        )
+        with patch("slurmrestd_ops.PROC_SYS_DIR", proc_sys):
+            self.assertEqual(self.manager.sysctl_drift(SYSCTL), {"net.core.somaxconn": "4096"})
+            self.assertEqual(
+                self.manager.sysctl_drift({"net.core.netdev_max_backlog": "5000"}),
+                {"net.core.netdev_max_backlog": "unknown"},
+            )
+
+
+class TestTuningProfile(unittest.TestCase):
+    def setUp(self) -> None:
+        self.harness = Harness(SlurmrestdCharm)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        self.harness.charm._stored.slurm_installed = True
+        self.harness.add_relation("slurmctld", "slurmctld")
+        for method in ("write_exporter_service", "restart_exporter"):
+            patch(f"slurmrestd_ops.SlurmrestdManager.{method}").start()
+        self.write = patch(
+            "slurmrestd_ops.SlurmrestdManager.write_service_dropin", return_value=False
+        ).start()
+        self.write_sysctl = patch("slurmrestd_ops.SlurmrestdManager.write_sysctl").start()
+        self.drift = patch(
+            "slurmrestd_ops.SlurmrestdManager.sysctl_drift", return_value={}
+        ).start()
+        self.addCleanup(patch.stopall)
+
+    def test_profile(self):
+        self.harness.update_config({"tuning-profile": "high-concurrency"})
+        self.write_sysctl.assert_called_with(
+            {**SYSCTL, "net.ipv4.ip_local_reserved_ports": "6817,6820-6821,9820-9821"}
+        )
+        self.write.assert_any_call("slurmrestd", {"LimitNOFILE": "1048576"})
+
+        # An explicit limit wins over the profile.
+        self.harness.update_config({"limit-nofile": 262144})
+        self.write.assert_any_call("slurmrestd", {"LimitNOFILE": "262144"})
+
+        self.harness.update_config({"tuning-profile": "", "limit-nofile": 0})
+        self.write_sysctl.assert_called_with({})
+        self.write.assert_any_call("slurmrestd", {})
+
+    def test_reserved_ports_follow_metrics_port(self):
+        self.harness.update_config({"tuning-profile": "high-concurrency", "metrics-port": 30000})
+        reserved = self.write_sysctl.call_args.args[0]["net.ipv4.ip_local_reserved_ports"]
+        self.assertEqual(reserved, "6817,6820-6821,9821,30000")
+
+    def test_drift_status(self):
+        self.harness.update_config({"tuning-profile": "high-concurrency"})
+        self.harness.charm.on.update_status.emit()
+        self.assertEqual(self.harness.charm.unit.status, ActiveStatus())
+
+        self.drift.return_value = {"net.core.somaxconn": "4096"}
+        self.harness.charm.on.update_status.emit()
+        self.drift.assert_called_with(
+            {**SYSCTL, "net.ipv4.ip_local_reserved_ports": "6817,6820-6821,9820-9821"}
+        )
+        self.assertEqual(
+            self.harness.charm.unit.status, ActiveStatus("sysctl drift: net.core.somaxconn=4096")
+        )
+
+    def test_unknown_profile(self):
+        self.harness.update_config({"tuning-profile": "fast"})
+        self.write_sysctl.assert_not_called()
+        self.harness.charm.on.update_status.emit()
+        self.assertEqual(
+            self.harness.charm.unit.status,
+            BlockedStatus("Invalid unit settings: unknown tuning profile 'fast'"),
+        )